@@ -0,0 +1,74 @@
+# Latency of typo-tolerant completion (Trie.fuzzy) against exact prefix completion.
+# Run from the repository root: python benchmarks/bench_fuzzy.py [--words N]
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_trie import build, stdlib_vocabulary, synthetic_vocabulary
+from trie import Trie, max_edits
+
+# Time one keystroke may spend on completion, in milliseconds
+BUDGET_MS = 16
+
+def typo(word, rng):
+    # One random insertion, deletion, substitution or swap
+    if len(word) < 2:
+        return word
+    i = rng.randrange(len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i:]
+    if kind == 1:
+        return word[:i] + word[i + 1:]
+    if kind == 2:
+        return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+def latency(lookup, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        lookup(query)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)], samples[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure fuzzy autocomplete latency")
+    parser.add_argument("--words", type=int, default=100000, help="vocabulary size")
+    parser.add_argument("--source", choices=("stdlib", "synthetic"), default="synthetic")
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    if args.source == "stdlib":
+        words = stdlib_vocabulary(args.words)
+    else:
+        words = synthetic_vocabulary(args.words, rng)
+    trie = build(Trie, words, 1)
+    print(f"{len(words)} words ({args.source}), budget {BUDGET_MS} ms per keystroke")
+    print(f"{'lookup':<10}{'prefix':>8}{'edits':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+
+    failed = False
+    for length in (3, 5, 8, 12):
+        # Prefixes of real words with one typo, as typed while the word is unfinished
+        queries = [typo(word[:length], rng) for word in rng.choices([w for w in words if len(w) >= length], k=args.lookups)]
+        rows = (
+            ("exact", lambda query: trie.autocomplete(query, 5)),
+            ("fuzzy", lambda query: trie.fuzzy(query, k=5)),
+        )
+        for name, lookup in rows:
+            p50, p95, worst = latency(lookup, queries)
+            print(f"{name:<10}{length:>8}{max_edits('x' * length):>7}{p50 * 1e3:>10.3f}{p95 * 1e3:>10.3f}{worst * 1e3:>10.3f}")
+            failed = failed or p95 * 1e3 > BUDGET_MS
+    if failed:
+        print(f"p95 over the {BUDGET_MS} ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# End-to-end keystroke latency of either editor: replays keystroke traces into the real
+# app with event_generate under a virtual X server and times every event from the moment
+# it is generated until Tk is idle again, and every handler it ran on the way.
+# A trace whose keys did not type what they should have, e.g. a key that reached the
+# editor without its character, stops the run instead of timing no-ops.
+# Needs Xvfb unless --display is given. Run from the repository root:
+#   python benchmarks/bench_latency.py [--app testnumber2|testi] [--file big.py] [--output latency.json]
+#   python benchmarks/bench_latency.py --trace my_trace.json      replay a recorded trace
+#   python benchmarks/bench_latency.py --record my_trace.json     record one by using the editor
+#   python benchmarks/bench_latency.py --save-traces traces/      write the built-in traces
+# A trace is {"name": ..., "events": [{"keysym", "modifiers", "gap_ms", "clipboard"}]},
+# gap_ms is the pause before the key and clipboard what a paste should find there.
+import argparse
+import importlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tkinter as tk
+from tkinter import messagebox
+
+import journal
+import vocabstore
+
+# Methods timed in each variant, as (class, method) pairs; names missing in a variant are skipped
+HANDLERS = {
+    "testnumber2": [("NotesApp", name) for name in (
+        "on_key", "add_to_trie", "select_suggestion", "navigate_suggestions", "paste", "undo", "redo",
+        "sync_cursor", "get_cursor_index", "show_change", "update_suggestions", "highlight_syntax",
+        "highlight_visible", "refresh_search",
+    )],
+    "testi": [("NotesApp", name) for name in (
+        "on_key_release", "edit_text", "autocomplete", "show_suggestions", "navigate_suggestions",
+        "complete_autocomplete", "insert_autocomplete", "hide_suggestion_box", "schedule_highlight",
+        "prepare_highlight", "apply_highlight", "paste", "undo", "redo",
+    )] + [("LineNumbers", "redraw")],
+}
+# State bits of the modifiers a trace may use
+MODIFIERS = {"Shift": 0x1, "Control": 0x4, "Alt": 0x8}
+PERCENTILES = (50, 95, 99)
+# Seconds to wait for Xvfb to come up, and for a preloaded file to finish loading
+XVFB_TIMEOUT = 10
+LOAD_TIMEOUT = 600
+# Keysyms of the characters traces type that are not named after themselves
+KEYSYMS = {" ": "space", "\n": "Return", "\t": "Tab", "_": "underscore", "(": "parenleft", ")": "parenright", ".": "period", ":": "colon"}
+CHARS = {keysym: char for char, keysym in KEYSYMS.items()}
+# Bind tag put in front of the app's own, so key presses are seen before a handler breaks the chain
+CHECK_TAG = "LatencyCheck"
+
+WORDS = (
+    "return result value index while for import from class def self print none true "
+    "the buffer line offset count parent node total search replace window"
+).split()
+SNIPPET = "".join(f"def handler_{i}(event):\n    return event.keysym * {i}\n\n" for i in range(60))
+
+def key(keysym, gap_ms=0, modifiers=(), clipboard=None):
+    event = {"keysym": keysym, "gap_ms": gap_ms}
+    if modifiers:
+        event["modifiers"] = list(modifiers)
+    if clipboard is not None:
+        event["clipboard"] = clipboard
+    return event
+
+def type_text(text, rng, gap_ms=90):
+    # Keys typing text, with the uneven pauses of a person
+    return [key(KEYSYMS.get(char, char), rng.randint(gap_ms // 2, gap_ms * 3 // 2)) for char in text]
+
+def typed_char(event):
+    # The character a trace event types, None for a command key
+    if set(event.get("modifiers", ())) - {"Shift"}:
+        return None
+    keysym = event["keysym"]
+    if keysym in CHARS:
+        return CHARS[keysym]
+    return keysym if len(keysym) == 1 else None
+
+def typed_text(events, picked):
+    # What a trace types in front of the cursor it starts at, None if it uses keys whose
+    # effect depends on the editor, like undo or the events in picked, which chose a suggestion
+    typed = []
+    for i, event in enumerate(events):
+        char = typed_char(event)
+        if i in picked:
+            return None
+        if char is not None:
+            typed.append(char)
+        elif event["keysym"] == "BackSpace" and not event.get("modifiers"):
+            if typed:
+                typed.pop()
+        elif event.get("modifiers") == ["Control"] and event["keysym"].lower() == "v":
+            typed += event.get("clipboard", "")
+        else:
+            return None
+    return "".join(typed)
+
+def builtin_traces(seed=1):
+    rng = random.Random(seed)
+    sentence = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))
+    typing = []
+    for _ in range(12):
+        typing += type_text(sentence(6), rng)
+        # A typo noticed a few keys late
+        typing += [key("BackSpace", 150)] + [key("BackSpace", 70) for _ in range(2)] + type_text("ing\n", rng)
+    repeat = [key("x", 500 if i == 0 else 33) for i in range(80)] + [key("BackSpace", 33) for _ in range(80)]
+    paste = []
+    for _ in range(15):
+        paste += type_text("\n# pasted\n", rng) + [key("v", 200, ["Control"], SNIPPET)]
+    undo = type_text(" ".join(sentence(5) for _ in range(8)), rng, 60)
+    undo += [key("z", 40, ["Control"]) for _ in range(15)] + [key("y", 40, ["Control"]) for _ in range(10)]
+    navigate = type_text(sentence(20) + "\n", rng)
+    for prefix in ("re", "wh", "in", "se", "co", "bu", "va", "li") * 2:
+        navigate += type_text(prefix, rng) + [key("Down", 250), key("Down", 120), key("Up", 120), key("Return", 200)]
+        navigate += [key("space", 150)]
+    return [
+        {"name": "typing", "events": typing},
+        {"name": "key_repeat", "events": repeat},
+        {"name": "paste", "events": paste},
+        {"name": "undo_burst", "events": undo},
+        {"name": "autocomplete", "events": navigate},
+    ]
+
+def start_xvfb(screen="1280x1024x24"):
+    # A virtual X server on the first free display, DISPLAY is pointed at it
+    number = next(n for n in range(99, 199) if not os.path.exists(f"/tmp/.X{n}-lock"))
+    try:
+        process = subprocess.Popen(["Xvfb", f":{number}", "-screen", "0", screen, "-nolisten", "tcp"],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        sys.exit("Xvfb is not installed, install it or pass --display")
+    deadline = time.monotonic() + XVFB_TIMEOUT
+    while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            sys.exit("Xvfb did not start")
+        time.sleep(0.05)
+    os.environ["DISPLAY"] = f":{number}"
+    return process
+
+def instrument(module, handlers, samples):
+    # Wrap the handlers in the app module's classes so every call's time is added to
+    # samples[name]. Done before the app is made, bind() takes the methods as they are then.
+    for class_name, name in handlers:
+        cls = getattr(module, class_name, None)
+        method = getattr(cls, name, None)
+        if method is None:
+            continue
+        label = name if class_name == "NotesApp" else f"{class_name}.{name}"
+
+        def timed(*args, method=method, label=label, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                samples[label].append(time.perf_counter() - start)
+        setattr(cls, name, timed)
+
+def busy(app):
+    # Whether work started by the last event is still to come back to the Tk thread
+    scheduler = getattr(app, "scheduler", None)
+    return getattr(app, "loading", False) or (scheduler is not None and bool(scheduler.pending or scheduler.outstanding))
+
+def pump(app, seconds):
+    # Run the event loop for a while like mainloop() would, returns when it went quiet or None
+    start = time.perf_counter()
+    settled = None
+    while True:
+        app.update()
+        now = time.perf_counter()
+        if settled is None and not busy(app):
+            settled = now
+        if now - start >= seconds:
+            return settled
+        time.sleep(0.001)
+
+def preload(module, app, file_path):
+    # Open a file through the app's own Open command, with the dialog answered
+    module.filedialog.askopenfilename = lambda **options: file_path
+    app.open_file()
+    deadline = time.monotonic() + LOAD_TIMEOUT
+    while busy(app) and time.monotonic() < deadline:
+        pump(app, 0.05)
+
+def focus_widget(app):
+    return app.focus_get() or app.text_area
+
+def generate(app, event):
+    widget = focus_widget(app)
+    state = 0
+    for modifier in event.get("modifiers", ()):
+        state |= MODIFIERS[modifier]
+    if "clipboard" in event:
+        app.clipboard_clear()
+        app.clipboard_append(event["clipboard"])
+    widget.event_generate("<KeyPress>", keysym=event["keysym"], state=state)
+    widget.event_generate("<KeyRelease>", keysym=event["keysym"], state=state)
+
+def watch_keys(app, received):
+    # Note the keysym and character of every key press the editor gets
+    app.bind_class(CHECK_TAG, "<KeyPress>", lambda event: received.append((event.keysym, event.char)))
+    for widget in (app.text_area, app.suggestion_box):
+        widget.bindtags((CHECK_TAG,) + widget.bindtags())
+
+def replay(app, trace, samples, speed):
+    # Latency of every event of a trace. "event" is the time until Tk went idle,
+    # "settled" until the background work it started had come back as well. Returns the
+    # indices of the events that were a Return or Tab while suggestions were shown.
+    event_times = []
+    settled_times = []
+    picked = set()
+    pending = None  # start of the last event while its background work is still out
+    for i, event in enumerate(trace["events"]):
+        settled = pump(app, event.get("gap_ms", 0) / 1000 * speed)
+        if pending is not None and settled is not None:
+            settled_times.append(settled - pending)
+        if event["keysym"] in ("Return", "Tab") and app.suggestion_box.winfo_ismapped():
+            picked.add(i)
+        start = time.perf_counter()
+        generate(app, event)
+        app.update()
+        event_times.append(time.perf_counter() - start)
+        pending = start if busy(app) else None
+        if pending is None:
+            settled_times.append(event_times[-1])
+    settled = pump(app, 1.0)
+    if pending is not None and settled is not None:
+        settled_times.append(settled - pending)
+    samples["event"] = event_times
+    samples["settled"] = settled_times
+    return picked
+
+def check(app, trace, start_text, received, picked):
+    # What went wrong with typing the trace, timings of keys that typed nothing are worthless
+    problems = []
+    if len(received) != len(trace["events"]):
+        problems.append(f"{len(received)} of {len(trace['events'])} keys reached the editor")
+    dropped = set()
+    for keysym, char in received:
+        expected = typed_char({"keysym": keysym})
+        if expected and expected.isprintable() and char != expected:
+            dropped.add(keysym)
+    if dropped:
+        problems.append(f"keys without their character: {' '.join(sorted(dropped))}")
+    text = app.text_area.get("1.0", "end-1c")
+    core = getattr(app, "core", None)
+    if core is not None and core.buffer.get_text() != text:
+        problems.append("the buffer and the widget differ")
+    typed = typed_text(trace["events"], picked)
+    if typed is not None and text != typed + start_text:
+        problems.append("the text is not what the trace typed")
+    return problems
+
+def percentiles(values):
+    values = sorted(values)
+    return {f"p{p}_ms": round(values[min(len(values) - 1, len(values) * p // 100)] * 1e3, 3) for p in PERCENTILES}
+
+def run(args, traces):
+    module = importlib.import_module(args.app)
+    samples = defaultdict(list)
+    instrument(module, HANDLERS[args.app], samples)
+    # Answer dialogs such as "Nothing to undo" instead of waiting for a click
+    messagebox.showinfo = messagebox.showwarning = messagebox.showerror = lambda *a, **k: "ok"
+    messagebox.askyesno = messagebox.askyesnocancel = lambda *a, **k: False
+    # Keep the user's vocabulary, journals and file out of it: everything the editor
+    # writes goes to a scratch folder, and a copy of the file is opened from there
+    scratch = tempfile.mkdtemp()
+    journal.UNTITLED_JOURNAL = os.path.join(scratch, "untitled.journal")
+    journal.FALLBACK_FOLDER = os.path.join(scratch, "journals")
+    vocabstore.VOCAB_PATH = os.path.join(scratch, "vocabulary")
+    file_path = None
+    if args.file:
+        file_path = os.path.join(scratch, os.path.basename(args.file))
+        shutil.copyfile(args.file, file_path)
+
+    report = {"app": args.app, "file": args.file, "traces": {}}
+    try:
+        for trace in traces:
+            report["traces"][trace["name"]] = replay_checked(module, trace, file_path, samples, args.speed)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return report
+
+def replay_checked(module, trace, file_path, samples, speed):
+    # Replay a trace into a new app and print its timings, exits if the keys did not type
+    # what they should have
+    app = module.NotesApp()
+    app.geometry("1000x700+0+0")
+    pump(app, 0.2)
+    if file_path:
+        preload(module, app, file_path)
+    app.text_area.focus_force()
+    app.text_area.mark_set(tk.INSERT, "1.0")
+    pump(app, 0.2)
+    start_text = app.text_area.get("1.0", "end-1c")
+    received = []
+    watch_keys(app, received)
+    samples.clear()
+    picked = replay(app, trace, samples, speed)
+    problems = check(app, trace, start_text, received, picked)
+    core = getattr(app, "core", None)
+    if core is not None and core.journal:
+        core.journal.close()
+    app.destroy()
+    if problems:
+        sys.exit(f"{trace['name']}: " + ", ".join(problems))
+
+    results = {name: dict(calls=len(times), **percentiles(times)) for name, times in samples.items() if times}
+    print(f"\n{trace['name']} ({len(trace['events'])} keys)")
+    print(f"{'':<28}{'calls':>7}" + "".join(f"{f'p{p} ms':>11}" for p in PERCENTILES))
+    for name in ["event", "settled"] + sorted(set(results) - {"event", "settled"}):
+        if name in results:
+            row = results[name]
+            print(f"{name:<28}{row['calls']:>7}" + "".join(f"{row[f'p{p}_ms']:>11.2f}" for p in PERCENTILES))
+    return results
+
+def record(args):
+    # Use the editor normally, every key press is saved as a trace when the window closes
+    module = importlib.import_module(args.app)
+    app = module.NotesApp()
+    events = []
+    last = [time.perf_counter()]
+
+    def pressed(event):
+        now = time.perf_counter()
+        modifiers = [name for name, bit in MODIFIERS.items() if event.state & bit]
+        clipboard = None
+        if "Control" in modifiers and event.keysym.lower() == "v":
+            try:
+                clipboard = app.clipboard_get()
+            except tk.TclError:
+                pass
+        events.append(key(event.keysym, round((now - last[0]) * 1e3), modifiers, clipboard))
+        last[0] = now
+    app.bind_all("<KeyPress>", pressed, add="+")
+    app.mainloop()
+    name = os.path.splitext(os.path.basename(args.record))[0]
+    with open(args.record, "w") as f:
+        json.dump({"name": name, "events": events}, f, indent=1)
+    print(f"{len(events)} keys written to {args.record}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay keystroke traces into the editor and time them")
+    parser.add_argument("--app", choices=sorted(HANDLERS), default="testnumber2", help="editor variant")
+    parser.add_argument("--file", help="open this file before replaying")
+    parser.add_argument("--trace", action="append", help="trace file to replay, the built-in ones if not given")
+    parser.add_argument("--speed", type=float, default=1.0, help="scale the pauses between keys, 0 for none")
+    parser.add_argument("--display", help="use this X display instead of starting Xvfb")
+    parser.add_argument("--output", default="latency.json", help="where to write the results")
+    parser.add_argument("--record", metavar="TRACE", help="record a trace on the real display instead")
+    parser.add_argument("--save-traces", metavar="DIR", help="write the built-in traces and exit")
+    args = parser.parse_args()
+
+    if args.save_traces:
+        os.makedirs(args.save_traces, exist_ok=True)
+        for trace in builtin_traces():
+            with open(os.path.join(args.save_traces, trace["name"] + ".json"), "w") as f:
+                json.dump(trace, f, indent=1)
+        return
+    if args.record:
+        record(args)
+        return
+
+    traces = builtin_traces()
+    if args.trace:
+        traces = []
+        for path in args.trace:
+            with open(path) as f:
+                traces.append(json.load(f))
+    xvfb = None
+    if args.display:
+        os.environ["DISPLAY"] = args.display
+    else:
+        xvfb = start_xvfb()
+    try:
+        report = run(args, traces)
+    finally:
+        if xvfb:
+            xvfb.terminate()
+            xvfb.wait()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nresults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Time of replace-all and its undo on a large log-like buffer, everything NotesApp does
+# on the Tk thread besides patching the widget. Counting words runs on the worker.
+# Run from the repository root: python benchmarks/bench_replace.py [--lines N]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rope import Change, Rope
+from search import SearchIndex, replacement_changes
+from trie import Trie
+from undo import UndoStack
+from vocabulary import VocabularyTracker, word_delta
+
+# Time one replace-all of the default log may take, in milliseconds
+BUDGET_MS = 1000
+
+def log_text(lines, rng):
+    levels = ["INFO", "DEBUG", "WARNING", "ERROR"]
+    return "".join(
+        f"2024-01-{rng.randint(1, 28):02d} 12:{rng.randint(0, 59):02d}:00 {rng.choice(levels)} worker {rng.randint(1, 64)} handled request {i}\n"
+        for i in range(lines)
+    )
+
+def timed(label, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<20}{elapsed * 1e3:>10.1f}")
+    return result, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure replace-all on a large buffer")
+    parser.add_argument("--lines", type=int, default=200000, help="lines of log text")
+    parser.add_argument("--query", default="ERROR")
+    parser.add_argument("--replacement", default="FAILURE")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    buffer = Rope(log_text(args.lines, rng))
+    index = SearchIndex(args.query, case_sensitive=True)
+    index.search(buffer)
+    tracker = VocabularyTracker(Trie())
+    undo_stack = UndoStack()
+    print(f"{len(buffer) / 2**20:.1f} MB, {len(index)} matches of {args.query!r}, budget {BUDGET_MS} ms")
+    print(f"{'step':<20}{'ms':>10}")
+
+    total = 0
+    changes, elapsed = timed("changes", lambda: replacement_changes(buffer, index.starts, index.ends, args.replacement))
+    total += elapsed
+
+    def record():
+        with undo_stack.transaction():
+            for change in changes:
+                undo_stack.record(change)
+    _, elapsed = timed("undo record", record)
+    total += elapsed
+    change, elapsed = timed("buffer", lambda: buffer.apply_changes(changes))
+    total += elapsed
+    _, elapsed = timed("search update", lambda: index.changed(buffer, change))
+    total += elapsed
+    texts, elapsed = timed("vocabulary text", lambda: tracker.around(buffer, change))
+    total += elapsed
+    counts, _ = timed("(worker) count", lambda: word_delta(*texts))
+    _, elapsed = timed("vocabulary update", lambda: tracker.apply(counts))
+    total += elapsed
+    print(f"{'replace-all':<20}{total * 1e3:>10.1f}")
+
+    transaction = undo_stack.undo()
+    inverse = [Change(c.offset, c.inserted, c.removed) for c in reversed(transaction)]
+    _, undo_time = timed("undo buffer", lambda: buffer.apply_changes(inverse))
+    if max(total, undo_time) * 1e3 > BUDGET_MS:
+        print(f"over the {BUDGET_MS} ms budget")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
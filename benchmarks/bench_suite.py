@@ -0,0 +1,362 @@
+# Micro-benchmarks of the editor's hot paths on synthetic Python sources and prose from
+# 1 KB to 100 MB, typing at the start, middle and end of the document. Results are written
+# as JSON, and --check compares their medians against the thresholds of an earlier run.
+# Run from the repository root:
+#   python benchmarks/bench_suite.py [--sizes 1K,1M] [--filter rope] [--output results.json]
+#   python benchmarks/bench_suite.py --check benchmarks/thresholds.json
+#   python benchmarks/bench_suite.py --write-thresholds benchmarks/thresholds.json
+# The widget highlighters need a display and are skipped without one.
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tkinter as tk
+
+import journal
+import vocabstore
+from highlighter import IncrementalHighlighter, tag_ranges
+from radixtrie import RadixTrie
+from rope import Change, Rope
+from testnumber2 import DoublyLinkedList
+from trie import Trie
+from undo import UndoStack
+from vocabulary import HARVEST_LIMIT, WORD_RE
+
+SIZES = "1K,100K,1M,10M,100M"
+UNITS = {"K": 2**10, "M": 2**20, "G": 2**30}
+POSITIONS = ("start", "middle", "end")
+# Operations timed per benchmark, fewer for the ones that are slow on big documents
+REPEAT = 200
+SLOW_REPEAT = 5
+# Largest document some benchmarks run on: the linked list makes an object per character,
+# the whole-document highlighter and Tk take seconds per call beyond these
+DLL_LIMIT = 2**20
+DOCUMENT_LIMIT = 10 * 2**20
+WIDGET_LIMIT = 10 * 2**20
+# Text generated afresh before the rest of a document repeats it
+BLOCK = 2**20
+# Visible lines around the cursor, like a window of the editor
+VIEW_LINES = 60
+# Length of the misspelt prefixes fuzzy completion is timed with, long ones walk the most
+FUZZY_PREFIX = 12
+# --write-thresholds allows medians this many times slower than the ones measured
+HEADROOM = 3.0
+# and at least this many microseconds more, below it timer noise is all that changes
+NOISE_US = 5.0
+
+WORDS = (
+    "the of and to in is that it was for on are as with his they at be this from have or "
+    "by one had not but what all were when we there can an your which their said if do will "
+    "each about how up out them then she many some so these would other into has more her two "
+    "like him see time could no make than first been its who now people my made over did down "
+    "only way find use may water long little very after words called just where most know"
+).split()
+NAMES = ("value", "index", "buffer", "result", "count", "node", "parent", "offset", "line", "total")
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1:] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+def size_label(size):
+    for unit, factor in reversed(UNITS.items()):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+def python_block(size, rng):
+    # Functions and classes with comments, strings, docstrings and numbers
+    parts = []
+    length = 0
+    i = 0
+    while length < size:
+        name, arg = rng.choice(NAMES), rng.choice(NAMES)
+        part = (
+            f"class Item{i}:\n"
+            f'    """Holds the {rng.choice(WORDS)} {rng.choice(WORDS)} of item {i}."""\n'
+            f"    def {name}_{i}(self, {arg}, limit={rng.randint(0, 999)}):\n"
+            f"        # {' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))}\n"
+            f"        if {arg} is None or {arg} > limit:\n"
+            f"            return '{rng.choice(WORDS)}'\n"
+            f"        for {name} in range({rng.randint(1, 100)}):\n"
+            f"            {arg} = {arg} * {rng.random():.3f} + {name}\n"
+            f'        return f"{{{arg}}} {rng.choice(WORDS)}"\n'
+            "\n"
+        )
+        parts.append(part)
+        length += len(part)
+        i += 1
+    return "".join(parts)[:size]
+
+def prose_block(size, rng):
+    # Paragraphs of sentences wrapped at about 80 characters
+    lines = []
+    length = 0
+    while length < size:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 14))]
+        words[0] = words[0].capitalize()
+        line = " ".join(words) + rng.choice([".", ".", ",", "?"])
+        if rng.random() < 0.2:
+            line += "\n"
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)[:size]
+
+GENERATORS = {"python": python_block, "prose": prose_block}
+
+def document(kind, size, seed):
+    # size characters of text of a kind, a block of at most BLOCK repeated
+    block = GENERATORS[kind](min(size, BLOCK), random.Random(seed))
+    return (block * (size // len(block) + 1))[:size]
+
+def offset_at(position, size):
+    return {"start": 0, "middle": size // 2, "end": size}[position]
+
+def timed(function, args_list):
+    # Seconds taken by function(*args) for each args in turn
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        "ops": len(samples),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 3),
+        "p50_us": round(statistics.median(samples) * 1e6, 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6, 3),
+        "max_us": round(samples[-1] * 1e6, 3),
+    }
+
+# Benchmarks, each yields (name, position, samples or a reason it was skipped)
+
+def bench_dll(text, positions):
+    if len(text) > DLL_LIMIT:
+        for name in ("dll.insert", "dll.delete"):
+            for position in positions:
+                yield name, position, f"over {size_label(DLL_LIMIT)}"
+        yield "dll.get_text", None, f"over {size_label(DLL_LIMIT)}"
+        return
+    dll = DoublyLinkedList()
+    dll.insert_text(0, text)
+    for position in positions:
+        offset = offset_at(position, len(text))
+        yield "dll.insert", position, timed(dll.insert, [(offset + i, "x") for i in range(REPEAT)])
+        yield "dll.delete", position, timed(dll.delete, [(offset,)] * REPEAT)
+    yield "dll.get_text", None, timed(dll.get_text, [()] * SLOW_REPEAT)
+
+def bench_rope(text, positions):
+    # The buffer both editors type into, with get_cursor_index()'s conversion of a widget
+    # "line.col" to an offset and the reverse one done for every change
+    rope = Rope(text)
+    for position in positions:
+        offset = offset_at(position, len(text))
+        yield "rope.insert", position, timed(rope.splice, [(offset + i, 0, "x") for i in range(REPEAT)])
+        yield "rope.delete", position, timed(rope.splice, [(offset, 1, "")] * REPEAT)
+        line, col = rope.offset_to_linecol(offset)
+        yield "get_cursor_index", position, timed(rope.linecol_to_offset, [(line, col)] * REPEAT)
+        yield "offset_to_linecol", position, timed(rope.offset_to_linecol, [(offset,)] * REPEAT)
+    yield "rope.get_text", None, timed(rope.get_text, [()] * SLOW_REPEAT)
+
+def bench_trie(text, positions):
+    # The vocabulary of the harvested part of the document, then lookups of word prefixes,
+    # in both autocomplete backends
+    words = WORD_RE.findall(text[:HARVEST_LIMIT])
+    for name, cls in (("trie", Trie), ("radixtrie", RadixTrie)):
+        trie = cls()
+        yield f"{name}.insert", None, timed(trie.insert, [(word,) for word in words])
+        rng = random.Random(len(text))
+        prefixes = [word[:rng.randint(1, 3)] for word in rng.sample(words, min(REPEAT, len(words)))]
+        yield f"{name}.autocomplete", None, timed(trie.autocomplete, [(prefix,) for prefix in prefixes])
+        # Misspelt long prefixes, of snake_case names made of the document's words as code has
+        vocabulary = sorted(set(words))
+        names = ["_".join(rng.choices(vocabulary, k=3)) for _ in range(REPEAT * 10)]
+        for word in names:
+            trie.insert(word)
+        long_words = [word for word in names if len(word) >= FUZZY_PREFIX]
+        queries = []
+        for word in rng.choices(long_words, k=REPEAT):
+            i = rng.randrange(FUZZY_PREFIX)
+            queries.append(word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:FUZZY_PREFIX])
+        yield f"{name}.fuzzy", None, timed(trie.fuzzy, [(query,) for query in queries])
+
+def bench_undo(text, positions):
+    # Typing merged into runs a word long, then undoing and redoing every step
+    stack = UndoStack()
+    changes = [Change(i, "", " " if i % 6 == 5 else "x") for i in range(REPEAT * 6)]
+    yield "undo.record", None, timed(lambda change: stack.record(change, typing=True), [(c,) for c in changes])
+    yield "undo.undo", None, timed(stack.undo, [()] * len(stack.stack))
+    yield "undo.redo", None, timed(stack.redo, [()] * len(stack.redo_stack))
+
+def bench_highlight(text, positions):
+    # highlight_syntax() without the widget: re-lexing the window around a keystroke,
+    # and tokenizing the whole document when only visible lines are not highlighted
+    rope = Rope(text)
+    highlighter = IncrementalHighlighter()
+    for position in positions:
+        offset = offset_at(position, len(rope))
+        line, col = rope.offset_to_linecol(offset)
+        first = max(1, line - VIEW_LINES // 2)
+        last = first + VIEW_LINES
+        highlighter.update(rope.get_line, rope.line_count(), first, last)
+
+        def keystroke(i):
+            change = rope.splice(offset + i, 0, "x")
+            line, col = rope.offset_to_linecol(change.offset)
+            highlighter.lines_changed(line, 1, 1)
+            highlighter.update(rope.get_line, rope.line_count(), first, last)
+        yield "highlight.viewport", position, timed(keystroke, [(i,) for i in range(REPEAT)])
+    if len(text) > DOCUMENT_LIMIT:
+        yield "highlight.document", None, f"over {size_label(DOCUMENT_LIMIT)}"
+    else:
+        yield "highlight.document", None, timed(lambda: tag_ranges(rope.get_text()), [()] * SLOW_REPEAT)
+
+def tk_root():
+    # A hidden Tk root, None without a display
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    return root
+
+def bench_widgets(text, positions):
+    # Both highlighters the editors call after a keystroke, on real Text widgets
+    names = ("widget.syntax_highlight", "widget.highlight_syntax")
+    root = None if len(text) > WIDGET_LIMIT else tk_root()
+    if root is None:
+        reason = f"over {size_label(WIDGET_LIMIT)}" if len(text) > WIDGET_LIMIT else "no display"
+        for name in names:
+            for position in positions:
+                yield name, position, reason
+        return
+    root.destroy()
+    from testi import syntax_highlight
+    from testnumber2 import NotesApp
+
+    # Keep the user's crash journal and vocabulary out of it, the app writes to a scratch folder
+    scratch = tempfile.mkdtemp()
+    journal.UNTITLED_JOURNAL = os.path.join(scratch, "untitled.journal")
+    journal.FALLBACK_FOLDER = os.path.join(scratch, "journals")
+    vocabstore.VOCAB_PATH = os.path.join(scratch, "vocabulary")
+    app = NotesApp()
+    app.withdraw()
+    app.text_area.insert("1.0", text)
+    app.core.reset(Rope(text))
+    view = tk.Text(app)
+    view.insert("1.0", text)
+    highlighter = IncrementalHighlighter()
+    for position in positions:
+        offset = offset_at(position, len(text))
+        line, col = app.core.buffer.offset_to_linecol(offset)
+        for widget in (view, app.text_area):
+            widget.mark_set(tk.INSERT, f"{line}.{col}")
+            widget.see(tk.INSERT)
+        app.update_idletasks()
+        syntax_highlight(view, highlighter)
+
+        def typed(i):
+            view.insert(f"{line}.{col + i}", "x")
+            highlighter.lines_changed(line, 1, 1)
+            syntax_highlight(view, highlighter)
+        yield names[0], position, timed(typed, [(i,) for i in range(REPEAT)])
+
+        app.core.cursor = offset
+        app.highlight_syntax()
+
+        def typed(i):
+            app.text_area.insert(f"{line}.{col + i}", "x")
+            app.core.key("x", "x")
+            app.highlight_syntax()
+        yield names[1], position, timed(typed, [(i,) for i in range(REPEAT)])
+    if app.core.journal:
+        app.core.journal.close(remove=True)
+    app.destroy()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+BENCHMARKS = (bench_dll, bench_rope, bench_trie, bench_undo, bench_highlight, bench_widgets)
+
+def key(result):
+    parts = [result["name"], result["text"], size_label(result["size"])]
+    if result["position"]:
+        parts.append(result["position"])
+    return "/".join(parts)
+
+def run(kinds, sizes, pattern, seed):
+    results = []
+    print(f"{'benchmark':<52}{'ops':>7}{'p50 us':>12}{'p95 us':>12}")
+    for kind in kinds:
+        for size in sizes:
+            text = document(kind, size, seed)
+            for bench in BENCHMARKS:
+                for name, position, samples in bench(text, POSITIONS):
+                    result = {"name": name, "text": kind, "size": size, "position": position}
+                    if not pattern.search(key(result)):
+                        continue
+                    if isinstance(samples, str):
+                        result["skipped"] = samples
+                        print(f"{key(result):<52}{'skipped, ' + samples:>31}")
+                    else:
+                        result.update(summary(samples))
+                        print(f"{key(result):<52}{result['ops']:>7}{result['p50_us']:>12.2f}{result['p95_us']:>12.2f}")
+                    results.append(result)
+    return results
+
+def threshold(median):
+    return round(max(median * HEADROOM, median + NOISE_US), 1)
+
+def check(results, thresholds):
+    # Keys whose median is above its threshold, as (key, median, threshold)
+    regressions = []
+    for result in results:
+        limit = thresholds.get(key(result))
+        if limit is not None and "p50_us" in result and result["p50_us"] > limit:
+            regressions.append((key(result), result["p50_us"], limit))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the buffer, trie, undo and highlighters")
+    parser.add_argument("--sizes", default=SIZES, help="comma separated document sizes, e.g. 1K,10M")
+    parser.add_argument("--texts", default=",".join(GENERATORS), help="comma separated kinds of text")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose key matches this regex")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--check", metavar="THRESHOLDS", help="exit 1 if a median is above its threshold")
+    parser.add_argument("--write-thresholds", metavar="THRESHOLDS", help=f"save the medians times {HEADROOM} as thresholds")
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = run(args.texts.split(","), sizes, re.compile(args.filter), args.seed)
+    with open(args.output, "w") as f:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=1)
+    print(f"{len(results)} results written to {args.output}")
+
+    if args.write_thresholds:
+        thresholds = {key(r): threshold(r["p50_us"]) for r in results if "p50_us" in r}
+        with open(args.write_thresholds, "w") as f:
+            json.dump(thresholds, f, indent=1, sort_keys=True)
+        print(f"{len(thresholds)} thresholds written to {args.write_thresholds}")
+    if args.check:
+        with open(args.check) as f:
+            regressions = check(results, json.load(f))
+        for name, median, limit in regressions:
+            print(f"regression: {name} median {median:.2f} us, threshold {limit:.2f} us")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Memory and lookup latency of trie.Trie against the compact radixtrie.RadixTrie.
+# Run from the repository root: python benchmarks/bench_trie.py [--words N]
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from radixtrie import RadixTrie
+from trie import Trie
+
+IDENTIFIER_RE = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]{2,}\b")
+
+def stdlib_vocabulary(limit):
+    # Real identifiers, harvested from the Python standard library sources
+    words = set()
+    root = os.path.dirname(os.__file__)
+    for name in sorted(os.listdir(root)):
+        if name.endswith(".py"):
+            with open(os.path.join(root, name), encoding="utf-8", errors="ignore") as f:
+                words.update(IDENTIFIER_RE.findall(f.read()))
+            if len(words) >= limit:
+                break
+    return sorted(words)[:limit]
+
+def synthetic_vocabulary(count, rng):
+    syllables = ["get", "set", "is", "to", "on", "re", "un", "pre", "load", "save", "text", "line",
+                 "node", "word", "char", "index", "buf", "key", "str", "list", "item", "count"]
+    words = set()
+    while len(words) < count:
+        words.add("_".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) + str(rng.randint(0, 99)))
+    return sorted(words)
+
+def build(cls, words, seed):
+    rng = random.Random(seed)
+    trie = cls()
+    for word in words:
+        trie.insert(word, count=rng.randint(0, 5))
+    return trie
+
+def build_cost(cls, words, seed):
+    # Build time without tracing, then the memory held by a second build
+    start = time.perf_counter()
+    build(cls, words, seed)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    trie = build(cls, words, seed)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return trie, elapsed, memory
+
+def lookup_latency(trie, prefixes):
+    samples = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        trie.autocomplete(prefix, 5)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the Trie and RadixTrie autocomplete backends")
+    parser.add_argument("--words", type=int, default=50000, help="vocabulary size")
+    parser.add_argument("--source", choices=("stdlib", "synthetic"), default="synthetic")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    if args.source == "stdlib":
+        words = stdlib_vocabulary(args.words)
+    else:
+        words = synthetic_vocabulary(args.words, rng)
+    print(f"{len(words)} words ({args.source})")
+    print(f"{'backend':<12}{'build s':>10}{'memory MB':>12}{'prefix':>8}{'p50 us':>10}{'p95 us':>10}")
+
+    for cls in (Trie, RadixTrie):
+        trie, elapsed, memory = build_cost(cls, words, 1)
+        for length in (1, 2, 4):
+            prefixes = [rng.choice(words)[:length] for _ in range(args.lookups)]
+            p50, p95 = lookup_latency(trie, prefixes)
+            print(f"{cls.__name__:<12}{elapsed:>10.2f}{memory / 2**20:>12.1f}{length:>8}{p50 * 1e6:>10.1f}{p95 * 1e6:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import keyword
+from collections import Counter
+
+from highlighter import IncrementalHighlighter, tag_ranges
+from rope import Change, Rope
+from search import SearchIndex, replacement_changes, stream_search
+from trie import Trie
+from undo import UndoStack
+from vocabulary import BACKGROUND_COUNT, VocabularyTracker, word_start
+
+class EditorCore:
+    # Everything the editor does to a document, without tkinter: the buffer and the
+    # cursor, undo, the vocabulary behind suggestions, search and highlighting. Edits
+    # return the Change they made for a view to patch its widget with, highlighting
+    # returns tag ranges, so the whole editor can be driven by scripts without a display.
+    # A view sets cursor from its widget before calling in and moves the widget's
+    # cursor to it afterwards.
+    def __init__(self, vocabulary=None):
+        self.buffer = Rope()
+        self.cursor = 0  # offset into the buffer
+        self.undo_stack = UndoStack()
+        self.highlighter = IncrementalHighlighter()
+        self.vocabulary = vocabulary  # VocabularyIndex of words learned in earlier sessions, or None
+        self.learned = Counter()  # words learned in this session
+        self.fuzzy_suggestions = True
+        self.journal = None  # EditJournal every change is appended to, or None
+        self.search = None  # SearchIndex of the last search, kept up to date while editing
+        # defer(compute, data, apply) runs compute(data) elsewhere and apply(result) back
+        # here later, a view passes one that uses its worker thread. None runs it inline.
+        self.defer = None
+        self.reset_vocabulary()
+
+    def reset(self, buffer=None):
+        # Start over on another document
+        self.buffer = Rope() if buffer is None else buffer
+        self.cursor = 0
+        self.undo_stack.clear()
+        self.highlighter.reset()
+        self.reset_vocabulary()
+        self.search = None
+
+    def reset_vocabulary(self):
+        self.trie = Trie()
+        self.tracker = VocabularyTracker(self.trie)  # keeps the trie in step with the words in the buffer
+        for word in keyword.kwlist:
+            self.trie.insert(word, count=0)
+
+    # Editing
+
+    def key(self, keysym, char):
+        # A key press: BackSpace deletes before the cursor, Return, Tab and anything printable
+        # are typed and space also learns the word before it. Returns the Change, None if
+        # nothing changed.
+        if keysym == "BackSpace":
+            if self.cursor == 0:
+                return None
+            return self.edit(self.buffer.splice(self.cursor - 1, 1, ""), typing=True)
+        if keysym == "space":
+            last_word = self.buffer.get_range(word_start(self.buffer, self.cursor), self.cursor)
+            if last_word:
+                self.learn_word(last_word)
+            char = " "
+        elif keysym == "Return":
+            char = "\n"
+        elif keysym == "Tab":
+            char = "\t"
+        elif not char or not char.isprintable():
+            return None
+        return self.edit(self.buffer.splice(self.cursor, 0, char), typing=True)
+
+    def paste(self, text, start=None, end=None):
+        # Replace start to end, the cursor if not given, with text as one undo step
+        if start is None:
+            start = end = self.cursor
+        return self.edit(self.buffer.replace_range(start, end, text))
+
+    def select_suggestion(self, word):
+        # Replace the word before the cursor with a suggestion, None if there is no word
+        start, end, current = self.current_word()
+        if not current:
+            return None
+        change = self.edit(self.buffer.replace_range(start, end, word))
+        self.learn_word(word)  # Picking a suggestion counts as using the word
+        return change
+
+    def undo(self):
+        # Revert the newest undo step with one splice, returns the Change or None
+        transaction = self.undo_stack.undo()
+        if not transaction:
+            return None
+        inverse = [Change(c.offset, c.inserted, c.removed) for c in reversed(transaction)]
+        return self.apply(self.buffer.apply_changes(inverse))
+
+    def redo(self):
+        transaction = self.undo_stack.redo()
+        if not transaction:
+            return None
+        return self.apply(self.buffer.apply_changes(transaction))
+
+    def edit(self, change, typing=False):
+        # Record a change made to the buffer for undo, then apply() it
+        self.undo_stack.record(change, typing)
+        return self.apply(change)
+
+    def apply(self, change, journal=True):
+        # Bring the cursor, journal, highlighter, vocabulary and search in step with a
+        # change that was made to the buffer
+        if journal and self.journal:
+            self.journal.append(change)
+        self.cursor = change.offset + len(change.inserted)
+        line, col = self.buffer.offset_to_linecol(change.offset)
+        self.highlighter.lines_changed(line, change.removed.count("\n") + 1, change.inserted.count("\n") + 1)
+        if self.defer and (self.tracker.deferred or len(change.removed) + len(change.inserted) > BACKGROUND_COUNT):
+            # Counting the words of e.g. a replace-all over the whole file is deferred
+            self.tracker.defer(self.defer, self.buffer, change)
+        else:
+            self.tracker.changed(self.buffer, change)
+        if self.search is not None and self.search.complete:
+            # An unfinished search read the text from before the change, it has to start over
+            self.search.changed(self.buffer, change)
+        return change
+
+    def current_word(self):
+        # Start offset, cursor offset and the whitespace separated word before the cursor
+        idx = self.cursor
+        line, col = self.buffer.offset_to_linecol(idx)
+        parts = self.buffer.get_range(idx - col, idx).split()
+        word = parts[-1] if parts and not self.buffer.get_range(idx - 1, idx).isspace() else ""
+        return idx - len(word), idx, word
+
+    # Suggestions
+
+    def suggestions(self, k=5):
+        # Suggestions for the word before the cursor
+        start, end, word = self.current_word()
+        return self.suggestions_for(word, k) if word else []
+
+    def suggestions_for(self, word, k=5):
+        # Merge this session's trie with the saved vocabulary, ranked by the total use count
+        # The word being typed is in the buffer too, so it is left out of its own suggestions
+        ranked = {suggestion: count for count, suggestion in self.trie.ranked(word, k + 1)}
+        if self.vocabulary is not None:
+            for count, saved in self.vocabulary.autocomplete(word, k + 1):
+                ranked[saved] = ranked.get(saved, 0) + count
+        ranked.pop(word, None)
+        suggestions = sorted(ranked, key=lambda suggestion: -ranked[suggestion])[:k]
+        if len(suggestions) < k and self.fuzzy_suggestions:
+            # Fill up with words that complete the prefix after fixing a typo or two
+            for distance, count, suggestion in self.trie.fuzzy(word, k=k + 1):
+                if suggestion != word and suggestion not in suggestions and len(suggestions) < k:
+                    suggestions.append(suggestion)
+        return suggestions
+
+    def learn_word(self, word):
+        # The trie counts the word through the buffer, this only remembers it for the next session
+        self.learned[word] += 1
+
+    # Search
+
+    def start_search(self, query, regex=False, whole_word=False, case_sensitive=False):
+        # An empty SearchIndex for a view to fill in the background. Raises re.error
+        # for a regex that does not compile.
+        self.search = SearchIndex(query, regex, whole_word, case_sensitive) if query else None
+        return self.search
+
+    def search_word(self, query, regex=False, whole_word=False, case_sensitive=False):
+        # Search the whole buffer here and now and move the cursor to the first match after
+        # it. Returns that match's index into search.starts, or None if there is none.
+        if self.start_search(query, regex, whole_word, case_sensitive) is None:
+            return None
+        if self.search.safe:
+            self.search.search(self.buffer)
+        else:
+            # A typed regex still runs in a child process that gives up on runaway patterns
+            self.search.complete = not stream_search(self.search, self.buffer, lambda: False, self.search.add)
+        return self.goto_match(self.search.next_match(self.cursor))
+
+    def next_match(self):
+        if self.search:
+            return self.goto_match(self.search.next_match(self.cursor + 1))
+        return None
+
+    def previous_match(self):
+        if self.search:
+            return self.goto_match(self.search.previous_match(self.cursor))
+        return None
+
+    def goto_match(self, i):
+        if i is not None:
+            self.cursor = self.search.starts[i]
+        return i
+
+    def replace_matches(self, i, j, replacement):
+        # Matches i to j are replaced by one splice of the buffer, so views, the highlighter
+        # and the vocabulary are updated once. The undo step keeps only the replaced
+        # matches, not the whole text between the first and the last.
+        changes = replacement_changes(self.buffer, self.search.starts[i:j], self.search.ends[i:j], replacement)
+        with self.undo_stack.transaction():
+            for change in changes:
+                self.undo_stack.record(change)
+        return self.apply(self.buffer.apply_changes(changes))
+
+    # Highlighting
+
+    def highlight(self, first, last):
+        # Token runs of the lines first to last that changed since they were last asked
+        # for, see IncrementalHighlighter.update()
+        return self.highlighter.update(self.buffer.get_line, self.buffer.line_count(), first, last)
+
+    def highlight_all(self):
+        # "line.col" ranges of every token class in the whole buffer
+        return tag_ranges(self.buffer.get_text())
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+from itertools import takewhile
+
+from rope import Rope
+
+# Characters read per chunk when loading a file, a multiple of the rope's leaf size
+READ_CHUNK = 1 << 20
+# Characters added to the Text widget per turn of the event loop while a file is shown
+FILL_CHUNK = 256 * 1024
+
+# The process umask, read once here: reading it means setting it, which saves on
+# other threads could race with
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def read_chunks(path, size=READ_CHUNK, progress=None):
+    # The decoded text of a file piece by piece, progress(done, total) gets the bytes read so far
+    total = os.path.getsize(path)
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                break
+            if progress:
+                progress(min(f.buffer.tell(), total), total)
+            yield chunk
+
+def load_rope(path, progress=None, cancelled=None):
+    # Build the buffer straight from the file's chunks, None when cancelled() became true
+    chunks = read_chunks(path, progress=progress)
+    if cancelled:
+        chunks = takewhile(lambda chunk: not cancelled(), chunks)
+    rope = Rope.from_chunks(chunks)
+    if cancelled and cancelled():
+        return None
+    return rope
+
+def whole_lines(text, complete):
+    # Cut text after its last newline so the widget never holds half a line, unless
+    # complete says nothing follows or the text has no newline at all
+    if not complete:
+        cut = text.rfind("\n") + 1
+        if cut:
+            return text[:cut]
+    return text
+
+def read_head(path, size=FILL_CHUNK):
+    # The first lines of a file, shown while the rest is still being read
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read(size)
+    return whole_lines(text, len(text) < size)
+
+def next_slice(rope, start, size=FILL_CHUNK):
+    # The next whole lines of the rope from offset start on, for filling the widget
+    text = rope.get_range(start, start + size)
+    return whole_lines(text, start + len(text) >= len(rope))
+
+def write_atomic(path, chunks):
+    # Stream chunks into a temporary file next to path and rename it into place, so
+    # the file is either the old or the new version even if the editor dies halfway
+    folder, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".saving", dir=folder)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            # mkstemp makes the file private, a new file gets the usual permissions instead
+            os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable
+        fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,237 @@
+import keyword
+import re
+from bisect import bisect_right
+
+# Lexer states carried from one line to the next: outside of any string,
+# or inside a triple quoted string opened with the given delimiter
+NORMAL = ""
+
+KEYWORD_PATTERN = r"\b(?:" + "|".join(keyword.kwlist) + r")\b"
+STRING_PATTERN = r"\"(?:[^\"\\\n]|\\.)*\\?(?:\"|$)|'(?:[^'\\\n]|\\.)*\\?(?:'|$)"
+NUMBER_PATTERN = r"\b0[xXoObB][0-9a-fA-F_]+\b|\b\d[\d_]*(?:\.\d*)?(?:[eE][+-]?\d+)?[jJ]?\b"
+
+TOKEN_RE = re.compile(
+    r"(?P<comment>#.*)"
+    r"|(?P<triple>\"\"\"|''')"
+    rf"|(?P<string>{STRING_PATTERN})"
+    rf"|(?P<number>{NUMBER_PATTERN})"
+    rf"|(?P<keyword>{KEYWORD_PATTERN})"
+)
+
+# The same token classes for a whole document in one regex, triple quoted strings
+# may span lines here and numbers are recognised too
+DOCUMENT_RE = re.compile(
+    r"(?P<comment>#[^\n]*)"
+    r"|(?P<string>\"\"\"(?:[^\"\\]|\\[\s\S]|\"(?!\"\"))*(?:\"\"\"|\\?\Z)"
+    r"|'''(?:[^'\\]|\\[\s\S]|'(?!''))*(?:'''|\\?\Z)"
+    rf"|{STRING_PATTERN})"
+    rf"|(?P<number>{NUMBER_PATTERN})"
+    rf"|(?P<keyword>{KEYWORD_PATTERN})",
+    re.MULTILINE,
+)
+NEWLINE_RE = re.compile("\n")
+
+# Match the rest of a triple quoted string up to and including its closing delimiter
+TRIPLE_END = {
+    '"""': re.compile(r'(?:[^"\\]|\\.|"(?!""))*"""'),
+    "'''": re.compile(r"(?:[^'\\]|\\.|'(?!''))*'''"),
+}
+
+TAGS = ("keyword", "string", "comment")
+DOCUMENT_TAGS = ("keyword", "string", "comment", "number")
+# Separate runs of dirty lines the incremental highlighter keeps apart, an edit costs at most this much
+MAX_DIRTY_RUNS = 32
+
+# Extra lines highlighted above and below the visible part of a widget
+VIEWPORT_MARGIN = 50
+
+def lex_line(line, state=NORMAL):
+    # Tokenize one line starting in the given state, return the tokens and the state at the end of the line
+    tokens = []
+    pos = 0
+    if state != NORMAL:
+        match = TRIPLE_END[state].match(line)
+        if not match:
+            if line:
+                tokens.append(("string", 0, len(line)))
+            return tokens, state
+        tokens.append(("string", 0, match.end()))
+        pos = match.end()
+    while True:
+        match = TOKEN_RE.search(line, pos)
+        if not match:
+            return tokens, NORMAL
+        kind = match.lastgroup
+        if kind == "triple":
+            quote = match.group()
+            end = TRIPLE_END[quote].match(line, match.end())
+            if not end:
+                tokens.append(("string", match.start(), len(line)))
+                return tokens, quote
+            tokens.append(("string", match.start(), end.end()))
+            pos = end.end()
+        else:
+            tokens.append((kind, match.start(), match.end()))
+            pos = match.end()
+
+def tokenize(text):
+    # Tokenize a whole document in a single regex pass, return {tag: [(start, end), ...]} as offsets
+    ranges = {tag: [] for tag in DOCUMENT_TAGS}
+    for match in DOCUMENT_RE.finditer(text):
+        ranges[match.lastgroup].append(match.span())
+    return ranges
+
+def tag_ranges(text):
+    # Like tokenize, but as flat lists of "line.col" indices ready for one tag_add call per tag
+    line_starts = [0]
+    line_starts.extend(match.end() for match in NEWLINE_RE.finditer(text))
+    result = {}
+    for tag, spans in tokenize(text).items():
+        indices = []
+        for start, end in spans:
+            for offset in (start, end):
+                line = bisect_right(line_starts, offset)
+                indices.append(f"{line}.{offset - line_starts[line - 1]}")
+        result[tag] = indices
+    return result
+
+class IncrementalHighlighter:
+    # Remembers the lexer state at the end of every line. After an edit only the
+    # touched lines are lexed again, continuing downwards until a line ends in the
+    # same state as before, e.g. when an opening triple quote was typed.
+    # update() can be limited to a window of lines (the visible part of the widget),
+    # lines outside of it are tagged lazily once they scroll into view.
+    def __init__(self):
+        self.states = []  # state at the end of line n is states[n - 1], None = not lexed yet
+        self.painted = []  # painted[n - 1] is True while the tags of line n are up to date
+        self.dirty = [(1, 1)]  # sorted (first, last) runs of lines to lex again, then on until converged
+
+    def reset(self):
+        self.states = []
+        self.painted = []
+        self.dirty = [(1, 1)]
+
+    def copy(self):
+        # Independent snapshot that a worker thread can update while the original keeps receiving edits
+        clone = IncrementalHighlighter()
+        clone.states = list(self.states)
+        clone.painted = list(self.painted)
+        clone.dirty = list(self.dirty)
+        return clone
+
+    def lines_changed(self, first, old_count, new_count):
+        # Lines first .. first + old_count - 1 were replaced with new_count lines
+        delta = new_count - old_count
+        # The lines below started from the end state of the last replaced line, kept on the
+        # last new one so lexing can stop there when the edit leaves that state as it was
+        replaced = self.states[first - 1:first - 1 + old_count]
+        end_state = replaced[-1] if replaced and new_count else None
+        self.states[first - 1:first - 1 + old_count] = [None] * (new_count - 1) + [end_state] if new_count else []
+        self.painted[first - 1:first - 1 + old_count] = [False] * new_count
+        # Runs touching the edit are merged with it, so typing down a file keeps a single run
+        start, end = first, first + new_count - 1
+        before, after = [], []
+        for run_start, run_end in self.dirty:
+            if run_end < first - 1:
+                before.append((run_start, run_end))
+            elif run_start > first + old_count:
+                after.append((run_start + delta, run_end + delta))
+            else:
+                start = min(start, run_start)
+                if run_end >= first + old_count:
+                    end = max(end, run_end + delta)
+        dirty = before + [(start, end)] + after
+        if len(dirty) > MAX_DIRTY_RUNS:
+            # Lexing the lines in between too is cheaper than tracking every run
+            dirty = [(dirty[0][0], dirty[-1][1])]
+        self.dirty = dirty
+
+    def update(self, get_line, line_count, first=1, last=None, cancelled=None):
+        # Bring the states up to date down to line last and return the tokens of every line
+        # in first .. last that is not tagged yet, as runs of (first line, tokens of each line).
+        # Returns None when cancelled() becomes true, the highlighter must then be thrown away
+        last = line_count if last is None else min(last, line_count)
+        first = max(1, first)
+        for array, fill in ((self.states, None), (self.painted, False)):
+            if len(array) < line_count:
+                array.extend([fill] * (line_count - len(array)))
+            del array[line_count:]
+
+        fresh = {}
+        dirty = []
+        done = 0
+        for start, end in self.dirty:
+            end = min(end, line_count)
+            start = max(start, done + 1)
+            if start > end:
+                continue
+            if start > last:
+                dirty.append((start, end))
+                continue
+            line = start
+            while True:
+                if cancelled and line % 1000 == 0 and cancelled():
+                    return None
+                if line > last:
+                    # Not converged inside the window, continue from here when it is needed
+                    if line <= line_count:
+                        dirty.append((line, max(line, end)))
+                    break
+                state = self.state_before(line)
+                if line >= first:
+                    fresh[line], end_state = lex_line(get_line(line), state)
+                else:
+                    end_state = scan_state(get_line(line), state)
+                self.painted[line - 1] = line >= first
+                old_state = self.states[line - 1]
+                self.states[line - 1] = end_state
+                line += 1
+                if old_state == end_state and line > end:
+                    break
+            done = line - 1
+        self.dirty = dirty
+
+        # Tag the rest of the window that has not been painted since it last changed
+        for line in range(first, last + 1):
+            if not self.painted[line - 1]:
+                fresh[line], self.states[line - 1] = lex_line(get_line(line), self.state_before(line))
+                self.painted[line - 1] = True
+
+        runs = []
+        for line in sorted(fresh):
+            if runs and runs[-1][0] + len(runs[-1][1]) == line:
+                runs[-1][1].append(fresh[line])
+            else:
+                runs.append((line, [fresh[line]]))
+        return runs
+
+    def state_before(self, line):
+        return (self.states[line - 2] or NORMAL) if line > 1 else NORMAL
+
+def scan_state(line, state=NORMAL):
+    # End state of a line without collecting its tokens, most lines cannot change it
+    if state == NORMAL and '"' not in line and "'" not in line:
+        return NORMAL
+    if state != NORMAL and state not in line:
+        return state
+    return lex_line(line, state)[1]
+
+def visible_lines(text_widget, margin=VIEWPORT_MARGIN):
+    # First and last line shown in a Text widget, widened by margin lines on both sides
+    first = int(text_widget.index("@0,0").split(".")[0])
+    last = int(text_widget.index(f"@0,{text_widget.winfo_height()}").split(".")[0])
+    return max(1, first - margin), last + margin
+
+def apply_line_tags(text_widget, runs, tags=TAGS):
+    # Retag the re-lexed lines of a Text widget with one tag_add call per tag and run
+    for start, tokens in runs:
+        last = start + len(tokens) - 1
+        ranges = {tag: [] for tag in tags}
+        for line, line_tokens in enumerate(tokens, start):
+            for tag, begin, end in line_tokens:
+                if tag in ranges:
+                    ranges[tag].extend((f"{line}.{begin}", f"{line}.{end}"))
+        for tag in tags:
+            text_widget.tag_remove(tag, f"{start}.0", f"{last}.end")
+            if ranges[tag]:
+                text_widget.tag_add(tag, *ranges[tag])
@@ -0,0 +1,199 @@
+import os
+import struct
+import threading
+import zlib
+
+# Edits of unsaved buffers are journaled here
+UNTITLED_JOURNAL = os.path.join(os.path.expanduser("~"), ".bestest_editor_untitled.journal")
+# Journals of documents whose own folder cannot be written to
+FALLBACK_FOLDER = os.path.join(os.path.expanduser("~"), ".bestest_editor_journals")
+
+# File layout, all numbers in native byte order:
+#   header   magic, version, size and mtime_ns of the saved file the edits apply to
+#   records  crc32, offset, removed length, inserted length in bytes, inserted text
+# Offsets and the removed length count characters, like the rope does. A record
+# whose crc does not match was torn by a crash, it and everything after it is dropped.
+HEADER = struct.Struct("=4sIQQ")
+RECORD = struct.Struct("=IQII")
+FIELDS = struct.Struct("=QII")  # the record without its crc
+MAGIC = b"BJNL"
+VERSION = 1
+# Stamp of a buffer that was never saved
+UNTITLED = (0, 0)
+
+# Seconds between background flushes, and pending bytes that trigger one early
+FLUSH_INTERVAL = 0.5
+BATCH_BYTES = 64 * 1024
+
+def journal_path(file_path):
+    # Hidden file next to the document, or the shared one for untitled buffers
+    if not file_path:
+        return UNTITLED_JOURNAL
+    folder, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(folder, f".{name}.journal")
+
+def fallback_journal_path(file_path):
+    # A journal in FALLBACK_FOLDER, named after the document's full path so that opening
+    # the document again finds it
+    path = os.path.abspath(file_path) if file_path else ""
+    name = os.path.basename(path) or "untitled"
+    return os.path.join(FALLBACK_FOLDER, f"{name}.{zlib.crc32(path.encode('utf-8')):08x}.journal")
+
+def file_stamp(file_path):
+    # Identifies the saved version of a file the journal was started on
+    info = os.stat(file_path)
+    return info.st_size, info.st_mtime_ns
+
+class EditJournal:
+    # Append-only log of the Changes made since the file was last saved. append() only
+    # encodes into memory, a background thread writes the batch and fsyncs it, so a
+    # crash loses at most FLUSH_INTERVAL of typing. Saving the file compacts the
+    # journal back to its header.
+    def __init__(self, path, stamp=UNTITLED):
+        self.path = path
+        self.pending = bytearray()
+        self.inflight = b""  # batch taken out of pending that is being written
+        self.pending_lock = threading.Lock()  # guards pending and epoch, held only briefly
+        self.file_lock = threading.Lock()  # serialises writes, fsyncs and truncation
+        self.epoch = 0  # bumped by compact() so batches taken before it are dropped
+        self.length = 0  # bytes of records after the header, pending ones included
+        self.wake = threading.Event()
+        self.closed = False
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        if self.read_stamp() != stamp:
+            # Missing, damaged or left over from another version of the file
+            self.write_header(stamp)
+        self.length = os.path.getsize(path) - HEADER.size
+        self.worker = threading.Thread(target=self.work, daemon=True)
+        self.worker.start()
+
+    def read_stamp(self):
+        self.file.seek(0)
+        data = self.file.read(HEADER.size)
+        if len(data) < HEADER.size:
+            return None
+        magic, version, size, mtime = HEADER.unpack(data)
+        if magic != MAGIC or version != VERSION:
+            return None
+        return size, mtime
+
+    def write_header(self, stamp):
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(HEADER.pack(MAGIC, VERSION, *stamp))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def records(self):
+        # Every intact (offset, removed length, inserted text), a torn tail is cut off
+        with self.file_lock:
+            self.file.seek(HEADER.size)
+            data = self.file.read()
+            pos = 0
+            while pos + RECORD.size <= len(data):
+                crc, offset, removed, length = RECORD.unpack_from(data, pos)
+                end = pos + RECORD.size + length
+                if end > len(data) or zlib.crc32(data[pos + 4:end]) != crc:
+                    break
+                yield offset, removed, data[pos + RECORD.size:end].decode("utf-8")
+                pos = end
+            if pos < len(data):
+                self.file.seek(HEADER.size + pos)
+                self.file.truncate()
+                with self.pending_lock:
+                    self.length -= len(data) - pos
+            self.file.seek(0, os.SEEK_END)
+
+    def replay(self, buffer):
+        # Redo the journaled edits on a buffer holding the saved text, returns how many
+        count = 0
+        for offset, removed, inserted in self.records():
+            buffer.splice(offset, removed, inserted)
+            count += 1
+        return count
+
+    def append(self, change):
+        inserted = change.inserted.encode("utf-8")
+        fields = (change.offset, len(change.removed), len(inserted))
+        crc = zlib.crc32(inserted, zlib.crc32(FIELDS.pack(*fields)))
+        self.append_raw(RECORD.pack(crc, *fields) + inserted)
+
+    def append_raw(self, data):
+        # Queue already encoded records, e.g. the tail of another journal
+        with self.pending_lock:
+            self.pending += data
+            self.length += len(data)
+            full = len(self.pending) >= BATCH_BYTES
+        if full:
+            self.wake.set()
+
+    def position(self):
+        # Where the records of edits made from now on begin, see compact() and tail()
+        with self.pending_lock:
+            return self.length
+
+    def work(self):
+        while not self.closed:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.pending_lock:
+            data, self.pending = bytes(self.pending), bytearray()
+            self.inflight = data
+            epoch = self.epoch
+        if not data:
+            return
+        with self.file_lock:
+            self.inflight = b""
+            if epoch != self.epoch or self.file.closed:
+                return  # compacted meanwhile, what is still needed was copied by compact()
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def compact(self, stamp, position=None):
+        # The file was saved with every edit up to position (all of them if None),
+        # only the records after it are kept
+        with self.pending_lock:
+            keep = self._tail(position) if position is not None else b""
+            self.pending = bytearray()
+            self.length = len(keep)
+            self.epoch += 1
+            with self.file_lock:
+                self.write_header(stamp)
+                self.file.write(keep)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def tail(self, position):
+        # The encoded records after position, for carrying them over into another journal
+        with self.pending_lock:
+            return self._tail(position)
+
+    def _tail(self, position):
+        # Call with pending_lock held
+        with self.file_lock:
+            self.file.seek(0, os.SEEK_END)
+            written = self.file.tell() - HEADER.size
+            unwritten = self.inflight + bytes(self.pending)
+            if position >= written:
+                return unwritten[position - written:]
+            self.file.seek(HEADER.size + position)
+            return self.file.read() + unwritten
+
+    def close(self, remove=True):
+        # Stop the writer, remove=True deletes the journal since nothing needs recovering
+        self.closed = True
+        self.wake.set()
+        self.worker.join()
+        if remove:
+            with self.pending_lock:
+                self.pending.clear()
+        self.flush()
+        with self.file_lock:
+            self.file.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from abc import ABC, abstractmethod
 import sys
+from fileio import write_atomic
 
 class ONote:
     def __init__(self, text: str, filename: str):
@@ -28,8 +29,8 @@ class ONote:
 
     def save(self):
         try:
-            with open(self.filename, 'w') as f:
-                f.write(self.text)
+            # Written to a temporary file and renamed, a failed save leaves the old file intact
+            write_atomic(self.filename, [self.text])
         except Exception as e:
             raise e
 
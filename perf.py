@@ -0,0 +1,141 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import tkinter as tk
+
+# Set BESTEST_PERF=1 to record from the start, the overlay turns recording on while it is shown
+ENABLED = os.environ.get("BESTEST_PERF", "") not in ("", "0")
+# Calls per stage the histograms cover, older ones roll out
+WINDOW = 1000
+# Histogram buckets are this many per doubling of the duration (about 9% wide), from one microsecond
+BUCKETS_PER_OCTAVE = 8
+BUCKETS = 30 * BUCKETS_PER_OCTAVE  # up to about 18 minutes
+# Calls kept for the trace file, and how often the overlay is refreshed in milliseconds
+TRACE_LIMIT = 200000
+OVERLAY_MS = 500
+
+def _bucket(seconds):
+    micros = seconds * 1e6
+    if micros <= 1:
+        return 0
+    return min(BUCKETS - 1, int(math.log2(micros) * BUCKETS_PER_OCTAVE))
+
+def _bucket_end(bucket):
+    # Upper bound of a bucket in seconds
+    return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1e6
+
+class Histogram:
+    # Log-scale histogram of the last WINDOW durations of one stage
+    def __init__(self, window=WINDOW):
+        self.counts = [0] * BUCKETS
+        self.recent = deque()
+        self.window = window
+        self.total = 0  # calls ever recorded
+
+    def add(self, seconds):
+        bucket = _bucket(seconds)
+        self.counts[bucket] += 1
+        self.recent.append(bucket)
+        if len(self.recent) > self.window:
+            self.counts[self.recent.popleft()] -= 1
+        self.total += 1
+
+    def __len__(self):
+        return len(self.recent)
+
+    def percentile(self, p):
+        # Upper bound in seconds of the bucket holding the p-th percentile
+        target = max(1, math.ceil(len(self.recent) * p / 100))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return _bucket_end(bucket)
+        return 0.0
+
+class Recorder:
+    # Durations of the editor's stages, as rolling histograms for the overlay and as
+    # complete events for a trace file. Stages may be timed on any thread.
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.histograms = {}
+        self.events = deque(maxlen=TRACE_LIMIT)  # (stage, start, end, thread id)
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def record(self, stage, start, end):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.add(end - start)
+        self.events.append((stage, start, end, threading.get_ident()))
+
+    def table(self):
+        # The overlay's text: calls in the window and percentiles in milliseconds per stage
+        lines = [f"{'stage':<18}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}"]
+        with self.lock:
+            for stage in sorted(self.histograms):
+                histogram = self.histograms[stage]
+                p50, p95, p99 = (histogram.percentile(p) * 1e3 for p in (50, 95, 99))
+                lines.append(f"{stage:<18}{len(histogram):>6}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}")
+        return "\n".join(lines)
+
+    def dump_trace(self, path):
+        # Write the recorded calls in the Chrome trace event format, which chrome://tracing,
+        # Perfetto and speedscope open
+        pid = os.getpid()
+        events = [
+            {"name": stage, "cat": "editor", "ph": "X", "pid": pid, "tid": tid,
+             "ts": round((start - self.origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1)}
+            for stage, start, end, tid in list(self.events)
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+recorder = Recorder()
+
+def timed(stage):
+    # Decorator recording every call of a function as stage while the recorder is on.
+    # Off, it only adds a call and a flag check, well under a microsecond.
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(stage, start, time.perf_counter())
+        return wrapper
+    return decorate
+
+class PerfOverlay(tk.Label):
+    # Per-stage latency table over the top right corner of a window, refreshed while shown
+    def __init__(self, parent):
+        super().__init__(parent, font=("Courier", 9), justify=tk.LEFT, anchor=tk.NW, bg="#202020", fg="#e0e0e0", padx=6, pady=4)
+        self.after_id = None
+
+    def show(self):
+        recorder.enabled = True
+        self.place(relx=1.0, rely=0.0, anchor=tk.NE)
+        self.lift()
+        self.refresh()
+
+    def hide(self):
+        recorder.enabled = ENABLED
+        if self.after_id:
+            self.after_cancel(self.after_id)
+            self.after_id = None
+        self.place_forget()
+
+    def refresh(self):
+        self.config(text=recorder.table())
+        self.after_id = self.after(OVERLAY_MS, self.refresh)
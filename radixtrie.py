@@ -0,0 +1,178 @@
+import heapq
+from os.path import commonprefix
+
+from trie import TOP_K, max_edits
+
+class RadixNode:
+    # Edges carry whole substrings, so chains of single-child nodes collapse into one node.
+    # children stays None for leaves and count is None for nodes that do not end a word.
+    __slots__ = ("label", "children", "count", "last_used", "permanent")
+
+    def __init__(self, label):
+        self.label = label
+        self.children = None
+        self.count = None
+        self.last_used = 0
+        self.permanent = False  # added with count=0, stays in the vocabulary at count 0
+
+    def child(self, ch):
+        if self.children:
+            for child in self.children:
+                if child.label[0] == ch:
+                    return child
+        return None
+
+class RadixTrie:
+    # Memory-lean alternative to trie.Trie with the same interface.
+    # Nothing is cached per node, so autocomplete ranks the subtree below the prefix
+    # on every call: much less memory, slower lookups for very short prefixes.
+    def __init__(self, k=TOP_K):
+        self.root = RadixNode("")
+        self.k = k
+        self.clock = 0
+
+    def insert(self, word, count=1):
+        # Record count uses of word, count=0 only adds it to the vocabulary
+        if not word:
+            return
+        node = self.root
+        rest = word
+        while rest:
+            child = node.child(rest[0])
+            if child is None:
+                child = RadixNode(rest)
+                if node.children is None:
+                    node.children = []
+                node.children.append(child)
+                node = child
+                break
+            common = len(commonprefix((child.label, rest)))
+            if common < len(child.label):
+                # Split the edge where the new word leaves it
+                middle = RadixNode(child.label[:common])
+                child.label = child.label[common:]
+                middle.children = [child]
+                node.children[node.children.index(child)] = middle
+                child = middle
+            node = child
+            rest = rest[common:]
+        if node.count is None:
+            node.count = 0
+        if not count:
+            node.permanent = True
+        else:
+            self.clock += 1
+            node.count += count
+            node.last_used = self.clock
+
+    def remove(self, word, count=1):
+        # Take back count uses of word, it leaves the trie when none are left unless it is permanent
+        path = [self.root]
+        rest = word
+        while rest:
+            child = path[-1].child(rest[0])
+            if child is None or not rest.startswith(child.label):
+                return
+            path.append(child)
+            rest = rest[len(child.label):]
+        node = path[-1]
+        if not node.count:
+            return
+        node.count = max(0, node.count - count)
+        if node.count or node.permanent:
+            return
+        node.count = None
+        if node.children is None:
+            # A leaf that no longer ends a word goes, which may leave its parent with one child
+            parent = path[-2]
+            parent.children.remove(node)
+            if not parent.children:
+                parent.children = None
+            path.pop()
+            node = parent
+        if node is not self.root and node.count is None and node.children and len(node.children) == 1:
+            # Fold a node that ends no word into its only child
+            child = node.children[0]
+            child.label = node.label + child.label
+            siblings = path[-2].children
+            siblings[siblings.index(node)] = child
+
+    def autocomplete(self, prefix, k=None):
+        # The k best completions of prefix, best first
+        return [word for _, word in self.ranked(prefix, k)]
+
+    def ranked(self, prefix, k=None):
+        # Like autocomplete, but as (count, word) pairs
+        node = self.root
+        consumed = ""
+        rest = prefix
+        while rest:
+            child = node.child(rest[0])
+            if child is None:
+                return []
+            if child.label.startswith(rest):
+                consumed += child.label
+                node = child
+                break
+            if not rest.startswith(child.label):
+                return []
+            consumed += child.label
+            rest = rest[len(child.label):]
+            node = child
+        best = heapq.nsmallest(k or self.k, self._words(node, consumed))
+        return [(-count, word) for count, _, word in best]
+
+    def fuzzy(self, prefix, max_distance=None, k=None):
+        # Same as Trie.fuzzy. The rows of edit distances are carried along the characters
+        # of every edge, and the words below a point within the budget are ranked there
+        # and then, since no node caches its best completions.
+        if max_distance is None:
+            max_distance = max_edits(prefix)
+        k = k or self.k
+        best = {}  # word -> (distance, count, last_used)
+        first = list(range(len(prefix) + 1))
+        if first[-1] <= max_distance:
+            self._collect(best, self.root, "", first[-1], k)
+        stack = [(self.root, "", first, None, "")]
+        while stack:
+            node, text, row, above, ch = stack.pop()
+            if node.children is None:
+                continue
+            for child in node.children:
+                child_row, child_above, child_ch = row, above, ch
+                for i, next_ch in enumerate(child.label):
+                    next_row = [child_row[0] + 1]
+                    for j in range(1, len(first)):
+                        cost = prefix[j - 1] != next_ch
+                        value = min(next_row[j - 1] + 1, child_row[j] + 1, child_row[j - 1] + cost)
+                        if child_above is not None and j > 1 and prefix[j - 1] == child_ch and prefix[j - 2] == next_ch:
+                            value = min(value, child_above[j - 2] + 1)
+                        next_row.append(value)
+                    child_row, child_above, child_ch = next_row, child_row, next_ch
+                    if min(child_row) > max_distance:
+                        break
+                    if child_row[-1] <= max_distance:
+                        self._collect(best, child, text + child.label, child_row[-1], k)
+                        if child_row[-1] == 0:
+                            break  # nothing below can come any closer
+                else:
+                    stack.append((child, text + child.label, child_row, child_above, child_ch))
+        ranked = sorted(best.items(), key=lambda item: (item[1][0], -item[1][1], -item[1][2], item[0]))
+        return [(distance, count, word) for word, (distance, count, _) in ranked[:k]]
+
+    def _collect(self, best, node, text, distance, k):
+        # Offer the k best words below node to fuzzy()'s results at distance
+        for count, last_used, word in heapq.nsmallest(k, self._words(node, text)):
+            if word not in best or distance < best[word][0]:
+                best[word] = (distance, -count, -last_used)
+
+    def _words(self, node, text):
+        # Every word below node as (-count, -last_used, word) so that smaller is better
+        stack = [(node, text)]
+        while stack:
+            node, text = stack.pop()
+            if node.count is not None:
+                yield -node.count, -node.last_used, text
+            if node.children:
+                for child in node.children:
+                    stack.append((child, text + child.label))
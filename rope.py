@@ -0,0 +1,392 @@
+import random
+from collections import namedtuple
+
+# Maximum number of characters stored in a single leaf of the rope
+LEAF_SIZE = 4096
+
+# A single buffer edit: at offset the text removed was replaced with inserted
+Change = namedtuple("Change", ["offset", "removed", "inserted"])
+
+class RopeNode:
+    # size and lines cache the character and newline counts of the whole subtree,
+    # nl is the newline count of this leaf alone
+    __slots__ = ("text", "nl", "prio", "left", "right", "size", "lines")
+
+    def __init__(self, text):
+        self.text = text
+        self.nl = text.count("\n")
+        self.prio = random.random()
+        self.left = None
+        self.right = None
+        self.size = len(text)
+        self.lines = self.nl
+
+    def set_text(self, text):
+        self.text = text
+        self.nl = text.count("\n")
+
+def _size(node):
+    return node.size if node else 0
+
+def _lines(node):
+    return node.lines if node else 0
+
+def _update(node):
+    node.size = len(node.text) + _size(node.left) + _size(node.right)
+    node.lines = node.nl + _lines(node.left) + _lines(node.right)
+
+def _merge(a, b):
+    # Join two treaps, every character of a comes before every character of b
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+def _split(node, index):
+    # Split a treap into the first index characters and the rest
+    if node is None:
+        return None, None
+    left_size = _size(node.left)
+    if index <= left_size:
+        left, right = _split(node.left, index)
+        node.left = right
+        _update(node)
+        return left, node
+    index -= left_size
+    length = len(node.text)
+    if index >= length:
+        left, right = _split(node.right, index - length)
+        node.right = left
+        _update(node)
+        return node, right
+    # The split point falls inside this leaf, cut the text in two
+    tail = RopeNode(node.text[index:])
+    node.set_text(node.text[:index])
+    right = node.right
+    node.right = None
+    _update(node)
+    return node, _merge(tail, right)
+
+def _build(pieces):
+    # Build a balanced treap over the pieces in O(n)
+    if not pieces:
+        return None
+    nodes = [RopeNode(piece) for piece in pieces]
+
+    def link(lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        node.left = link(lo, mid)
+        node.right = link(mid + 1, hi)
+        _update(node)
+        return node
+
+    root = link(0, len(nodes))
+
+    # Hand out priorities level by level so that parents always outrank their children
+    prios = sorted((random.random() for _ in nodes), reverse=True)
+    level = [root]
+    i = 0
+    while level:
+        next_level = []
+        for node in level:
+            node.prio = prios[i]
+            i += 1
+            if node.left:
+                next_level.append(node.left)
+            if node.right:
+                next_level.append(node.right)
+        level = next_level
+    return root
+
+def _pieces(text):
+    return [text[i:i + LEAF_SIZE] for i in range(0, len(text), LEAF_SIZE)]
+
+def _in_order(changes):
+    # (start, end, inserted) of a run of Changes in the coordinates of the text before the
+    # first one, left to right, or None if the changes overlap or go back and forth.
+    # Each Change is given as if the ones before it had been made.
+    pairs = list(zip(changes, changes[1:]))
+    if all(b.offset >= a.offset + len(a.inserted) for a, b in pairs):
+        edits = []
+        shift = 0
+        for change in changes:
+            start = change.offset - shift
+            edits.append((start, start + len(change.removed), change.inserted))
+            shift += len(change.inserted) - len(change.removed)
+        return edits
+    if all(b.offset + len(b.removed) <= a.offset for a, b in pairs):
+        return [(c.offset, c.offset + len(c.removed), c.inserted) for c in reversed(changes)]
+    return None
+
+def _span(changes):
+    # Offset and length, before and after, of the text a run of Changes touched
+    first = None
+    for change in changes:
+        end = change.offset + len(change.inserted)
+        delta = len(change.inserted) - len(change.removed)
+        if first is None:
+            first, last, total = change.offset, end, delta
+            continue
+        if last >= change.offset + len(change.removed):
+            last += delta
+        elif last >= change.offset:
+            last = end
+        first = min(first, change.offset)
+        last = max(last, end)
+        total += delta
+    return first, last - first - total, last - first
+
+class Rope:
+    # Text buffer stored as a treap of string leaves with cached subtree lengths.
+    # Positional edits cost O(log n) and each leaf holds up to LEAF_SIZE characters,
+    # so the overhead per character stays at a few bytes.
+    def __init__(self, text=""):
+        self.root = _build(_pieces(text))
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        # Build from an iterable of strings, e.g. a file read piece by piece, without
+        # ever joining them into one string
+        rope = cls()
+        pieces = []
+        for chunk in chunks:
+            pieces.extend(_pieces(chunk))
+        rope.root = _build(pieces)
+        return rope
+
+    def __len__(self):
+        return _size(self.root)
+
+    def insert(self, index, char):
+        index = max(0, min(index, len(self)))
+        if not char:
+            return
+        path, offset = self._locate(index)
+        if path and len(path[-1].text) + len(char) <= LEAF_SIZE:
+            # Fast path: the text fits into the leaf at the cursor
+            leaf = path[-1]
+            leaf.set_text(leaf.text[:offset] + char + leaf.text[offset:])
+            newlines = char.count("\n")
+            for node in path:
+                node.size += len(char)
+                node.lines += newlines
+            return
+        left, right = _split(self.root, index)
+        self.root = _merge(_merge(left, _build(_pieces(char))), right)
+
+    def delete(self, index):
+        if index < 0 or index >= len(self):
+            return ""
+        return self._delete_range(index, index + 1)
+
+    def splice(self, offset, length, text):
+        # Replace length characters at offset with text and describe the edit
+        offset = max(0, min(offset, len(self)))
+        length = max(0, min(length, len(self) - offset))
+        removed = self._delete_range(offset, offset + length) if length else ""
+        self.insert(offset, text)
+        return Change(offset, removed, text)
+
+    # Range edits under the names DoublyLinkedList uses, so either can back a buffer
+    def insert_text(self, index, text):
+        self.insert(index, text)
+
+    def delete_range(self, start, end):
+        return self.splice(start, end - start, "").removed
+
+    def replace_range(self, start, end, text):
+        return self.splice(start, end - start, text)
+
+    def apply_changes(self, changes):
+        # Make a run of Changes, each given as if the ones before it were made, and return
+        # one Change equal to all of them. Changes that do not overlap are made with a
+        # single splice, the text from the first to the last is read and rebuilt once.
+        if not changes:
+            return Change(0, "", "")
+        edits = _in_order(changes)
+        if edits is None:
+            offset, old_length, new_length = _span(changes)
+            removed = self.get_range(offset, offset + old_length)
+            for change in changes:
+                self.splice(change.offset, len(change.removed), change.inserted)
+            return Change(offset, removed, self.get_range(offset, offset + new_length))
+        first, last = edits[0][0], edits[-1][1]
+        text = self.get_range(first, last)
+        pieces = []
+        position = first
+        for start, end, inserted in edits:
+            pieces.append(text[position - first:start - first])
+            pieces.append(inserted)
+            position = end
+        pieces.append(text[position - first:])
+        return self.splice(first, last - first, "".join(pieces))
+
+    def get_text(self):
+        return "".join(self.chunks())
+
+    def get_range(self, start, end):
+        # Text between two offsets without materializing the rest of the buffer
+        parts = []
+        wanted = end - start
+        for chunk in self.chunks(start):
+            if wanted <= 0:
+                break
+            parts.append(chunk[:wanted])
+            wanted -= len(chunk)
+        return "".join(parts)
+
+    # Line index. Lines are numbered from 1 and columns from 0 like in tk.Text,
+    # every lookup is a single walk down the tree.
+    def line_count(self):
+        return _lines(self.root) + 1
+
+    def line_start(self, line):
+        # Offset of the first character of a line
+        k = min(line, self.line_count()) - 1
+        if k <= 0:
+            return 0
+        offset = 0
+        node = self.root
+        while node:
+            left_lines = _lines(node.left)
+            if k <= left_lines:
+                node = node.left
+                continue
+            k -= left_lines
+            offset += _size(node.left)
+            if k <= node.nl:
+                pos = -1
+                for _ in range(k):
+                    pos = node.text.find("\n", pos + 1)
+                return offset + pos + 1
+            k -= node.nl
+            offset += len(node.text)
+            node = node.right
+        return offset
+
+    def line_end(self, line):
+        # Offset of the newline ending a line (or the end of the buffer)
+        if line >= self.line_count():
+            return len(self)
+        return self.line_start(line + 1) - 1
+
+    def get_line(self, line):
+        return self.get_range(self.line_start(line), self.line_end(line))
+
+    def offset_to_linecol(self, offset):
+        offset = max(0, min(offset, len(self)))
+        line = 1
+        index = offset
+        node = self.root
+        while node:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+                continue
+            line += _lines(node.left)
+            index -= left_size
+            if index < len(node.text):
+                line += node.text.count("\n", 0, index)
+                break
+            line += node.nl
+            index -= len(node.text)
+            node = node.right
+        return line, offset - self.line_start(line)
+
+    def linecol_to_offset(self, line, col):
+        line = max(1, line)
+        start = self.line_start(line)
+        if line > self.line_count():
+            return len(self)
+        return start + max(0, min(col, self.line_end(line) - start))
+
+    def chunks(self, start=0):
+        # Yield the leaves from left to right, beginning at offset start
+        stack = []
+        node = self.root
+        while node and start > 0:
+            left_size = _size(node.left)
+            if start < left_size:
+                stack.append(node)
+                node = node.left
+            elif start < left_size + len(node.text):
+                yield node.text[start - left_size:]
+                node = node.right
+                break
+            else:
+                start -= left_size + len(node.text)
+                node = node.right
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            if node.text:
+                yield node.text
+            node = node.right
+
+    def _locate(self, index):
+        # Walk down to the leaf where index is, return the path and the offset inside the leaf
+        path = []
+        node = self.root
+        while node:
+            path.append(node)
+            left_size = _size(node.left)
+            if node.left and index <= left_size:
+                node = node.left
+            elif index <= left_size + len(node.text):
+                return path, index - left_size
+            else:
+                index -= left_size + len(node.text)
+                node = node.right
+        return path, 0
+
+    def _delete_range(self, start, end):
+        path, offset = self._locate(start)
+        if path:
+            leaf = path[-1]
+            if offset == len(leaf.text) and offset:
+                # _locate prefers the end of the previous leaf, deletion needs the next one
+                path = None
+            elif offset + (end - start) <= len(leaf.text):
+                removed = leaf.text[offset:offset + end - start]
+                leaf.set_text(leaf.text[:offset] + leaf.text[offset + end - start:])
+                newlines = removed.count("\n")
+                for node in path:
+                    node.size -= end - start
+                    node.lines -= newlines
+                if not leaf.text:
+                    self._unlink(path)
+                return removed
+        left, rest = _split(self.root, start)
+        middle, right = _split(rest, end - start)
+        removed = "".join(Rope._from_root(middle).chunks())
+        self.root = _merge(left, right)
+        return removed
+
+    def _unlink(self, path):
+        # Remove an empty leaf from the tree
+        node = path[-1]
+        replacement = _merge(node.left, node.right)
+        if len(path) == 1:
+            self.root = replacement
+        elif path[-2].left is node:
+            path[-2].left = replacement
+        else:
+            path[-2].right = replacement
+
+    @staticmethod
+    def _from_root(root):
+        rope = Rope()
+        rope.root = root
+        return rope
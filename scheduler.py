@@ -0,0 +1,108 @@
+import queue
+import threading
+
+# Default debounce delay and result polling interval in milliseconds
+DEBOUNCE_MS = 40
+POLL_MS = 10
+
+class BackgroundScheduler:
+    # Coalesces bursts of requests through after(), runs the heavy part on a worker
+    # thread and hands the result back to the Tk thread. Every request has a key,
+    # a newer request for the same key makes older ones stale: they are skipped
+    # before they start, told to stop while running and never applied.
+    def __init__(self, widget, delay=DEBOUNCE_MS, poll=POLL_MS):
+        self.widget = widget
+        self.delay = delay
+        self.poll = poll
+        self.pending = {}  # key -> id of the after() call waiting for the burst to end
+        self.generation = {}  # key -> number of the newest request
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.outstanding = 0
+        self.worker = threading.Thread(target=self.work, daemon=True)
+        self.worker.start()
+
+    def schedule(self, key, prepare, compute, apply, delay=None, partial=None, discard=None):
+        # prepare() runs on the Tk thread once the burst is over and snapshots the input,
+        # compute(input, cancelled) runs on the worker and apply(result) on the Tk thread again.
+        # With partial given compute is called as compute(input, cancelled, emit), and every
+        # emit(part) reaches partial(part) on the Tk thread while compute is still running.
+        # discard(result) gets a result that went stale instead, e.g. to remove a file it wrote,
+        # on the worker or on the Tk thread.
+        generation = self.generation.get(key, 0) + 1
+        self.generation[key] = generation
+        if key in self.pending:
+            self.widget.after_cancel(self.pending[key])
+        self.pending[key] = self.widget.after(
+            self.delay if delay is None else delay,
+            lambda: self.submit(key, generation, prepare, compute, apply, partial, discard),
+        )
+
+    def debounce(self, key, callback, delay=None):
+        # Run callback on the Tk thread once, after the last call in a burst
+        self.schedule(key, lambda: None, None, lambda result: callback(), delay)
+
+    def cancel(self, key):
+        self.generation[key] = self.generation.get(key, 0) + 1
+        if key in self.pending:
+            self.widget.after_cancel(self.pending.pop(key))
+
+    def is_stale(self, key, generation):
+        return self.generation.get(key) != generation
+
+    def submit(self, key, generation, prepare, compute, apply, partial=None, discard=None):
+        del self.pending[key]
+        data = prepare()
+        if compute is None:
+            apply(data)
+            return
+        self.jobs.put((key, generation, data, compute, apply, partial, discard))
+        self.outstanding += 1
+        if self.outstanding == 1:
+            self.widget.after(self.poll, self.deliver)
+
+    def work(self):
+        while True:
+            key, generation, data, compute, apply, partial, discard = self.jobs.get()
+            result = None
+            if not self.is_stale(key, generation):
+                cancelled = lambda: self.is_stale(key, generation)
+                try:
+                    if partial is None:
+                        result = compute(data, cancelled)
+                    else:
+                        emit = lambda part: self.results.put((key, generation, part, partial, False, None))
+                        result = compute(data, cancelled, emit)
+                    if cancelled():
+                        self.drop(result, discard)
+                        result = None
+                except Exception as e:
+                    result = e
+            self.results.put((key, generation, result, apply, True, discard))
+
+    def deliver(self):
+        # Apply finished results that are still current, keep polling while jobs are running
+        error = None
+        while True:
+            try:
+                key, generation, result, apply, final, discard = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if final:
+                self.outstanding -= 1
+            if result is None or self.is_stale(key, generation):
+                # No longer wanted, and neither is the error it may have run into
+                self.drop(result, discard)
+                continue
+            if isinstance(result, Exception):
+                error = result
+            else:
+                apply(result)
+        if self.outstanding:
+            self.widget.after(self.poll, self.deliver)
+        if error:
+            raise error
+
+    def drop(self, result, discard):
+        if discard is not None and result is not None and not isinstance(result, Exception):
+            discard(result)
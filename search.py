@@ -0,0 +1,291 @@
+import multiprocessing
+import operator
+import re
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
+
+from fileio import whole_lines
+from rope import Change, Rope
+
+# Characters searched per slice, slices end at a newline so no match is cut in two
+SCAN_CHUNK = 1 << 20
+# Seconds a typed regex may spend on one slice before the search is given up, and how
+# often the waiting thread checks whether the search was cancelled meanwhile
+REGEX_TIMEOUT = 2.0
+REGEX_POLL = 0.05
+
+class SearchTimeout(Exception):
+    pass
+
+@lru_cache(maxsize=64)
+def compile_query(query, regex=False, whole_word=False, case_sensitive=False):
+    # Compiled pattern of a query, cached since live search compiles on every keystroke.
+    # Raises re.error for a regex that does not compile.
+    pattern = query if regex else re.escape(query)
+    if whole_word:
+        pattern = rf"\b(?:{pattern})\b"
+    flags = re.MULTILINE
+    if not case_sensitive:
+        flags |= re.IGNORECASE
+    return re.compile(pattern, flags)
+
+def line_slices(buffer, start=0, end=None, size=SCAN_CHUNK):
+    # (offset, text) pieces of the buffer between two offsets, each ending at a line break
+    end = len(buffer) if end is None else end
+    while start < end:
+        text = whole_lines(buffer.get_range(start, min(end, start + size)), start + size >= end)
+        yield start, text
+        start += len(text)
+
+def _find(pattern, offset, text):
+    # Start and end offsets of the matches in one slice. Empty matches and the ones a
+    # regex stretched over a line break are left out, matches stay within one line.
+    starts = []
+    ends = []
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        if end > start and text.find("\n", start, end) < 0:
+            starts.append(offset + start)
+            ends.append(offset + end)
+    return starts, ends
+
+def _match_process(conn, pattern, flags):
+    # Child process of _find_in_process, answers every slice it is sent until None arrives
+    pattern = re.compile(pattern, flags)
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        conn.send(_find(pattern, *job))
+
+def _find_in_process(pattern, slices, cancelled):
+    # re holds the GIL until a match attempt is over, a typed pattern that backtracks
+    # exponentially would freeze the Tk thread too. Such patterns run in a child
+    # process instead, which is killed when the search is cancelled or takes too long.
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_match_process, args=(child_conn, pattern.pattern, pattern.flags), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        for offset, text in slices:
+            conn.send((offset, text))
+            waited = 0
+            while not conn.poll(REGEX_POLL):
+                if cancelled():
+                    return
+                waited += REGEX_POLL
+                if waited >= REGEX_TIMEOUT:
+                    raise SearchTimeout(pattern.pattern)
+            yield conn.recv()
+        conn.send(None)
+    finally:
+        conn.close()
+        process.terminate()
+        process.join()
+
+def find_in_slices(pattern, slices, safe, cancelled=lambda: False):
+    # (starts, ends) of every slice in turn. safe=False runs the pattern in a child
+    # process, see _find_in_process. Stops early once cancelled() is true.
+    if not safe:
+        yield from _find_in_process(pattern, slices, cancelled)
+        return
+    for offset, text in slices:
+        if cancelled():
+            return
+        yield _find(pattern, offset, text)
+
+def stream_search(index, buffer, cancelled, emit):
+    # Worker side of a background search: the matches of every slice of buffer are
+    # passed to emit(starts, ends) as soon as they are found. Returns "" when the
+    # search is done, a message when it failed and None when it was cancelled.
+    try:
+        for starts, ends in find_in_slices(index.pattern, line_slices(buffer), index.safe, cancelled):
+            if starts:
+                emit(starts, ends)
+    except SearchTimeout:
+        return "Pattern too slow"
+    return None if cancelled() else ""
+
+def scan_snapshot(snapshot, cancelled, emit):
+    # stream_search over (index, leaves of a rope), the leaves make the rope again cheaply
+    index, leaves = snapshot
+    return stream_search(index, Rope.from_chunks(leaves), cancelled, lambda starts, ends: emit((starts, ends)))
+
+def scan_ranges(snapshot, cancelled):
+    # Worker side of searching the lines an edit touched again, snapshot is
+    # (index, [(offset, text)]). Returns the [(starts, ends)] to pass to index.fill().
+    index, slices = snapshot
+    try:
+        found = list(find_in_slices(index.pattern, slices, index.safe, cancelled))
+    except SearchTimeout:
+        return None
+    return None if cancelled() else found
+
+def replacement_changes(buffer, starts, ends, replacement):
+    # Changes replacing sorted, non-overlapping matches, each given as if the ones before
+    # it were made, for Rope.apply_changes(). The text they span is read only once.
+    first = starts[0]
+    text = buffer.get_range(first, ends[-1])
+    changes = []
+    shift = 0
+    for start, end in zip(starts, ends):
+        changes.append(Change(start + shift, text[start - first:end - first], replacement))
+        shift += len(replacement) - (end - start)
+    return changes
+
+class ShiftedList:
+    # Sorted values that an edit moves along below the edited place, like match offsets.
+    # Moving the whole tail on every keystroke would cost as much as the matches below the
+    # cursor, so the values from split on are stored without a pending delta, which is
+    # added while reading them. An edit moves the split point to itself and grows the
+    # delta, typing in one place only touches the values between two edits.
+    # move(value, delta) shifts a value, operator.add for offsets.
+    def __init__(self, values=(), move=operator.add):
+        self.values = list(values)
+        self.split = len(self.values)
+        self.delta = 0
+        self.move = move
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self.values)))]
+        if i < 0:
+            i += len(self.values)
+        value = self.values[i]
+        return value if i < self.split else self.move(value, self.delta)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def move_split(self, i):
+        # Give the values before i their delta, take it away from the ones after
+        if self.delta == 0 or i == self.split:
+            pass
+        elif i < self.split:
+            self.values[i:self.split] = [self.move(value, -self.delta) for value in self.values[i:self.split]]
+        else:
+            self.values[self.split:i] = [self.move(value, self.delta) for value in self.values[self.split:i]]
+        self.split = i
+
+    def splice(self, i, j, values, delta=0):
+        # Replace the values i to j and move the ones after them by delta
+        self.move_split(j)
+        self.values[i:j] = values
+        self.split = i + len(values)
+        self.delta += delta
+        if self.split == len(self.values):
+            self.delta = 0
+
+    def extend(self, values):
+        self.values += [self.move(value, -self.delta) for value in values] if self.delta else values
+
+    def bisect_left(self, value):
+        i = bisect_left(self.values, value, 0, self.split)
+        return i if i < self.split else bisect_left(self.values, self.move(value, -self.delta), i)
+
+    def bisect_right(self, value):
+        i = bisect_right(self.values, value, 0, self.split)
+        return i if i < self.split else bisect_right(self.values, self.move(value, -self.delta), i)
+
+class SearchIndex:
+    # Every match of a query in the buffer as sorted start and end offsets. Matches never
+    # span a line break, so after an edit only the lines it touched are searched again
+    # and the matches below them are shifted, instead of searching the whole buffer.
+    # A typed regex is never run on the calling thread: changed() only marks the edited
+    # lines dirty, and they are searched in the background through scan_ranges().
+    def __init__(self, query, regex=False, whole_word=False, case_sensitive=False):
+        self.query = query
+        self.pattern = compile_query(query, regex, whole_word, case_sensitive)
+        self.safe = not regex  # an escaped query matches in linear time, a typed regex may not
+        self.starts = ShiftedList()
+        self.ends = ShiftedList()
+        self.complete = False  # whether the whole buffer has been searched
+        self.dirty = []  # sorted (first, last) offsets of lines still to be searched again
+
+    def __len__(self):
+        return len(self.starts)
+
+    def scan(self, buffer, start=0, end=None):
+        # Matches between two offsets, which must be line boundaries
+        starts = []
+        ends = []
+        for found in find_in_slices(self.pattern, line_slices(buffer, start, end), True):
+            starts += found[0]
+            ends += found[1]
+        return starts, ends
+
+    def search(self, buffer):
+        # Search the whole buffer on this thread, only for safe queries
+        starts, ends = self.scan(buffer)
+        self.starts = ShiftedList(starts)
+        self.ends = ShiftedList(ends)
+        self.complete = True
+
+    def add(self, starts, ends):
+        # Matches found by a background search, which runs from the top of the buffer down
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+
+    def fill(self, found):
+        # Matches of the dirty lines, as returned by scan_ranges() for the current dirty list
+        for starts, ends in found:
+            i = self.starts.bisect_left(starts[0]) if starts else 0
+            self.starts.splice(i, i, starts)
+            self.ends.splice(i, i, ends)
+        self.dirty = []
+
+    def dirty_slices(self, buffer):
+        # Snapshot of the dirty lines for scan_ranges()
+        return [(first, buffer.get_range(first, last)) for first, last in self.dirty]
+
+    def changed(self, buffer, change):
+        # Call after change has been applied to buffer
+        line, col = buffer.offset_to_linecol(change.offset)
+        first = change.offset - col
+        line, col = buffer.offset_to_linecol(change.offset + len(change.inserted))
+        last = buffer.line_end(line)
+        delta = len(change.inserted) - len(change.removed)
+        # Matches that started on the edited lines are replaced, the ones below move along
+        i = self.starts.bisect_left(first)
+        j = self.starts.bisect_right(last - delta)
+        if self.safe:
+            starts, ends = self.scan(buffer, first, last)
+        else:
+            starts, ends = [], []
+            self.mark_dirty(first, last, delta)
+        self.starts.splice(i, j, starts, delta)
+        self.ends.splice(i, j, ends, delta)
+
+    def mark_dirty(self, first, last, delta):
+        # Shift the dirty ranges below an edit of [first, last - delta], merging overlaps
+        dirty = []
+        for start, end in self.dirty:
+            if end < first:
+                dirty.append((start, end))
+            elif start > last - delta:
+                dirty.append((start + delta, end + delta))
+            else:
+                first, last = min(first, start), max(last, end + delta)
+        insort(dirty, (first, last))
+        self.dirty = dirty
+
+    def between(self, start, end):
+        # Index range of the matches that start between two offsets
+        return self.starts.bisect_left(start), self.starts.bisect_right(end)
+
+    def next_match(self, offset):
+        # Index of the first match starting at or after offset, wrapping around to the top
+        if not self.starts:
+            return None
+        i = self.starts.bisect_left(offset)
+        return i if i < len(self.starts) else 0
+
+    def previous_match(self, offset):
+        # Index of the last match starting before offset, wrapping around to the bottom
+        if not self.starts:
+            return None
+        i = self.starts.bisect_left(offset) - 1
+        return i if i >= 0 else len(self.starts) - 1
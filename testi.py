@@ -2,52 +2,102 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, Text, ttk
 from abc import ABC, abstractmethod
 import keyword
+import os
 import re
 import tkinter.font
+from highlighter import IncrementalHighlighter, apply_line_tags, visible_lines
+from scheduler import BackgroundScheduler
+from trie import Trie
+from fileio import FILL_CHUNK, read_chunks, write_atomic
+from rope import Rope
+from search import SearchIndex, ShiftedList, scan_ranges, stream_search
+from perf import PerfOverlay, recorder, timed
+
+# Undo steps kept by the Text widget, older ones are dropped. Tk keeps the history
+# itself and can only cap it by steps, it does not tell how big a step is or where it
+# splits steps on its own, so unlike undo.UndoStack in testnumber2 this is no memory cap.
+UNDO_STEPS = 1000
+# Lines copied out of the Text widget per turn of the event loop while saving
+SAVE_LINES = 5000
+
+# Python keywords as a trie, for completions that tolerate typos
+KEYWORD_TRIE = Trie()
+for word in keyword.kwlist:
+    KEYWORD_TRIE.insert(word, count=0)
 
 # Defining syntax highlighting function
-def syntax_highlight(text_widget: Text):
-    # Remove previous tags for syntax highlighting
-    text_widget.tag_remove("keyword", "1.0", "end")
-    text_widget.tag_remove("string", "1.0", "end")
-    text_widget.tag_remove("comment", "1.0", "end")
-
-    # Get all text from the Text widget
-    text_content = text_widget.get("1.0", "end-1c")
-
-    # Highlight keywords in blue (only standalone words)
-    lines = text_content.split("\n")
-    for line_number, line in enumerate(lines, start=1):
-        words = line.split()
-        for word in words:
-            if word in keyword.kwlist:  # Check if the word is a Python keyword
-                start = f"{line_number}.{line.find(word)}"
-                end = f"{start}+{len(word)}c"
-                text_widget.tag_add("keyword", start, end)
+def syntax_highlight(text_widget: Text, highlighter: IncrementalHighlighter):
+    # Re-lex only the lines edited since the last call and retag the ones on screen,
+    # lines scrolled out of view are tagged when they become visible
+    line_count = int(text_widget.index("end-1c").split(".")[0])
+    first, last = visible_lines(text_widget)
+    runs = highlighter.update(lambda line: text_widget.get(f"{line}.0", f"{line}.end"), line_count, first, last)
+    apply_line_tags(text_widget, runs)
+    configure_tags(text_widget)
+
+def configure_tags(text_widget: Text):
     text_widget.tag_config("keyword", foreground="blue", font=("Arial", 10, "bold"))
-
-    # Highlight strings in green
-    start = "1.0"
-    while True:
-        start = text_widget.search(r'".*?"', start, stopindex="end", regexp=True)
-        if not start:
-            break
-        end = f"{start}+{len(text_widget.get(start, f'{start} lineend'))}c"
-        text_widget.tag_add("string", start, end)
-        start = end
     text_widget.tag_config("string", foreground="green", font=("Arial", 10, "bold"))
-
-    # Highlight comments in gray
-    start = "1.0"
-    while True:
-        start = text_widget.search(r"#.*", start, stopindex="end", regexp=True)
-        if not start:
-            break
-        line_end = start.split('.')[0] + '.end'
-        text_widget.tag_add("comment", start, line_end)
-        start = line_end
     text_widget.tag_config("comment", foreground="gray", font=("Arial", 10, "bold"))
 
+# Highlighting work done on the scheduler's worker thread
+@timed("highlight")
+def compute_highlight(snapshot, cancelled):
+    highlighter, start, lines, line_count, first, last = snapshot
+    runs = highlighter.update(lambda line: lines[line - start], line_count, first, last, cancelled)
+    return None if runs is None else (highlighter, runs)
+
+# Keyword lookup done on the scheduler's worker thread
+@timed("suggestions")
+def match_keywords(last_word, cancelled):
+    if not last_word:
+        return []
+    matches = [word for word in keyword.kwlist if word.lower().startswith(last_word.lower())]
+    if not matches:
+        # No keyword starts with it, so try again allowing for a typo such as "retrun"
+        matches = [word for _, _, word in KEYWORD_TRIE.fuzzy(last_word)]
+    return matches
+
+# Searching done on the scheduler's worker thread, the matches of every slice are
+# streamed back as (line, col) pairs while the rest is still being searched
+def find_matches(snapshot, cancelled, emit):
+    index, text = snapshot
+    buffer = Rope(text)
+    linecol = buffer.offset_to_linecol
+    return stream_search(index, buffer, cancelled, lambda starts, ends: emit([(linecol(start), linecol(end)) for start, end in zip(starts, ends)]))
+
+# Searching the lines edited since a search finished again, snapshot is (index, [(first, last, text)])
+# with a run of lines each. Returns [(first, last, matches as (line, col) pairs)], None if the pattern
+# was too slow
+def shift_lines(match, delta):
+    # A match of ((line, col), (line, col)) moved down by delta lines, for ShiftedList
+    return tuple((line + delta, col) for line, col in match)
+
+def find_line_matches(snapshot, cancelled):
+    index, runs = snapshot
+    found = scan_ranges((index, [(0, text) for _, _, text in runs]), cancelled)
+    if found is None:
+        return None
+    result = []
+    for (first, last, text), (starts, ends) in zip(runs, found):
+        linecol = Rope(text).offset_to_linecol
+        matches = []
+        for start, end in zip(starts, ends):
+            (line, col), (end_line, end_col) = linecol(start), linecol(end)
+            matches.append(((line + first - 1, col), (end_line + first - 1, end_col)))
+        result.append((first, last, matches))
+    return result
+
+# Saving done on the scheduler's worker thread
+@timed("save")
+def write_snapshot(snapshot, cancelled):
+    file_path, parts = snapshot
+    try:
+        write_atomic(file_path, parts)
+    except OSError as e:
+        return file_path, e
+    return file_path, None
+
 # Autocomplete function for Python keywords
 def autocomplete(event, text_widget: Text):
     typed_text = text_widget.get("insert-1c", "insert")  # Get last typed character
@@ -68,6 +118,47 @@ def autocomplete(event, text_widget: Text):
             text_widget.delete(start_pos, end_pos)  # Removing the incomplete word
             text_widget.insert("insert", match)  # Inserting the matching keyword
 
+# Line number gutter. Only the lines on screen are drawn, each at the y dlineinfo gives
+# for its first display line, so the numbers stay next to wrapped lines too.
+class LineNumbers(tk.Canvas):
+    def __init__(self, parent, text_widget, font, **kwargs):
+        super().__init__(parent, highlightthickness=0, **kwargs)
+        self.text_widget = text_widget
+        self.font = tkinter.font.Font(font=font)
+        self.drawn = None  # (rows, width) on the canvas, to skip redraws that change nothing
+        self.pending = False
+
+    def schedule(self, event=None):
+        # Redraw once the current burst of edits, scrolling or resizing is over
+        if not self.pending:
+            self.pending = True
+            self.after_idle(self.redraw)
+
+    @timed("line_numbers")
+    def redraw(self):
+        self.pending = False
+        text = self.text_widget
+        last = int(text.index("end-1c").split(".")[0])
+        rows = []
+        index = text.index("@0,0")  # the top line may have scrolled partly out of view
+        line = int(index.split(".")[0])
+        while line <= last:
+            info = text.dlineinfo(index)
+            if info is None:
+                break
+            rows.append((line, info[1]))
+            line += 1
+            index = f"{line}.0"
+        width = self.font.measure("0" * len(str(last))) + 10
+        if (rows, width) == self.drawn:
+            return
+        if self.drawn is None or self.drawn[1] != width:
+            self.config(width=width)  # room for the digits of the last line
+        self.drawn = (rows, width)
+        self.delete("all")
+        for line, y in rows:
+            self.create_text(width - 5, y, anchor="ne", text=str(line), font=self.font)
+
 # Abstract class for Blocks defining the interface for all blocks(=buttons) for the ribbon
 class Block(ttk.Frame, ABC):
     def __init__(self, parent):
@@ -137,27 +228,76 @@ class NotesApp(tk.Tk):
         edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
         edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
         menu_bar.add_cascade(label="Edit", menu=edit_menu)
+
+        # View menu
+        view_menu = tk.Menu(menu_bar, tearoff=0)
+        self.show_perf = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Performance overlay", variable=self.show_perf, command=self.toggle_perf_overlay)
+        view_menu.add_command(label="Save performance trace...", command=self.save_perf_trace)
+        menu_bar.add_cascade(label="View", menu=view_menu)
         
         self.config(menu=menu_bar)
 
         # Search Bar
         self.search_entry = tk.Entry(self.top_frame, width=20)
         self.search_entry.pack(side=tk.RIGHT, padx=5)
+        self.search_entry.bind("<Return>", self.search_word)
+        self.search_entry.bind("<KeyRelease>", self.on_search_typed)
         self.search_button = tk.Button(self.top_frame, text="Search", command=self.search_word, bg="lightblue")
         self.search_button.pack(side=tk.RIGHT, padx=5)
+        self.next_button = tk.Button(self.top_frame, text="Next", command=self.next_match)
+        self.next_button.pack(side=tk.RIGHT)
+        self.previous_button = tk.Button(self.top_frame, text="Prev", command=self.previous_match)
+        self.previous_button.pack(side=tk.RIGHT)
+        self.match_label = tk.Label(self.top_frame, width=14)
+        self.match_label.pack(side=tk.RIGHT)
+        self.search_regex = tk.BooleanVar(value=False)
+        self.search_whole_word = tk.BooleanVar(value=False)
+        self.search_case = tk.BooleanVar(value=False)
+        for label, variable in (("Match case", self.search_case), ("Whole word", self.search_whole_word), ("Regex", self.search_regex)):
+            tk.Checkbutton(self.top_frame, text=label, variable=variable, command=self.start_search).pack(side=tk.RIGHT)
+        self.search_query = None  # (query, regex, whole word, match case) of the last search
+        self.search_index = None  # query of the last search, and the lines edited since it finished
+        self.matches = ShiftedList(move=shift_lines)  # ((line, col), (line, col)) of every match, in order
+        self.current_match = None
+        self.search_fresh = False  # the next matches found replace the ones shown
+
+        # Status line for loading progress and the like
+        self.status = tk.Label(self, anchor="w")
+        self.status.pack(fill=tk.X, side=tk.BOTTOM)
+        self.load_id = 0
+        self.loading = False  # True while a file is streamed into the widget, it is not saved then
+        self.save_id = 0
+        self.save_parts = None  # text copied for a save so far, SAVE_LINES lines a part
+        self.save_line = 1  # first line not copied yet
+        self.perf_overlay = PerfOverlay(self)
 
         # Frame for line numbers and main text
         self.text_frame = tk.Frame(self)
         self.text_frame.pack(expand=True, fill=tk.BOTH)
 
-        # Line number display
-        self.line_numbers = tk.Text(self.text_frame, width=4, bg="#f0f0f0", state="disabled", wrap="none", font=("Arial", 10))
-        self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
-
         # Text Area
-        self.text_area = tk.Text(self.text_frame, wrap="word", undo=True, bg="#ffffff", highlightthickness=0, relief="flat", font=("Arial", 10))
+        self.text_area = tk.Text(self.text_frame, wrap="word", undo=True, maxundo=UNDO_STEPS, bg="#ffffff", highlightthickness=0, relief="flat", font=("Arial", 10))
+
+        # Line number display, packed first so it sits left of the text
+        self.line_numbers = LineNumbers(self.text_frame, self.text_area, ("Arial", 10), bg="#f0f0f0")
+        self.line_numbers.pack(side=tk.LEFT, fill=tk.Y)
         self.text_area.pack(expand=True, fill=tk.BOTH)
 
+        # Highlighting and suggestions are computed off the Tk thread once a burst of keys is over
+        self.scheduler = BackgroundScheduler(self)
+        configure_tags(self.text_area)
+
+        # Route the Text widget's Tcl command through a proxy so that every edit
+        # (typing, paste, undo, open) tells the highlighter which lines it touched
+        self.highlighter = IncrementalHighlighter()
+        self.text_orig = self.text_area._w + "_orig"
+        self.tk.call("rename", self.text_area._w, self.text_orig)
+        self.tk.createcommand(self.text_area._w, self.text_proxy)
+
+        # Highlight lines that scroll into view
+        self.text_area.config(yscrollcommand=self.on_text_scroll)
+
         # Keyboard shortcuts
         self.bind_all("<Control-o>", lambda event: self.open_file()) # Keyboard shortcut for open
         self.bind_all("<Control-s>", lambda event: self.save_file()) # Keyboard shortcut for save
@@ -179,12 +319,7 @@ class NotesApp(tk.Tk):
         self.text_area.bind("<space>", self.hide_suggestion_box)
         self.text_area.bind("<FocusOut>", self.hide_suggestion_box)
         self.text_area.bind("<Tab>", self.complete_autocomplete)
-        self.text_area.bind("<MouseWheel>", self.on_mouse_wheel)
-        self.text_area.bind("<Button-1>", self.on_click)
-        self.text_area.bind("<Configure>", self.update_line_numbers)
-
-        # Initialize line numbers
-        self.update_line_numbers()
+        self.text_area.bind("<Configure>", self.line_numbers.schedule)
 
         # File Path
         self.file_path = None
@@ -196,13 +331,63 @@ class NotesApp(tk.Tk):
 
         self.protocol("WM_DELETE_WINDOW", lambda: self.close())
     
-    def update_line_numbers(self, event=None):
-        line_count = int(self.text_area.index("end-1c").split('.')[0])
-        self.line_numbers.config(state="normal")
-        self.line_numbers.delete(1.0, "end")
-        for i in range(1, line_count + 1):
-            self.line_numbers.insert("end", f"{i}\n")
-        self.line_numbers.config(state="disabled")
+    def text_proxy(self, command, *args):
+        if command not in ("insert", "delete", "replace") or not args:
+            return self.tk.call((self.text_orig, command) + args)
+        return self.edit_text(command, args)
+
+    @timed("refresh_text")
+    def edit_text(self, command, args):
+        # Lines covered by the edit before it happens
+        before = self.line_of("end-1c")
+        first = min(self.line_of(args[0]), before)
+        if command == "insert":
+            last = first
+        elif len(args) > 1:
+            last = min(self.line_of(args[1]), before)
+        else:
+            last = min(self.line_of(f"{args[0]}+1c"), before)
+        old_count = max(1, last - first + 1)
+
+        if self.save_parts is not None and first < self.save_line:
+            # Lines already copied for a save are changing, copy them again from their part on
+            del self.save_parts[(first - 1) // SAVE_LINES:]
+            self.save_line = len(self.save_parts) * SAVE_LINES + 1
+
+        result = self.tk.call((self.text_orig, command) + args)
+        self.highlighter.lines_changed(first, old_count, old_count + self.line_of("end-1c") - before)
+        self.schedule_highlight()
+        self.line_numbers.schedule()  # lines can rewrap without the view moving
+        if self.search_query:
+            self.search_changed(first, old_count, old_count + self.line_of("end-1c") - before)
+        return result
+
+    def on_text_scroll(self, first, last):
+        # Called by the Text widget whenever its view changes
+        self.schedule_highlight()
+        self.line_numbers.schedule()
+
+    def schedule_highlight(self):
+        self.scheduler.schedule("highlight", self.prepare_highlight, compute_highlight, self.apply_highlight)
+
+    def prepare_highlight(self):
+        # Snapshot the highlighter and the only lines it may need to lex: from the first
+        # dirty line (or the top of the window) down to the bottom of the window
+        line_count = self.line_of("end-1c")
+        first, last = visible_lines(self.text_area)
+        last = min(last, line_count)
+        start = min([first] + [run[0] for run in self.highlighter.dirty])
+        lines = self.text_area.get(f"{start}.0", f"{last}.end").split("\n")
+        return self.highlighter.copy(), start, lines, line_count, first, last
+
+    @timed("highlight.apply")
+    def apply_highlight(self, result):
+        # No edit happened since the snapshot, so the worker's copy becomes the highlighter
+        self.highlighter, runs = result
+        apply_line_tags(self.text_area, runs)
+
+    def line_of(self, index):
+        return int(str(self.tk.call(self.text_orig, "index", index)).split(".")[0])
 
     def update_title(self):
         if self.file_path:
@@ -222,26 +407,149 @@ class NotesApp(tk.Tk):
             self.suggestion_box.place(x=abs_x - self.winfo_rootx(), y=abs_y - self.winfo_rooty())
             self.suggestion_box.lift()
 
-    def search_word(self):
+    def search_word(self, event=None):
         # Getting the word to search
         search_term = self.search_entry.get()
         if not search_term:
             messagebox.showinfo("Info", "Please enter a word to search.")
             return
+        self.start_search(True)
+
+    def on_search_typed(self, event):
+        # Search as the query is typed, Return is handled by search_word
+        if event.keysym != "Return":
+            self.start_search()
+
+    def start_search(self, jump=False):
+        query = self.search_entry.get()
+        self.search_query = None
+        if query:
+            options = (query, self.search_regex.get(), self.search_whole_word.get(), self.search_case.get())
+            try:
+                SearchIndex(*options)
+                self.search_query = options
+            except re.error:
+                self.scheduler.cancel("search")
+                self.show_matches([], "Invalid pattern")
+                return
+        if self.search_query:
+            self.schedule_search(jump)
+        else:
+            self.scheduler.cancel("search")
+            self.show_matches([], "")
+
+    def schedule_search(self, jump):
+        # Search a snapshot of the text in Python on the worker, again after every burst of edits.
+        # A typed regex runs in a child process there, see search.find_in_slices.
+        self.scheduler.schedule(
+            "search",
+            self.search_snapshot,
+            find_matches,
+            lambda message: self.search_done(message, jump),
+            delay=0 if jump else None,
+            partial=self.add_matches,
+        )
+
+    def search_snapshot(self):
+        self.search_fresh = True
+        self.search_index = SearchIndex(*self.search_query)
+        return self.search_index, self.text_area.get("1.0", "end-1c")
+
+    def search_changed(self, first, old_count, new_count):
+        # Lines first .. first + old_count - 1 were replaced with new_count lines
+        if self.search_index is None or not self.search_index.complete:
+            # An unfinished search read the text from before the edit, it has to start over
+            self.schedule_search(False)
+            return
+        # Matches never span a line break: the ones on the edited lines are found again in the
+        # background, the ones below move along. The widget addresses text by line, so the
+        # index's dirty runs are kept in lines here rather than in offsets.
+        delta = new_count - old_count
+        i = self.matches.bisect_left(((first, 0),))
+        j = self.matches.bisect_left(((first + old_count, 0),))
+        self.matches.splice(i, j, [], delta)
+        self.search_index.mark_dirty(first, first + new_count - 1, delta)
+        self.scheduler.schedule("search", self.dirty_lines_snapshot, find_line_matches, self.fill_matches)
+
+    def dirty_lines_snapshot(self):
+        line_count = self.line_of("end-1c")
+        runs = [(first, min(last, line_count)) for first, last in self.search_index.dirty if first <= line_count]
+        return self.search_index, [(first, last, self.text_area.get(f"{first}.0", f"{last}.end")) for first, last in runs]
+
+    def fill_matches(self, found):
+        if found is None:
+            self.search_index.complete = False
+            self.match_label.config(text="Pattern too slow")
+            return
+        for first, last, matches in found:
+            self.text_area.tag_remove("search_highlight", f"{first}.0", f"{last}.end")
+            i = self.matches.bisect_left(((first, 0),))
+            self.matches.splice(i, i, matches)
+            indexes = [f"{line}.{col}" for match in matches for line, col in match]
+            if indexes:
+                self.text_area.tag_add("search_highlight", *indexes)
+        self.search_index.dirty = []
+        self.match_label.config(text=f"{len(self.matches)} matches")
+
+    def add_matches(self, matches):
+        # One Tcl call tags the matches of a whole slice instead of one search round trip per match
+        if self.search_fresh:
+            self.show_matches([], "")
+        indexes = [f"{line}.{col}" for match in matches for line, col in match]
+        self.text_area.tag_add("search_highlight", *indexes)
+        self.matches.extend(matches)
+        self.match_label.config(text=f"{len(self.matches)} matches...")
+
+    def search_done(self, message, jump):
+        if self.search_fresh:
+            self.show_matches([], message)
+        self.search_index.complete = not message
+        if message:
+            self.match_label.config(text=message)
+        elif jump:
+            self.next_match(0)
+        else:
+            self.match_label.config(text=f"{len(self.matches)} matches")
 
-        # Removing previous search highlights
+    def show_matches(self, matches, label):
+        self.search_fresh = False
+        self.matches = ShiftedList(matches, shift_lines)
+        self.current_match = None
         self.text_area.tag_remove("search_highlight", "1.0", "end")
-
-        # Highlighting all occurrences of the search term
-        start = "1.0"
-        while True:
-            start = self.text_area.search(search_term, start, stopindex="end", nocase=True)  # Case-insensitive search
-            if not start:
-                break
-            end = f"{start}+{len(search_term)}c"
-            self.text_area.tag_add("search_highlight", start, end)
-            start = end
+        self.text_area.tag_remove("search_current", "1.0", "end")
         self.text_area.tag_config("search_highlight", background="yellow")
+        self.text_area.tag_config("search_current", background="orange")
+        self.match_label.config(text=label)
+
+    def next_match(self, skip=1):
+        if not self.matches:
+            self.goto_match(None)
+            return
+        i = self.matches.bisect_left((self.cursor_linecol(skip),))
+        self.goto_match(i if i < len(self.matches) else 0)
+
+    def previous_match(self):
+        if not self.matches:
+            self.goto_match(None)
+            return
+        i = self.matches.bisect_left((self.cursor_linecol(0),)) - 1
+        self.goto_match(i if i >= 0 else len(self.matches) - 1)
+
+    def cursor_linecol(self, skip):
+        line, col = self.text_area.index(f"insert+{skip}c").split(".")
+        return int(line), int(col)
+
+    def goto_match(self, i):
+        self.current_match = i
+        self.text_area.tag_remove("search_current", "1.0", "end")
+        if i is None:
+            self.match_label.config(text="No matches")
+            return
+        (line, col), (end_line, end_col) = self.matches[i]
+        self.text_area.tag_add("search_current", f"{line}.{col}", f"{end_line}.{end_col}")
+        self.text_area.mark_set(tk.INSERT, f"{line}.{col}")
+        self.text_area.see(tk.INSERT)
+        self.match_label.config(text=f"{i + 1} of {len(self.matches)}")
 
     def undo(self):
         self.text_area.edit_undo()
@@ -259,53 +567,124 @@ class NotesApp(tk.Tk):
         except tk.TclError:
             pass
 
-    def save_file(self):
+    def save_file(self, background=True):
+        if self.loading:
+            # The widget holds only part of the file, saving it would cut the file short
+            self.status.config(text="Still loading, save once the whole file is in")
+            return
         if self.file_path:
-            with open(self.file_path, "w") as f:
-                f.write(self.text_area.get("1.0", "end-1c"))
-            messagebox.showinfo("Info", "File saved successfully!")
-            self.update_title()
+            self.write_file(self.file_path, background)
         else:
-            self.save_as()
+            self.save_as(background)
 
-    def save_as(self):
-        self.file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-        if self.file_path:
-            with open(self.file_path, "w") as f:
-                f.write(self.text_area.get("1.0", "end-1c"))
-            messagebox.showinfo("Info", "File saved successfully!")
-            self.update_title()
+    def save_as(self, background=True):
+        if self.loading:
+            self.status.config(text="Still loading, save once the whole file is in")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if file_path:
+            self.file_path = file_path
+            self.write_file(file_path, background)
+
+    def write_file(self, file_path, background=True):
+        # The text lives in the Tk widget, which only the Tk thread may read. It is copied
+        # out a part per turn of the event loop, so a big file does not freeze the window,
+        # and the worker writes the parts out and renames the file into place.
+        self.save_id += 1
+        if not background:
+            self.save_parts = None
+            self.file_saved(write_snapshot((file_path, [self.text_area.get("1.0", "end-1c")]), None))
+            return
+        self.status.config(text=f"Saving {os.path.basename(file_path)}...")
+        self.save_parts = []
+        self.save_line = 1
+        self.copy_for_save(file_path, self.save_id)
+
+    def copy_for_save(self, file_path, save_id):
+        if save_id != self.save_id:
+            return  # another save started or a file was opened meanwhile
+        line = self.save_line
+        if line + SAVE_LINES > self.line_of("end-1c"):
+            parts = self.save_parts + [self.text_area.get(f"{line}.0", "end-1c")]
+            self.save_parts = None
+            self.scheduler.schedule("save", lambda: (file_path, parts), write_snapshot, self.file_saved, delay=0)
+            return
+        self.save_parts.append(self.text_area.get(f"{line}.0", f"{line + SAVE_LINES}.0"))
+        self.save_line = line + SAVE_LINES
+        self.after(1, lambda: self.copy_for_save(file_path, save_id))
+
+    def file_saved(self, result):
+        file_path, error = result
+        if error:
+            self.status.config(text="Save failed")
+            messagebox.showerror("Error", f"Could not save {file_path}: {error}")
+            return
+        self.status.config(text=f"Saved {os.path.basename(file_path)}")
+        self.update_title()
 
     def open_file(self):
-        self.file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-        if self.file_path:
-            with open(self.file_path, "r") as f:
-                content = f.read()
+        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if file_path:
+            self.file_path = file_path
+            self.save_id += 1  # a save still copying the old text is dropped
+            self.save_parts = None
             self.text_area.delete("1.0", "end-1c")
-            self.text_area.insert("1.0", content)
+            self.load_id += 1
+            self.loading = True
+            # Insert the file a chunk per turn of the event loop, the top shows up first
+            chunks = read_chunks(file_path, FILL_CHUNK, self.show_load_progress)
+            self.fill_widget(chunks, self.load_id, True)
             self.update_title()
-    
+
+    @timed("open.fill")
+    def fill_widget(self, chunks, load_id, first):
+        if load_id != self.load_id:
+            chunks.close()  # another file was opened meanwhile
+            return
+        try:
+            chunk = next(chunks, None)
+        except (OSError, ValueError) as e:  # ValueError covers text that is not valid UTF-8
+            self.loading = False
+            self.status.config(text="Open failed")
+            messagebox.showerror("Error", f"Could not open {self.file_path}: {e}")
+            # The widget holds part of the file, Save must not write that over it
+            self.file_path = None
+            self.update_title()
+            return
+        if chunk is None:
+            self.loading = False
+            self.text_area.edit_reset()  # loading the file is not an undo step
+            self.status.config(text=f"{self.line_of('end-1c')} lines")
+            return
+        self.text_area.insert("end-1c", chunk)
+        if first:
+            self.text_area.mark_set(tk.INSERT, "1.0")
+            self.text_area.see(tk.INSERT)
+        self.after(1, lambda: self.fill_widget(chunks, load_id, False))
+
+    def show_load_progress(self, done, total):
+        self.status.config(text=f"Loading {done / total:.0%}" if total else "")
+
     # Asking for confirmation to save changes when closing the app
     def close(self):
+        if self.loading:
+            if messagebox.askyesno("Exit", "The file is still loading and cannot be saved yet. Exit anyway?"):
+                self.destroy()
+            return
         if messagebox.askyesno("Exit", "Do you want to save before exiting?"):
-            self.save_file()
+            self.save_file(background=False)  # the worker would not outlive the window
         self.destroy()
 
+    @timed("on_key")
     def on_key_release(self, event=None):
         # Skip autocomplete for arrow keys
         if event.keysym in ["Up", "Down"]:
             return
-        self.text_area.edit_separator() # Ensures undo/redo is one letter at a time
-        # Syntax highlighting function whenever a key is released
-        syntax_highlight(self.text_area)
+        if event.keysym in ("space", "Return", "Tab"):
+            self.text_area.edit_separator() # Typing is undone a word at a time
+        # Syntax highlighting is scheduled by text_proxy on every edit, the rest waits for the burst to end
         self.autocomplete(event)
-        self.update_line_numbers()
 
-    def on_mouse_wheel(self, event):
-        self.line_numbers.yview_scroll(int(-1*(event.delta/120)), "units")
-
-    def on_click(self, event=None):
-        self.line_numbers.yview_moveto(self.text_area.yview()[0])
 
     def hide_suggestion_box(self, event=None):
         self.suggestion_box.place_forget()  # Hiding the suggestion box
@@ -316,22 +695,20 @@ class NotesApp(tk.Tk):
         if event.keysym == "space":
             return
 
+        # Look the word up on the worker thread, results for older keystrokes are dropped
+        self.scheduler.schedule("autocomplete", self.current_word, match_keywords, self.show_suggestions)
+
+    def current_word(self):
         # Get the current word being typed
         cursor_index = self.text_area.index(tk.INSERT)
         line_start = f"{cursor_index.split('.')[0]}.0"
         current_line = self.text_area.get(line_start, cursor_index)
         match = re.search(r"(\w+)$", current_line)  # Match the last word in the line
-        last_word = match.group(1) if match else ""  # Extract the last word
-
-        if not last_word:
-            self.hide_suggestion_box()
-            return
-
-        # Show suggestions if the last word matches a keyword prefix
-        suggestions = set(keyword.kwlist)
-        matches = [word for word in suggestions if word.lower().startswith(last_word.lower())]
+        return match.group(1) if match else ""  # Extract the last word
 
-        if matches and last_word:  # Showing suggestions only if there are matches
+    @timed("suggestions.show")
+    def show_suggestions(self, matches):
+        if matches:  # Showing suggestions only if there are matches
             self.suggestion_box.delete(0, tk.END)  # Clearing all previous suggestions
             for match in matches:
                 self.suggestion_box.insert(tk.END, match)
@@ -355,10 +732,18 @@ class NotesApp(tk.Tk):
         line_start = f"{cursor_index.split('.')[0]}.0"
         current_line = self.text_area.get(line_start, cursor_index)
         last_word_start = current_line.rfind(current_line.split()[-1]) if current_line.split() else 0
-        self.text_area.delete(f"{line_start}+{last_word_start}c", cursor_index)
-        self.text_area.insert(tk.INSERT, selected_word)
+        self.replace_text(f"{line_start}+{last_word_start}c", cursor_index, selected_word)
         self.suggestion_box.pack_forget()
 
+    def replace_text(self, start, end, text):
+        # Delete and insert as a single undo step, Tk would otherwise separate the two
+        self.text_area.edit_separator()
+        self.text_area.config(autoseparators=False)
+        self.text_area.delete(start, end)
+        self.text_area.insert(start, text)
+        self.text_area.edit_separator()
+        self.text_area.config(autoseparators=True)
+
     def complete_autocomplete(self, event):
         if self.suggestion_box.winfo_ismapped():  # Checking if the suggestion box is visible
             selected_word = self.suggestion_box.get(tk.ACTIVE)
@@ -367,8 +752,7 @@ class NotesApp(tk.Tk):
                 line_start = f"{cursor_index.split('.')[0]}.0"
                 current_line = self.text_area.get(line_start, cursor_index)
                 last_word_start = current_line.rfind(current_line.split()[-1]) if current_line.split() else 0
-                self.text_area.delete(f"{line_start}+{last_word_start}c", cursor_index)
-                self.text_area.insert(tk.INSERT, selected_word)
+                self.replace_text(f"{line_start}+{last_word_start}c", cursor_index, selected_word)
                 self.hide_suggestion_box()  # Hiding the suggestion box after inserting
             return "break"  # Preventing default Tab behavior
         return None  # Allowing default Tab behavior if no suggestion box is visible
@@ -403,15 +787,33 @@ class NotesApp(tk.Tk):
             if current_line.split():
                 last_word = current_line.split()[-1] # Extract the word being autocompleted
                 last_word_start = current_line.rfind(last_word) # Find the character position of the last word in the current line
-                self.text_area.delete(f"{line_start}+{last_word_start}c", cursor_index) # Deleting the last word from the text area
-                self.text_area.insert(tk.INSERT, selected_word) # Inserting the selected word from the suggestion box into the text area
+                self.replace_text(f"{line_start}+{last_word_start}c", cursor_index, selected_word) # Replacing the last word with the selected word
                 self.text_area.mark_set("insert", f"{line_start}+{last_word_start + len(selected_word)}c") # Move the insert cursor back to where it was
 
             return "break"  # Preventing default behavior of arrow keys
         return None  # Allowing default behavior if the suggestion box is not visible
 
+    def toggle_perf_overlay(self):
+        # Recording runs while the overlay is shown, or all the time with BESTEST_PERF=1
+        if self.show_perf.get():
+            self.perf_overlay.show()
+        else:
+            self.perf_overlay.hide()
+
+    def save_perf_trace(self):
+        # The timings recorded so far as a trace file for chrome://tracing or Perfetto
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Trace files", "*.json"), ("All files", "*.*")])
+        if not file_path:
+            return
+        try:
+            count = recorder.dump_trace(file_path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save {file_path}: {e}")
+            return
+        self.status.config(text=f"Saved {count} timings to {os.path.basename(file_path)}")
+
 
 # Running the Tkinter app
 if __name__ == "__main__":
     app = NotesApp()
-app.mainloop()
+    app.mainloop()
@@ -1,8 +1,19 @@
+import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from abc import ABC, abstractmethod
 import re
-import keyword
+from collections import Counter
+from rope import Change, Rope
+from journal import FALLBACK_FOLDER, UNTITLED, EditJournal, fallback_journal_path, file_stamp, journal_path
+from vocabulary import HARVEST_LIMIT
+from fileio import load_rope, next_slice, read_head, write_atomic
+from scheduler import BackgroundScheduler
+from search import scan_ranges, scan_snapshot
+from vocabstore import VocabularyIndex
+from editorcore import EditorCore
+from highlighter import DOCUMENT_TAGS, apply_line_tags, visible_lines
+from perf import PerfOverlay, recorder, timed
 
 class DLLNode:
     def __init__(self, char):
@@ -14,29 +25,81 @@ class DoublyLinkedList:
     def __init__(self):
         self.head = DLLNode("")
         self.tail = self.head
+        self.length = 0
+
+    def __len__(self):
+        return self.length
 
     def insert(self, index, char):
-        node = DLLNode(char)
-        curr = self.head
-        for _ in range(index):
-            if curr.next: curr = curr.next
-        node.prev = curr
-        node.next = curr.next
-        if curr.next: curr.next.prev = node
-        curr.next = node
-        if node.next is None:
-            self.tail = node
+        self.insert_text(index, char)
 
     def delete(self, index):
-        curr = self.head
-        for _ in range(index):
-            if curr.next: curr = curr.next
-        deleted = curr.next
-        if deleted:
-            curr.next = deleted.next
-            if deleted.next: deleted.next.prev = curr
-            return deleted.char
-        return ""
+        return self.delete_range(index, index + 1)
+
+    # Range edits find their position with one walk and splice a whole run of nodes,
+    # O(position + k) instead of one walk from head per character
+
+    def insert_text(self, index, text):
+        self._link(self._node_before(index), text)
+
+    def delete_range(self, start, end):
+        # Remove the characters between two indexes and return them
+        start = max(0, start)
+        end = min(end, self.length)
+        if start >= end:
+            return ""
+        return self._unlink(self._node_before(start), end - start)
+
+    def replace_range(self, start, end, text):
+        start = max(0, min(start, self.length))
+        end = max(start, min(end, self.length))
+        before = self._node_before(start)
+        removed = self._unlink(before, end - start)
+        self._link(before, text)
+        return Change(start, removed, text)
+
+    def _node_before(self, index):
+        # The node position index comes after, walking in from the nearer end
+        index = max(0, min(index, self.length))
+        if index <= self.length // 2:
+            curr = self.head
+            for _ in range(index):
+                curr = curr.next
+        else:
+            curr = self.tail
+            for _ in range(self.length - index):
+                curr = curr.prev
+        return curr
+
+    def _link(self, curr, text):
+        # Chain new nodes for text in after curr
+        after = curr.next
+        for char in text:
+            node = DLLNode(char)
+            node.prev = curr
+            curr.next = node
+            curr = node
+        curr.next = after
+        if after:
+            after.prev = curr
+        else:
+            self.tail = curr
+        self.length += len(text)
+
+    def _unlink(self, before, count):
+        # Cut the count nodes after before out of the chain, returns their text
+        chars = []
+        curr = before.next
+        for _ in range(count):
+            chars.append(curr.char)
+            curr = curr.next
+        before.next = curr
+        if curr:
+            curr.prev = before
+        else:
+            self.tail = before
+        self.length -= count
+        return "".join(chars)
 
     def get_text(self):
         chars = []
@@ -88,63 +151,23 @@ class ButtonsRibbon(Block):
         #self.paste_btn.config(state="normal")
         self.close_btn.config(state="normal")
 
-class UndoStack:
-    def __init__(self):
-        self.stack = []
-        self.redo_stack = []
-
-    def push(self, action, index, char):
-        self.stack.append((action, index, char))
-        self.redo_stack.clear()
-
-    def pop(self):
-        return self.stack.pop() if self.stack else None
-
-    def push_redo(self, action):
-        self.redo_stack.append(action)
-
-    def redo(self):
-        return self.redo_stack.pop() if self.redo_stack else None
-
-class TrieNode:
-    def __init__(self):
-        self.children = {}
-        self.is_end = False
-
-class Trie:
-    def __init__(self):
-        self.root = TrieNode()
-
-    def insert(self, word):
-        node = self.root
-        for ch in word:
-            node = node.children.setdefault(ch, TrieNode())
-        node.is_end = True
-
-    def autocomplete(self, prefix):
-        node = self.root
-        for ch in prefix:
-            if ch not in node.children:
-                return []
-            node = node.children[ch]
-        return self._dfs(node, prefix)
-
-    def _dfs(self, node, prefix):
-        result = []
-        if node.is_end:
-            result.append(prefix)
-        for ch, child in node.children.items():
-            result.extend(self._dfs(child, prefix + ch))
-        return result
-
 class NotesApp(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Bestest Text Editor")
 
-        self.dll = DoublyLinkedList()
-        self.undo_stack = UndoStack()
-        self.trie = Trie()
+        # The document and everything done to it, this class only shows it and forwards input
+        self.core = EditorCore(VocabularyIndex())
+        self.file_path = None
+        self.highlight_pending = False
+        self.scheduler = BackgroundScheduler(self)
+        self.core.defer = self.defer
+        self.loading = False  # True while a file is read and shown, the widget is read-only then
+        self.load_id = 0
+        self.previous = None  # (file path, journal, buffer) to go back to if opening a file fails
+        self.load_stage = ""
+        self.load_progress = 0.0
+        self.filled = 0  # characters of the buffer that are in the widget
 
         # Top Frame
         self.top_frame = tk.Frame(self)
@@ -153,8 +176,36 @@ class NotesApp(tk.Tk):
         # Search Bar
         self.search_entry = tk.Entry(self.top_frame, width=20)
         self.search_entry.pack(side=tk.RIGHT, padx=5)
+        self.search_entry.bind("<Return>", self.search_word)
+        self.search_entry.bind("<KeyRelease>", self.on_search_typed)
         self.search_button = tk.Button(self.top_frame, text="Search", command=self.search_word, bg="lightblue")
         self.search_button.pack(side=tk.RIGHT, padx=5)
+        self.next_button = tk.Button(self.top_frame, text="Next", command=self.next_match)
+        self.next_button.pack(side=tk.RIGHT)
+        self.previous_button = tk.Button(self.top_frame, text="Prev", command=self.previous_match)
+        self.previous_button.pack(side=tk.RIGHT)
+        self.match_label = tk.Label(self.top_frame, width=14)
+        self.match_label.pack(side=tk.RIGHT)
+        self.search_regex = tk.BooleanVar(value=False)
+        self.search_whole_word = tk.BooleanVar(value=False)
+        self.search_case = tk.BooleanVar(value=False)
+        for label, variable in (("Match case", self.search_case), ("Whole word", self.search_whole_word), ("Regex", self.search_regex)):
+            tk.Checkbutton(self.top_frame, text=label, variable=variable, command=self.start_search).pack(side=tk.RIGHT)
+        self.replace_all_button = tk.Button(self.top_frame, text="Replace all", command=self.replace_all)
+        self.replace_all_button.pack(side=tk.RIGHT)
+        self.replace_button = tk.Button(self.top_frame, text="Replace", command=self.replace_match)
+        self.replace_button.pack(side=tk.RIGHT)
+        self.replace_entry = tk.Entry(self.top_frame, width=15)
+        self.replace_entry.pack(side=tk.RIGHT, padx=5)
+        self.current_match = None
+        self.search_pending = False
+        self.search_message = ""  # why the last search failed
+        self.jump_to_match = False  # go to the first match below the cursor once it is found
+
+        # Status line for loading progress and the like
+        self.status = tk.Label(self, anchor="w")
+        self.status.pack(fill=tk.X, side=tk.BOTTOM)
+        self.perf_overlay = PerfOverlay(self)
 
         self.text_area = tk.Text(self, wrap='word')
         self.text_area.pack(expand=1, fill=tk.BOTH)
@@ -168,6 +219,11 @@ class NotesApp(tk.Tk):
         self.text_area.bind("<Control-o>", self.open_file, add=True)
         self.text_area.bind("<Control-z>", self.undo, add=True)
         self.text_area.bind("<Control-y>", self.redo, add=True)
+        self.text_area.bind("<Control-v>", self.paste)
+        self.text_area.bind("<<Paste>>", self.paste)
+        self.text_area.config(yscrollcommand=self.on_text_scroll)
+        self.text_area.tag_config("search_highlight", background="yellow")
+        self.text_area.tag_config("search_current", background="orange")
 
         self.suggestion_box = tk.Listbox(self, height=5)
         self.suggestion_box.place_forget()  # Hide the suggestion box initially
@@ -190,13 +246,23 @@ class NotesApp(tk.Tk):
         edit_menu = tk.Menu(self.menu_bar, tearoff=0)
         edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
         edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
+        edit_menu.add_command(label="Paste", accelerator="Ctrl+V", command=self.paste)
         self.menu_bar.add_cascade(label="Edit", menu=edit_menu)
+
+        # View menu
+        self.viewport_highlighting = tk.BooleanVar(value=True)
+        view_menu = tk.Menu(self.menu_bar, tearoff=0)
+        view_menu.add_checkbutton(label="Highlight visible lines only", variable=self.viewport_highlighting, command=self.highlight_syntax)
+        self.fuzzy_suggestions = tk.BooleanVar(value=True)
+        view_menu.add_checkbutton(label="Suggest despite typos", variable=self.fuzzy_suggestions)
+        view_menu.add_separator()
+        self.show_perf = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Performance overlay", variable=self.show_perf, command=self.toggle_perf_overlay)
+        view_menu.add_command(label="Save performance trace...", command=self.save_perf_trace)
+        self.menu_bar.add_cascade(label="View", menu=view_menu)
         
         self.config(menu=self.menu_bar)
 
-        for word in keyword.kwlist:
-            self.trie.insert(word)
-
         # Creating the buttons ribbon
         self.buttons_ribbon = ButtonsRibbon(self, self)
         self.buttons_ribbon.place(rely=0, anchor=tk.NW)
@@ -204,85 +270,214 @@ class NotesApp(tk.Tk):
 
         self.protocol("WM_DELETE_WINDOW", lambda: self.close())
 
-    def search_word(self):
+        # Bring back what was typed into an unsaved buffer before a crash
+        self.open_journal()
+        recovered = Rope()
+        if self.core.journal and self.core.journal.replay(recovered):
+            self.begin_loading("")
+            self.show_buffer((recovered, 0, None))
+
+    def search_word(self, event=None):
         # Getting the word to search
         search_term = self.search_entry.get()
         if not search_term:
             messagebox.showinfo("Info", "Please enter a word to search.")
             return
+        self.start_search(jump=True)
+
+    def on_search_typed(self, event):
+        # Search as the query is typed, Return is handled by search_word
+        if event.keysym != "Return":
+            self.start_search()
+
+    def start_search(self, jump=False):
+        # Search the buffer once in the background, edits keep the match list up to date
+        # from then on. The matches are shown slice by slice as the worker finds them,
+        # a newer search cancels the scan of an older one.
+        self.scheduler.cancel("search")
+        self.current_match = None
+        self.search_message = ""
+        self.jump_to_match = jump
+        try:
+            self.core.start_search(self.search_entry.get(), self.search_regex.get(), self.search_whole_word.get(), self.search_case.get())
+        except re.error:
+            self.core.search = None
+            self.search_message = "Invalid pattern"
+        self.show_search()
+        if self.core.search is not None:
+            self.scheduler.schedule(
+                "search",
+                lambda: (self.core.search, list(self.core.buffer.chunks())),
+                scan_snapshot,
+                self.search_done,
+                partial=self.add_matches,
+            )
+
+    def add_matches(self, found):
+        starts, ends = found
+        self.core.search.add(starts, ends)
+        if self.jump_to_match and starts[-1] >= self.get_cursor_index():
+            self.jump_to_match = False
+            self.goto_match(self.core.search.next_match(self.get_cursor_index()))
+        else:
+            self.refresh_search()
+
+    def search_done(self, message):
+        self.search_message = message
+        self.core.search.complete = not message
+        if self.jump_to_match:
+            self.jump_to_match = False
+            self.goto_match(self.core.search.next_match(self.get_cursor_index()))
+        else:
+            self.refresh_search()
+
+    def rescan_dirty(self):
+        # Search the lines edited since a regex search finished again, off the Tk thread
+        self.scheduler.schedule(
+            "search",
+            lambda: (self.core.search, self.core.search.dirty_slices(self.core.buffer)),
+            scan_ranges,
+            self.dirty_scanned,
+        )
+
+    def dirty_scanned(self, found):
+        self.core.search.fill(found)
+        self.refresh_search()
+
+    def next_match(self):
+        self.sync_cursor()
+        self.goto_match(self.core.next_match())
+
+    def previous_match(self):
+        self.sync_cursor()
+        self.goto_match(self.core.previous_match())
+
+    def replace_ready(self):
+        # Replacing needs the complete and current list of matches
+        if self.loading or self.core.search is None or self.search_message:
+            return False
+        if not self.core.search.complete or self.core.search.dirty:
+            self.match_label.config(text="Still searching")
+            return False
+        return True
+
+    def replace_match(self):
+        # Replace the current match, or the next one below the cursor, and go on to the next
+        if not self.replace_ready():
+            return
+        self.sync_cursor()
+        i = self.current_match
+        if i is None:
+            i = self.core.search.next_match(self.core.cursor)
+        if i is not None:
+            self.replace_matches(i, i + 1)
+            self.goto_match(self.core.search.next_match(self.core.cursor))
+
+    def replace_all(self):
+        if self.replace_ready() and len(self.core.search):
+            self.replace_matches(0, len(self.core.search))
+
+    def replace_matches(self, i, j):
+        self.show_change(self.core.replace_matches(i, j, self.replace_entry.get()))
+        self.highlight_syntax()
 
-        # Removing previous search highlights
+    def goto_match(self, i):
+        self.current_match = i
+        if i is not None:
+            start = self.text_index(self.core.search.starts[i])
+            self.text_area.mark_set(tk.INSERT, start)
+            self.text_area.see(start)
+        self.show_search()
+
+    def refresh_search(self):
+        # Retag the matches once the current burst of edits or scrolling is over
+        if not self.search_pending:
+            self.search_pending = True
+            self.after_idle(self.show_search)
+
+    def show_search(self):
+        # Count the matches and tag the ones on screen, like syntax highlighting the rest
+        # is tagged when it scrolls into view
+        self.search_pending = False
         self.text_area.tag_remove("search_highlight", "1.0", "end")
-
-        # Highlighting all occurrences of the search term
-        start = "1.0"
-        while True:
-            start = self.text_area.search(search_term, start, stopindex="end", nocase=True)  # Case-insensitive search
-            if not start:
-                break
-            end = f"{start}+{len(search_term)}c"
-            self.text_area.tag_add("search_highlight", start, end)
-            start = end
-        self.text_area.tag_config("search_highlight", background="yellow")
-
+        self.text_area.tag_remove("search_current", "1.0", "end")
+        if self.core.search is None or self.search_message:
+            self.match_label.config(text=self.search_message)
+            return
+        if self.current_match is not None:
+            self.match_label.config(text=f"{self.current_match + 1} of {len(self.core.search)}")
+        else:
+            self.match_label.config(text=f"{len(self.core.search)} matches" + ("" if self.core.search.complete else "..."))
+
+        first, last = visible_lines(self.text_area)
+        i, j = self.core.search.between(self.core.buffer.line_start(first), self.core.buffer.line_end(last))
+        indexes = []
+        for k in range(i, j):
+            indexes += (self.text_index(self.core.search.starts[k]), self.text_index(self.core.search.ends[k]))
+        if indexes:
+            self.text_area.tag_add("search_highlight", *indexes)
+        if self.current_match is not None and i <= self.current_match < j:
+            k = self.current_match
+            self.text_area.tag_add("search_current", self.text_index(self.core.search.starts[k]), self.text_index(self.core.search.ends[k]))
+
+    @timed("on_key")
     def on_key(self, event):
         # Handle key press events
-        if event.keysym == 'BackSpace':
-            idx = self.get_cursor_index() - 1
-            if idx >= 0:  # Ensure the index is valid
-                deleted = self.dll.delete(idx)
-                if deleted:
-                    self.undo_stack.push('delete', idx, deleted)
-                    self.refresh_text()
-                    self.update_suggestions()
-        elif event.char.isprintable():
-            idx = self.get_cursor_index()
-            self.dll.insert(idx, event.char)
-            self.undo_stack.push('insert', idx, event.char)
-            self.refresh_text()
+        if self.loading:
+            return "break"
+        self.sync_cursor()
+        change = self.core.key(event.keysym, event.char)
+        if change:
+            self.show_change(change)
             self.update_suggestions()
         self.highlight_syntax()
 
         # Prevent the default behavior of the Text widget
         return "break"
 
+    @timed("undo")
     def undo(self, event=None):
         # undo
-        action = self.undo_stack.pop()
-        if not action:
+        if self.loading:
+            return
+        change = self.core.undo()
+        if not change:
             messagebox.showinfo("Undo", "Nothing to undo.")
             return
-
-        act, idx, char = action
-        if act == 'insert':
-            self.dll.delete(idx)
-            self.undo_stack.push_redo(('insert', idx, char))  # Push to redo stack
-        elif act == 'delete':
-            self.dll.insert(idx, char)
-            self.undo_stack.push_redo(('delete', idx, char))  # Push to redo stack
-
-        # Refresh the text area and syntax highlighting
-        self.refresh_text()
+        self.show_change(change)
         self.highlight_syntax()
 
+    @timed("redo")
     def redo(self, event=None):
         # redo
-        action = self.undo_stack.redo()
-        if not action:
+        if self.loading:
+            return
+        change = self.core.redo()
+        if not change:
             messagebox.showinfo("Redo", "Nothing to redo.")
             return
+        self.show_change(change)
+        self.highlight_syntax()
 
-        act, idx, char = action
-        if act == 'insert':
-            self.dll.insert(idx, char)
-            self.undo_stack.push('insert', idx, char)  # Push back to undo stack
-        elif act == 'delete':
-            self.dll.delete(idx)
-            self.undo_stack.push('delete', idx, char)  # Push back to undo stack
-
-        # Refresh the text area and syntax highlighting
-        self.refresh_text()
+    @timed("paste")
+    def paste(self, event=None):
+        # Paste the clipboard over the selection as one buffer splice and one undo step
+        if self.loading:
+            return "break"
+        try:
+            text = self.clipboard_get()
+        except tk.TclError:
+            return "break"
+        self.sync_cursor()
+        selection = self.text_area.tag_ranges(tk.SEL)
+        if selection:
+            start, end = (self.core.buffer.linecol_to_offset(*map(int, str(index).split("."))) for index in selection)
+        else:
+            start = end = None
+        self.show_change(self.core.paste(text, start, end))
+        self.hide_suggestion_box()
         self.highlight_syntax()
+        return "break"
 
     def update_title(self):
         if self.file_path:
@@ -291,57 +486,243 @@ class NotesApp(tk.Tk):
         else:
             self.title("Untitled - Bestest Text Editor")
 
-    def save_file(self):
+    def save_file(self, background=True):
+        if self.loading:
+            return  # the buffer does not hold the whole file yet
         if self.file_path:
-            with open(self.file_path, "w") as f:
-                f.write(self.text_area.get("1.0", "end-1c"))
-            messagebox.showinfo("Info", "File saved successfully!")
-            self.update_title()
+            self.write_file(self.file_path, background)
         else:
-            self.save_as()
+            self.save_as(background)
 
-    def save_as(self):
-        self.file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-        if self.file_path:
-            with open(self.file_path, "w") as f:
-                f.write(self.text_area.get("1.0", "end-1c"))
-            messagebox.showinfo("Info", "File saved successfully!")
-            self.update_title()
+    def save_as(self, background=True):
+        if self.loading:
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if file_path:
+            self.write_file(file_path, background)
+
+    def write_file(self, file_path, background=True):
+        # Snapshot the rope's leaves: they are immutable strings, so this copies no text and
+        # edits made while the worker writes them out do not disturb the save
+        chunks = list(self.core.buffer.chunks())
+        journal = self.core.journal
+        snapshot = (file_path, chunks, journal, journal.position() if journal else 0)
+        if not background:
+            self.file_saved(self.write_snapshot(snapshot, None))
+            return
+        self.status.config(text=f"Saving {os.path.basename(file_path)}...")
+        self.scheduler.schedule("save", lambda: snapshot, self.write_snapshot, self.file_saved, delay=0)
+
+    @timed("save")
+    def write_snapshot(self, snapshot, cancelled):
+        # Runs on the scheduler's worker thread unless the app is closing
+        file_path, chunks, journal, position = snapshot
+        try:
+            write_atomic(file_path, chunks)
+        except OSError as e:
+            return file_path, journal, position, e
+        return file_path, journal, position, None
+
+    def file_saved(self, result):
+        file_path, journal, position, error = result
+        if error:
+            self.status.config(text="Save failed")
+            messagebox.showerror("Error", f"Could not save {file_path}: {error}")
+            return
+        self.status.config(text=f"Saved {os.path.basename(file_path)}")
+        if journal is not self.core.journal:
+            return  # another file was opened meanwhile
+        if file_path == self.file_path:
+            # The file holds every journaled edit up to the snapshot, keep only the later ones
+            if journal:
+                journal.compact(file_stamp(file_path), position)
+        else:
+            # Saved under a new name, carry the later edits over to a journal for the new file
+            tail = journal.tail(position) if journal else b""
+            self.file_path = file_path
+            self.open_journal()
+            if self.core.journal:
+                self.core.journal.append_raw(tail)
+        self.update_title()
+        self.save_vocabulary()
 
     def open_file(self):
-        self.file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
-        if self.file_path:
-            with open(self.file_path, "r") as f:
-                content = f.read()
-            self.text_area.delete("1.0", "end-1c")
-            self.text_area.insert("1.0", content)
-            self.update_title()
-    
-    # Asking for confirmation to save changes when closing the app
+        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if not file_path:
+            return
+        try:
+            preview = read_head(file_path)
+        except (OSError, ValueError) as e:  # ValueError covers text that is not valid UTF-8
+            messagebox.showerror("Error", f"Could not open {file_path}: {e}")
+            return
+        if self.loading and self.previous is not None:
+            # The file still being read is given up, its journal is kept for the next time
+            if self.core.journal:
+                self.core.journal.close(remove=False)
+        else:
+            # The open document and its journal are kept until the new file has been read
+            self.previous = (self.file_path, self.core.journal, self.core.buffer)
+        self.core.journal = None
+        self.file_path = file_path
+        self.open_journal()
+        # Show the top of the file right away, the buffer is built on the worker thread
+        self.begin_loading(preview)
+        journal = self.core.journal
+        self.scheduler.schedule("open", lambda: (file_path, journal), self.read_file, self.show_buffer, delay=0)
+        self.update_title()
+
+    @timed("open")
+    def read_file(self, snapshot, cancelled):
+        # Runs on the scheduler's worker thread. Returns (rope, edits replayed, error).
+        file_path, journal = snapshot
+        try:
+            rope = load_rope(file_path, self.set_load_progress, cancelled)
+            if rope is None:
+                return None
+            # Edits made after the last save are still in the journal if the editor crashed
+            return rope, journal.replay(rope) if journal else 0, None
+        except (OSError, ValueError) as e:
+            return None, 0, e
+
+    def open_failed(self, error):
+        # The file could not be read, go back to the document that was open before it
+        file_path = self.file_path
+        if self.core.journal:
+            self.core.journal.close(remove=False)  # it may hold edits of that file not recovered yet
+        self.file_path, self.core.journal, buffer = self.previous
+        self.previous = None
+        self.begin_loading("")
+        self.show_buffer((buffer, 0, None))
+        self.update_title()
+        messagebox.showerror("Error", f"Could not open {file_path}: {error}")
+
+    def set_load_progress(self, done, total):
+        self.load_progress = done / total if total else 1.0
+
+    def begin_loading(self, preview):
+        # Drop the old document and keep the widget read-only until the new one is all in it
+        if not self.loading:
+            self.after(100, self.show_progress)
+        self.loading = True
+        self.load_id += 1
+        self.load_stage = "Reading"
+        self.load_progress = 0.0
+        self.core.reset()
+        self.hide_suggestion_box()
+        self.scheduler.cancel("search")
+        self.search_message = ""
+        self.current_match = None
+        self.show_search()
+        self.text_area.config(state="normal")
+        self.text_area.delete("1.0", "end")
+        self.text_area.insert("1.0", preview)
+        self.text_area.config(state="disabled")
+        self.filled = len(preview)
+
+    def show_buffer(self, result):
+        # The whole file is in the buffer, add what the preview lacks to the widget bit by bit
+        rope, replayed, error = result
+        if error:
+            self.open_failed(error)
+            return
+        if self.previous is not None:
+            # The new file is in, the old document's journal is done with
+            journal = self.previous[1]
+            if journal:
+                journal.close()
+            self.previous = None
+        self.core.buffer = rope
+        if replayed:
+            # The preview shows the saved text, start over with the recovered one
+            self.text_area.config(state="normal")
+            self.text_area.delete("1.0", "end")
+            self.text_area.config(state="disabled")
+            self.filled = 0
+        else:
+            self.core.tracker.add_text(self.core.buffer.get_range(0, self.filled))
+        self.highlight_syntax()
+        self.load_stage = "Loading"
+        self.fill_widget(self.load_id)
+
+    @timed("open.fill")
+    def fill_widget(self, load_id):
+        if load_id != self.load_id:
+            return  # another file was opened meanwhile
+        text = next_slice(self.core.buffer, self.filled)
+        self.text_area.config(state="normal")
+        self.text_area.insert("end-1c", text)
+        self.text_area.config(state="disabled")
+        if self.filled < HARVEST_LIMIT:
+            self.core.tracker.add_text(text)
+        self.filled += len(text)
+        if self.filled < len(self.core.buffer):
+            self.load_progress = self.filled / len(self.core.buffer)
+            self.after(1, lambda: self.fill_widget(load_id))
+            return
+        self.loading = False
+        self.text_area.config(state="normal")
+        self.status.config(text=f"{self.core.buffer.line_count()} lines")
+        self.highlight_syntax()
+
+    def show_progress(self):
+        if self.loading:
+            self.status.config(text=f"{self.load_stage} {self.load_progress:.0%}")
+            self.after(100, self.show_progress)
+
+    def open_journal(self):
+        # Start journaling against the saved version of the current file, the old journal is done with
+        if self.core.journal:
+            self.core.journal.close()
+        self.core.journal = None
+        stamp = file_stamp(self.file_path) if self.file_path else UNTITLED
+        # A folder that cannot be written to gets its journal kept in the home folder instead
+        primary = journal_path(self.file_path)
+        for path in (primary, fallback_journal_path(self.file_path)):
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self.core.journal = EditJournal(path, stamp)
+            except OSError:
+                continue
+            if path != primary:
+                self.status.config(text=f"Journal kept in {FALLBACK_FOLDER}")
+            return
+        self.status.config(text="Edits are not journaled, no folder for a journal can be written to")
+
     def close(self):
+        if self.loading:
+            # Nothing can be saved before the whole file is in, and the journal may hold
+            # recovered edits that are not in the buffer yet, so every journal is kept
+            if messagebox.askyesno("Exit", "The file is still loading and cannot be saved yet. Exit anyway?"):
+                self.save_vocabulary(background=False)
+                for journal in (self.core.journal, self.previous and self.previous[1]):
+                    if journal:
+                        journal.close(remove=False)
+                self.destroy()
+            return
         result = messagebox.askyesnocancel("Exit", "Do you want to save before exiting?")
         if result is True:
-            self.save_file()
+            self.save_file(background=False)  # the worker would not outlive the window
+            self.save_vocabulary(background=False)
+            if self.core.journal:
+                self.core.journal.close()
             self.destroy()
         elif result is False:
+            self.save_vocabulary(background=False)
+            if self.core.journal:
+                self.core.journal.close()  # the edits were deliberately thrown away
             self.destroy()
 
+    @timed("on_key")
     def add_to_trie(self, event):
-        # Add the last word to the trie when space is pressed.
-        words = self.dll.get_text().split()
-        if words:
-            last_word = words[-1].strip()
-            if last_word:  # Ensure the last word is not empty
-                self.trie.insert(last_word)
-
-        # Reinsert the space into the text
-        idx = self.get_cursor_index()
-        self.dll.insert(idx, " ")
-        self.refresh_text()
+        # The trie already follows every edit, space only marks the word before it as learned
+        if self.loading:
+            return "break"
+        self.sync_cursor()
+        self.show_change(self.core.key("space", " "))
 
         # Prevent the default behavior of the Text widget
         return "break"
-    
+
     def autocomplete(self, event):
         if event.keysym == "space":
             return
@@ -358,7 +739,7 @@ class NotesApp(tk.Tk):
             return
 
         # Use Trie to find matching words
-        matches = self.trie.autocomplete(last_word)
+        matches = [match for match in self.core.trie.autocomplete(last_word) if match != last_word]
 
         if matches:
             self.suggestion_box.delete(0, tk.END)
@@ -378,15 +759,10 @@ class NotesApp(tk.Tk):
         if not selected_word:
             return
 
-        cursor_index = self.text_area.index(tk.INSERT)
-        line_start = f"{cursor_index.split('.')[0]}.0"
-        current_line = self.text_area.get(line_start, cursor_index)
-
-        match = re.search(r"(\w+)$", current_line)
-        if match:
-            last_word_start = match.start(1)
-            self.text_area.delete(f"{line_start}+{last_word_start}c", cursor_index)
-        self.text_area.insert(tk.INSERT, selected_word)
+        self.sync_cursor()
+        change = self.core.select_suggestion(selected_word)
+        if change:
+            self.show_change(change)
         self.hide_suggestion_box()
 
     def complete_autocomplete(self, event):
@@ -422,19 +798,18 @@ class NotesApp(tk.Tk):
             return "break"
         return None
 
+    @timed("suggestions")
     def update_suggestions(self):
         # Update the autocomplete suggestion box
-        idx = self.get_cursor_index()
-        text = self.dll.get_text()[:idx]
-        word = text.split()[-1] if text.split() else ""
-        suggestions = self.trie.autocomplete(word)
+        self.core.fuzzy_suggestions = self.fuzzy_suggestions.get()
+        suggestions = self.core.suggestions()
 
         # Clear the suggestion box
         self.suggestion_box.delete(0, tk.END)
 
         if suggestions:
             # Populate the suggestion box with matching words
-            for suggestion in suggestions[:5]:
+            for suggestion in suggestions:
                 self.suggestion_box.insert(tk.END, suggestion)
             self.suggestion_box.selection_clear(0, tk.END)
             self.suggestion_box.selection_set(0)
@@ -451,6 +826,41 @@ class NotesApp(tk.Tk):
             # Hide the suggestion box if no matches are found
             self.suggestion_box.place_forget()
 
+    def save_vocabulary(self, background=True):
+        # The merged file is written on the worker and only mapped here. Words learned
+        # meanwhile stay in learned for the next save.
+        if not self.core.learned:
+            return
+        if not background:
+            self.scheduler.cancel("vocabulary")
+            self.core.vocabulary.merge(self.core.learned)
+            self.core.learned.clear()
+            return
+        self.scheduler.schedule(
+            "vocabulary",
+            lambda: Counter(self.core.learned),
+            self.write_vocabulary,
+            self.vocabulary_written,
+            delay=0,
+            discard=self.vocabulary_dropped,
+        )
+
+    def write_vocabulary(self, learned, cancelled):
+        # Runs on the scheduler's worker thread
+        temp_path = self.core.vocabulary.write_merged(learned, cancelled)
+        return None if temp_path is None else (temp_path, learned)
+
+    def vocabulary_written(self, result):
+        temp_path, learned = result
+        self.core.vocabulary.swap(temp_path)
+        self.core.learned -= learned
+
+    def vocabulary_dropped(self, result):
+        # A newer save came in after this one was written, its file is not needed
+        temp_path, learned = result
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
     def select_suggestion(self, event=None):
         # Handle the Enter key for selecting suggestions/inserting a new line 
         if self.suggestion_box.winfo_ismapped():
@@ -459,72 +869,113 @@ class NotesApp(tk.Tk):
             if not selection:
                 return "break"
             word = self.suggestion_box.get(selection[0])
-            idx = self.get_cursor_index()
-            text = self.dll.get_text()[:idx]
-            parts = text.split()
-            if not parts:
+            self.sync_cursor()
+            change = self.core.select_suggestion(word)  # One undo step, not one per character
+            if not change:
                 return "break"
-            start_idx = idx - len(parts[-1])
-            for _ in range(len(parts[-1])):
-                self.dll.delete(start_idx)
-            for i, c in enumerate(word):
-                self.dll.insert(start_idx + i, c)
-            self.refresh_text()
+            self.show_change(change)
             self.suggestion_box.place_forget()
             self.highlight_syntax()
             return "break"
         else:
-            # If the suggestion box is not visible, allow the default behavior (newline)
-            return None
-
-    def refresh_text(self):
-        self.text_area.delete("1.0", tk.END)
-        self.text_area.insert("1.0", self.dll.get_text())
+            # If the suggestion box is not visible it is an ordinary newline or tab, typed
+            # through the buffer like every other key
+            return self.on_key(event)
+
+    @timed("refresh_text")
+    def show_change(self, change):
+        # Patch only the edited range of the Text widget instead of reloading everything.
+        # The buffer already holds the new text, so the old end is given relative to start
+        start = self.text_index(change.offset)
+        if change.removed:
+            self.text_area.delete(start, f"{start}+{len(change.removed)}c")
+        if change.inserted:
+            self.text_area.insert(start, change.inserted)
+        self.text_area.mark_set(tk.INSERT, self.text_index(self.core.cursor))
+        self.text_area.see(tk.INSERT)
+
+        search = self.core.search
+        if search is not None and not self.search_message:
+            self.current_match = None
+            if not search.complete:
+                self.start_search()  # the scan under way read the text from before the edit
+                return
+            if search.dirty:
+                self.rescan_dirty()
+            self.refresh_search()
+
+    def defer(self, compute, data, apply):
+        # Lets the core count the words of huge edits on the worker thread
+        self.scheduler.schedule(("defer", id(data)), lambda: data, lambda data, cancelled: compute(data), apply, delay=0)
+
+    def text_index(self, offset):
+        # Convert a buffer offset to a "line.col" Text index using the buffer's line index
+        line, col = self.core.buffer.offset_to_linecol(offset)
+        return f"{line}.{col}"
+
+    def on_text_scroll(self, first, last):
+        # Called by the Text widget whenever its view changes, highlight once the burst is over
+        if not self.highlight_pending:
+            self.highlight_pending = True
+            self.after_idle(self.highlight_visible)
+
+    def highlight_visible(self):
+        self.highlight_pending = False
+        if self.viewport_highlighting.get():
+            self.highlight_syntax()
+        if self.core.search is not None:
+            self.show_search()
 
+    @timed("get_cursor_index")
     def get_cursor_index(self):
-        index = self.text_area.index(tk.INSERT)
-        line, col = map(int, index.split("."))
-        text = self.text_area.get("1.0", index)
-        return sum(len(line) + 1 for line in text.splitlines()[:line - 1]) + col
+        line, col = map(int, self.text_area.index(tk.INSERT).split("."))
+        return self.core.buffer.linecol_to_offset(line, col)
 
+    def sync_cursor(self):
+        # The cursor may have been moved with the mouse or the arrow keys since the core last saw it
+        idx = self.get_cursor_index()
+        if idx != self.core.cursor:
+            self.core.cursor = idx
+            self.core.undo_stack.break_run()
+
+    @timed("highlight")
     def highlight_syntax(self):
-        # Highlight Python keywords and strings in the Text widget.
-        # Remove previous tags
-        self.text_area.tag_remove("keyword", "1.0", tk.END)
-        self.text_area.tag_remove("string", "1.0", tk.END)
-
-        # Highlight keywords
-        text = self.dll.get_text()
-        for word in keyword.kwlist:
-            start = "1.0"
-            while True:
-                # Search for the keyword in the text
-                pos = self.text_area.search(rf"\b{word}\b", start, stopindex=tk.END, regexp=True)
-                if not pos:
-                    break
-                end = f"{pos}+{len(word)}c"
-                self.text_area.tag_add("keyword", pos, end)
-                start = end
-
-        # Highlight strings
-        start = "1.0"
-        while True:
-            # Search for strings enclosed in double quotes
-            start = self.text_area.search(r'"', start, stopindex=tk.END, regexp=False)
-            if not start:
-                break
-            end = self.text_area.search(r'"', f"{start}+1c", stopindex=tk.END, regexp=False)
-            if not end:
-                # If no closing quote is found, highlight until the end of the text
-                end = tk.END
-            else:
-                end = f"{end}+1c"  # Include the closing quote
-            self.text_area.tag_add("string", start, end)
-            start = end
+        if self.viewport_highlighting.get():
+            # Only lex and tag the lines on screen, the rest is tagged once it is scrolled to
+            first, last = visible_lines(self.text_area)
+            apply_line_tags(self.text_area, self.core.highlight(first, last), DOCUMENT_TAGS)
+        else:
+            # Tokenize the buffer once in Python and retag with one tag_add call per token class
+            ranges = self.core.highlight_all()
+            for tag in DOCUMENT_TAGS:
+                self.text_area.tag_remove(tag, "1.0", tk.END)
+                if ranges[tag]:
+                    self.text_area.tag_add(tag, *ranges[tag])
 
         # Configure the tags
         self.text_area.tag_config("keyword", foreground="blue", font=("Arial", 10, "bold"))
         self.text_area.tag_config("string", foreground="green", font=("Arial", 10, "italic"))
+        self.text_area.tag_config("comment", foreground="gray", font=("Arial", 10, "italic"))
+        self.text_area.tag_config("number", foreground="dark orange")
+
+    def toggle_perf_overlay(self):
+        # Recording runs while the overlay is shown, or all the time with BESTEST_PERF=1
+        if self.show_perf.get():
+            self.perf_overlay.show()
+        else:
+            self.perf_overlay.hide()
+
+    def save_perf_trace(self):
+        # The timings recorded so far as a trace file for chrome://tracing or Perfetto
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Trace files", "*.json"), ("All files", "*.*")])
+        if not file_path:
+            return
+        try:
+            count = recorder.dump_trace(file_path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save {file_path}: {e}")
+            return
+        self.status.config(text=f"Saved {count} timings to {os.path.basename(file_path)}")
 
 if __name__ == "__main__":
     app = NotesApp()
@@ -0,0 +1,72 @@
+# Both linked list buffers against a plain str given the same edits
+import os
+import random
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+
+import pytest
+
+import testnumber2
+from rope import Change
+
+def load_script(name):
+    # The doublylinkedlist variant is a script without a .py suffix
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), name)
+    loader = SourceFileLoader(name, path)
+    module = module_from_spec(spec_from_loader(name, loader))
+    loader.exec_module(module)
+    return module
+
+LISTS = [testnumber2.DoublyLinkedList, load_script("doublylinkedlist").DoublyLinkedList]
+
+def random_text(rng, length):
+    return "".join(rng.choice("abc\n ") for _ in range(length))
+
+def check_links(buffer, text):
+    # The chain read forwards and backwards, and the length kept alongside it
+    assert buffer.get_text() == text
+    assert len(buffer) == len(text)
+    chars = []
+    node = buffer.tail
+    while node is not buffer.head:
+        assert node.prev.next is node
+        chars.append(node.char)
+        node = node.prev
+    assert "".join(reversed(chars)) == text
+    assert buffer.tail.next is None
+
+@pytest.mark.parametrize("cls", LISTS, ids=["testnumber2", "doublylinkedlist"])
+@pytest.mark.parametrize("seed", range(4))
+def test_random_edits_match_str(cls, seed):
+    rng = random.Random(seed)
+    buffer = cls()
+    text = ""
+    for _ in range(300):
+        kind = rng.randrange(5)
+        # Positions out of range on purpose now and then, they are clamped
+        start = rng.randint(-2, len(text) + 2)
+        end = start + rng.choice((0, 1, 3, 20))
+        inserted = random_text(rng, rng.choice((0, 1, 4, 30)))
+        clamped = max(0, min(start, len(text)))
+        if kind == 0:
+            buffer.insert_text(clamped, inserted)
+            text = text[:clamped] + inserted + text[clamped:]
+        elif kind == 1:
+            removed = buffer.delete_range(start, end)
+            lo = max(0, start)
+            hi = max(lo, min(end, len(text)))
+            assert removed == text[lo:hi]
+            text = text[:lo] + text[hi:]
+        elif kind == 2:
+            change = buffer.replace_range(start, end, inserted)
+            hi = max(clamped, min(end, len(text)))
+            assert change == Change(clamped, text[clamped:hi], inserted)
+            text = text[:clamped] + inserted + text[hi:]
+        elif kind == 3 and text:
+            index = rng.randrange(len(text))
+            assert buffer.delete(index) == text[index]
+            text = text[:index] + text[index + 1:]
+        else:
+            buffer.insert(clamped, inserted[:1])
+            text = text[:clamped] + inserted[:1] + text[clamped:]
+        check_links(buffer, text)
@@ -0,0 +1,158 @@
+# The incremental highlighter against lexing the whole text again after every edit
+import random
+
+import pytest
+
+from highlighter import (
+    DOCUMENT_TAGS, MAX_DIRTY_RUNS, NORMAL, IncrementalHighlighter, lex_line, tag_ranges, tokenize, visible_lines,
+)
+
+# Pieces of Python that open and close strings and comments, including triple quoted ones
+PIECES = ["def ", "x", " = ", '"""', "'''", '"', "'", "# ", "\n", "\n", "return ", "12", " 0x1f", " ", "if ", "\\", "ab"]
+
+def random_text(rng, count):
+    return "".join(rng.choice(PIECES) for _ in range(count))
+
+def lex_all(lines):
+    # Tokens and end state of every line, lexed from the top
+    tokens, states = [], []
+    state = NORMAL
+    for line in lines:
+        line_tokens, state = lex_line(line, state)
+        tokens.append(line_tokens)
+        states.append(state)
+    return tokens, states
+
+def paint(painted, runs):
+    # What a widget's tags hold after apply_line_tags(runs)
+    for start, tokens in runs:
+        painted[start - 1:start - 1 + len(tokens)] = tokens
+
+def edit(rng, text):
+    # A random edit of text, as (new text, first line, old line count, new line count)
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.choice((0, 1, 4, 30)))
+    inserted = random_text(rng, rng.choice((0, 1, 1, 3, 12)))
+    first = text.count("\n", 0, start) + 1
+    removed = text[start:end]
+    return text[:start] + inserted + text[end:], first, removed.count("\n") + 1, inserted.count("\n") + 1
+
+@pytest.mark.parametrize("seed", range(6))
+def test_random_edits_match_lexing_everything(seed):
+    rng = random.Random(seed)
+    text = random_text(rng, 600)
+    lines = text.split("\n")
+    highlighter = IncrementalHighlighter()
+    painted = [None] * len(lines)
+    for _ in range(150):
+        text, first, old_count, new_count = edit(rng, text)
+        lines = text.split("\n")
+        highlighter.lines_changed(first, old_count, new_count)
+        painted[first - 1:first - 1 + old_count] = [None] * new_count
+        assert len(highlighter.dirty) <= MAX_DIRTY_RUNS
+        if rng.random() < 0.3:
+            continue  # edits pile up before the next update, as during a key burst
+        # A window around the edit, as the visible part of a widget
+        top = max(1, first - rng.randint(0, 20))
+        bottom = top + rng.randint(0, 40)
+        runs = highlighter.update(lambda n: lines[n - 1], len(lines), top, bottom)
+        paint(painted, runs)
+        tokens, states = lex_all(lines)
+        bottom = min(bottom, len(lines))
+        assert highlighter.states[:bottom] == states[:bottom]
+        assert painted[top - 1:bottom] == tokens[top - 1:bottom]
+    # The rest of the document is tagged once it scrolls into view
+    paint(painted, highlighter.update(lambda n: lines[n - 1], len(lines)))
+    assert (painted, highlighter.states) == lex_all(lines)
+    assert highlighter.dirty == []
+
+def test_scattered_edits_stay_few_runs():
+    lines = ["x = 1"] * 500
+    highlighter = IncrementalHighlighter()
+    highlighter.update(lambda n: lines[n - 1], len(lines))
+    for line in range(10, 500, 10):
+        highlighter.lines_changed(line, 1, 1)
+        assert len(highlighter.dirty) <= MAX_DIRTY_RUNS
+        assert all(any(start <= edited <= end for start, end in highlighter.dirty) for edited in range(10, line + 1, 10))
+    # Lines typed one after the other stay a single run
+    highlighter = IncrementalHighlighter()
+    highlighter.update(lambda n: lines[n - 1], len(lines))
+    for line in range(100, 120):
+        highlighter.lines_changed(line, 1, 2)
+    assert highlighter.dirty == [(100, 120)]
+
+def test_opening_a_string_relexes_until_the_state_converges():
+    lines = ["a = 1", "b = 2", "c = '''", "d = 4", "'''", "e = 5"]
+    highlighter = IncrementalHighlighter()
+    highlighter.update(lambda n: lines[n - 1], len(lines))
+    lines[0] = 'a = """'
+    highlighter.lines_changed(1, 1, 1)
+    runs = highlighter.update(lambda n: lines[n - 1], len(lines))
+    # Everything down to the end is inside a string now
+    assert [line for start, tokens in runs for line in range(start, start + len(tokens))] == [1, 2, 3, 4, 5, 6]
+    assert highlighter.states == lex_all(lines)[1] == ['"""'] * 6
+    # Only the edited line when its end state stays the same
+    lines[1] = "b = 3"
+    highlighter.lines_changed(2, 1, 1)
+    assert highlighter.update(lambda n: lines[n - 1], len(lines)) == [(2, [[("string", 0, 5)]])]
+
+def test_cancelled_update_leaves_the_original_alone():
+    lines = ['s = """'] + ["text"] * 3000 + ['"""', "x = 1"]
+    highlighter = IncrementalHighlighter()
+    clone = highlighter.copy()
+    calls = []
+    assert clone.update(lambda n: lines[n - 1], len(lines), cancelled=lambda: calls.append(1) or len(calls) > 1) is None
+    assert highlighter.states == [] and highlighter.dirty == [(1, 1)]
+    highlighter.update(lambda n: lines[n - 1], len(lines))
+    assert highlighter.states == lex_all(lines)[1]
+
+def test_window_below_the_edit_is_lexed_later():
+    lines = ["x = 1"] * 300
+    highlighter = IncrementalHighlighter()
+    highlighter.update(lambda n: lines[n - 1], len(lines), 1, 50)
+    assert highlighter.painted[:50] == [True] * 50 and not any(highlighter.painted[50:])
+    # Scrolling down paints the next window, lines above it are not touched again
+    runs = highlighter.update(lambda n: lines[n - 1], len(lines), 201, 250)
+    assert runs == [(201, [[("number", 4, 5)]] * 50)]
+    assert highlighter.update(lambda n: lines[n - 1], len(lines), 201, 250) == []
+
+class FakeText:
+    # The two things visible_lines asks a Text widget, showing lines 41 to 80
+    def index(self, spec):
+        return "41.0" if spec == "@0,0" else "80.3"
+
+    def winfo_height(self):
+        return 600
+
+def test_visible_lines_adds_the_margin():
+    assert visible_lines(FakeText(), margin=50) == (1, 130)
+    assert visible_lines(FakeText(), margin=10) == (31, 90)
+
+def covered(text, spans):
+    # Offsets of the characters in spans, newlines left out
+    return {offset for start, end in spans for offset in range(start, end) if text[offset] != "\n"}
+
+@pytest.mark.parametrize("seed", range(6))
+def test_document_tokens_match_line_tokens(seed):
+    rng = random.Random(seed)
+    text = random_text(rng, 400)
+    line_starts = [0]
+    for line in text.split("\n"):
+        line_starts.append(line_starts[-1] + len(line) + 1)
+    by_line = {tag: [] for tag in DOCUMENT_TAGS}
+    for number, line_tokens in enumerate(lex_all(text.split("\n"))[0]):
+        for tag, start, end in line_tokens:
+            by_line[tag].append((line_starts[number] + start, line_starts[number] + end))
+    ranges = tokenize(text)
+    for tag in DOCUMENT_TAGS:
+        assert covered(text, ranges[tag]) == covered(text, by_line[tag]), tag
+    # The same spans as "line.col" indices
+    indices = tag_ranges(text)
+    for tag in DOCUMENT_TAGS:
+        expected = []
+        for start, end in ranges[tag]:
+            for offset in (start, end):
+                line = text.count("\n", 0, offset) + 1
+                col = offset - text.rfind("\n", 0, offset) - 1
+                expected.append(f"{line}.{col}")
+        assert indices[tag] == expected
@@ -0,0 +1,79 @@
+# The journal survives a crash: intact records replay, a torn tail is dropped, and
+# compacting after a save keeps only the edits made since
+from journal import RECORD, EditJournal, file_stamp
+from rope import Change, Rope
+
+STAMP = (11, 22)
+
+def changes_of(journal):
+    return list(journal.records())
+
+def test_records_are_replayed_after_reopening(tmp_path):
+    path = str(tmp_path / "doc.journal")
+    journal = EditJournal(path, STAMP)
+    journal.append(Change(0, "", "héllo\n"))
+    journal.append(Change(6, "", "world"))
+    journal.append(Change(1, "é", "e"))
+    journal.close(remove=False)
+    journal = EditJournal(path, STAMP)
+    buffer = Rope()
+    assert journal.replay(buffer) == 3
+    assert buffer.get_text() == "hello\nworld"
+    journal.close()
+    assert not (tmp_path / "doc.journal").exists()
+
+def test_torn_record_is_dropped(tmp_path):
+    path = str(tmp_path / "doc.journal")
+    journal = EditJournal(path, STAMP)
+    journal.append(Change(0, "", "kept"))
+    journal.append(Change(4, "", " torn"))
+    journal.close(remove=False)
+    with open(path, "r+b") as f:
+        f.seek(-2, 2)
+        f.truncate()
+    journal = EditJournal(path, STAMP)
+    assert changes_of(journal) == [(0, 0, "kept")]
+    # The tail was cut off, new records go right after the intact ones
+    journal.append(Change(4, "", "!"))
+    journal.close(remove=False)
+    journal = EditJournal(path, STAMP)
+    assert changes_of(journal) == [(0, 0, "kept"), (4, 0, "!")]
+    journal.close()
+
+def test_other_stamp_starts_over(tmp_path):
+    path = str(tmp_path / "doc.journal")
+    journal = EditJournal(path, STAMP)
+    journal.append(Change(0, "", "stale"))
+    journal.close(remove=False)
+    journal = EditJournal(path, (11, 23))
+    assert changes_of(journal) == []
+    assert journal.position() == 0
+    journal.close()
+
+def test_compact_keeps_later_records(tmp_path):
+    document = tmp_path / "doc.txt"
+    document.write_text("saved")
+    path = str(tmp_path / "doc.journal")
+    journal = EditJournal(path, STAMP)
+    journal.append(Change(0, "", "a"))
+    journal.flush()  # one record on disk, the rest still pending
+    journal.append(Change(1, "", "b"))
+    position = journal.position()
+    journal.append(Change(2, "", "c"))
+    journal.append(Change(3, "", "d"))
+    tail = journal.tail(position)
+    assert len(tail) == 2 * (RECORD.size + 1)
+    journal.compact(file_stamp(str(document)), position)
+    journal.close(remove=False)
+    journal = EditJournal(path, file_stamp(str(document)))
+    assert changes_of(journal) == [(2, 0, "c"), (3, 0, "d")]
+    # The carried over records replay the same in another journal
+    other = EditJournal(str(tmp_path / "other.journal"))
+    other.append_raw(tail)
+    assert changes_of(other) == []  # not flushed yet
+    other.flush()
+    assert changes_of(other) == [(2, 0, "c"), (3, 0, "d")]
+    other.close()
+    journal.compact(STAMP)
+    assert changes_of(journal) == []
+    journal.close()
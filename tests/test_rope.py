@@ -0,0 +1,77 @@
+# The rope against a plain str given the same edits
+import random
+
+import pytest
+
+from rope import LEAF_SIZE, Change, Rope
+
+# Lines of about 25 characters, as in source code
+ALPHABET = "abcdefghij" * 2 + "  (." + "\n"
+
+def random_text(rng, length):
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+def check_lines(rope, text, step=7):
+    # Every step-th line through each of the line index lookups
+    lines = text.split("\n")
+    assert rope.line_count() == len(lines)
+    offset = 0
+    for number, line in enumerate(lines, 1):
+        if number % step == 1 or number == len(lines):
+            assert rope.line_start(number) == offset
+            assert rope.get_line(number) == line
+            assert rope.offset_to_linecol(offset + len(line)) == (number, len(line))
+            assert rope.linecol_to_offset(number, len(line)) == offset + len(line)
+        offset += len(line) + 1
+
+@pytest.mark.parametrize("seed", range(8))
+def test_random_edits_match_str(seed):
+    rng = random.Random(seed)
+    text = random_text(rng, rng.choice((0, 10, LEAF_SIZE * 3)))
+    rope = Rope(text)
+    for _ in range(200):
+        offset = rng.randint(0, len(text))
+        length = rng.randint(0, min(8, len(text) - offset))
+        inserted = random_text(rng, rng.choice((0, 1, 1, 5, LEAF_SIZE + 7)))
+        change = rope.splice(offset, length, inserted)
+        assert change == Change(offset, text[offset:offset + length], inserted)
+        text = text[:offset] + inserted + text[offset + length:]
+        assert len(rope) == len(text)
+        start = rng.randint(0, len(text))
+        end = rng.randint(start, len(text))
+        assert rope.get_range(start, end) == text[start:end]
+    assert rope.get_text() == text
+    assert "".join(rope.chunks()) == text
+    check_lines(rope, text)
+
+def test_from_chunks_matches_whole_text():
+    rng = random.Random(1)
+    chunks = [random_text(rng, rng.randint(0, LEAF_SIZE * 2)) for _ in range(20)]
+    rope = Rope.from_chunks(chunks)
+    assert rope.get_text() == "".join(chunks)
+    check_lines(rope, "".join(chunks))
+
+@pytest.mark.parametrize("seed", range(10))
+def test_apply_changes_is_one_change(seed):
+    # Changes are given as if the ones before them were made, the result undoes them all
+    rng = random.Random(seed)
+    text = random_text(rng, 500)
+    rope = Rope(text)
+    changes = []
+    expected = text
+    for _ in range(rng.randint(1, 6)):
+        offset = rng.randint(0, len(expected))
+        length = rng.randint(0, min(5, len(expected) - offset))
+        inserted = random_text(rng, rng.randint(0, 5))
+        changes.append(Change(offset, expected[offset:offset + length], inserted))
+        expected = expected[:offset] + inserted + expected[offset + length:]
+    combined = rope.apply_changes(changes)
+    assert rope.get_text() == expected
+    rope.splice(combined.offset, len(combined.inserted), combined.removed)
+    assert rope.get_text() == text
+
+def test_out_of_range_edits_are_clamped():
+    rope = Rope("abc")
+    assert rope.splice(10, 5, "d") == Change(3, "", "d")
+    assert rope.splice(-4, 1, "") == Change(0, "a", "")
+    assert rope.get_text() == "bcd"
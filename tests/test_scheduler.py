@@ -0,0 +1,111 @@
+# Results and errors of the background scheduler, with after() run by hand
+import threading
+import time
+
+import pytest
+
+from scheduler import BackgroundScheduler
+
+class FakeWidget:
+    # Keeps the after() callbacks for run() instead of an event loop
+    def __init__(self):
+        self.calls = {}
+        self.next_id = 0
+
+    def after(self, delay, callback):
+        self.next_id += 1
+        self.calls[self.next_id] = callback
+        return self.next_id
+
+    def after_cancel(self, call_id):
+        self.calls.pop(call_id, None)
+
+    def run(self, scheduler):
+        # Turn the event loop until no job is out any more
+        while self.calls or scheduler.outstanding:
+            calls, self.calls = self.calls, {}
+            for callback in calls.values():
+                callback()
+
+def test_only_the_newest_result_is_applied():
+    widget = FakeWidget()
+    scheduler = BackgroundScheduler(widget)
+    applied = []
+    for n in range(3):
+        scheduler.schedule("key", lambda n=n: n, lambda data, cancelled: data * 10, applied.append)
+    widget.run(scheduler)
+    assert applied == [20]
+
+def failing(data, cancelled):
+    raise ValueError(data)
+
+def test_current_errors_are_raised_on_the_tk_thread():
+    widget = FakeWidget()
+    scheduler = BackgroundScheduler(widget)
+    scheduler.schedule("key", lambda: "broken", failing, lambda result: None)
+    with pytest.raises(ValueError, match="broken"):
+        widget.run(scheduler)
+
+def test_errors_of_stale_jobs_are_dropped():
+    widget = FakeWidget()
+    scheduler = BackgroundScheduler(widget)
+    started = threading.Event()
+    release = threading.Event()
+    applied = []
+
+    def slow_failure(data, cancelled):
+        started.set()
+        release.wait()
+        raise ValueError("stale")
+    scheduler.schedule("key", lambda: None, slow_failure, applied.append)
+    while not started.is_set():
+        calls, widget.calls = widget.calls, {}
+        for callback in calls.values():
+            callback()
+    # A newer request comes in while the first one is running, then the first one fails
+    scheduler.schedule("key", lambda: 1, lambda data, cancelled: data, applied.append)
+    release.set()
+    widget.run(scheduler)
+    assert applied == [1]
+
+def test_stale_results_are_discarded():
+    widget = FakeWidget()
+    scheduler = BackgroundScheduler(widget)
+    discarded = []
+    applied = []
+    done = threading.Event()
+
+    def compute(data, cancelled):
+        done.set()
+        return data
+    scheduler.schedule("key", lambda: "old", compute, applied.append, discard=discarded.append)
+    while not scheduler.outstanding:
+        calls, widget.calls = widget.calls, {}
+        for callback in calls.values():
+            callback()
+    # Finished, and waiting for the next deliver() without the event loop turning
+    while not done.is_set() or scheduler.results.empty():
+        time.sleep(0.001)
+    # A newer request comes in before the result reaches the Tk thread
+    scheduler.schedule("key", lambda: "new", compute, applied.append, discard=discarded.append)
+    widget.run(scheduler)
+    assert applied == ["new"]
+    assert discarded == ["old"]
+    # Stale by the time it finishes, the worker discards it itself
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(data, cancelled):
+        started.set()
+        release.wait()
+        return data
+    scheduler.schedule("other", lambda: "slow", slow, applied.append, discard=discarded.append)
+    while not started.is_set():
+        calls, widget.calls = widget.calls, {}
+        for callback in calls.values():
+            callback()
+    scheduler.cancel("other")
+    release.set()
+    widget.run(scheduler)
+    assert discarded == ["old", "slow"]
+    assert applied == ["new"]
@@ -0,0 +1,90 @@
+# Search results kept up to date while editing must equal searching the text afresh
+import random
+from bisect import bisect_left, bisect_right
+
+import pytest
+
+from editorcore import EditorCore
+from rope import Rope
+from search import SearchIndex, ShiftedList, scan_ranges
+
+WORDS = ["cat", "concat", "Cat", "dog", "c\nat", "\n", " ", "ca", "t", "x.y"]
+
+def random_edit(rng, core):
+    start = rng.randint(0, len(core.buffer))
+    end = min(len(core.buffer), start + rng.choice((0, 0, 1, 3, 12)))
+    inserted = "".join(rng.choices(WORDS, k=rng.randint(0, 3)))
+    core.paste(inserted, start, end)
+
+def fresh(buffer, *args):
+    index = SearchIndex(*args)
+    return index.scan(buffer)
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("options", [("cat",), ("cat", False, True), ("cat", False, False, True), ("x.y",)], ids=str)
+def test_matches_follow_edits(seed, options):
+    rng = random.Random(seed)
+    core = EditorCore()
+    core.paste("".join(rng.choices(WORDS, k=200)))
+    core.search_word(*options)
+    for _ in range(60):
+        random_edit(rng, core)
+        assert (list(core.search.starts), list(core.search.ends)) == fresh(core.buffer, *options)
+
+def test_regex_lines_are_searched_again_in_the_background():
+    rng = random.Random(7)
+    core = EditorCore()
+    core.paste("".join(rng.choices(WORDS, k=300)))
+    index = core.start_search("c[ao]n?[ct]", regex=True)
+    index.add(*index.scan(core.buffer))
+    index.complete = True
+    for _ in range(30):
+        random_edit(rng, core)
+    assert index.dirty
+    found = scan_ranges((index, index.dirty_slices(core.buffer)), lambda: False)
+    index.fill(found)
+    assert index.dirty == []
+    assert (list(index.starts), list(index.ends)) == index.scan(core.buffer)
+
+def test_mark_dirty_merges_and_shifts():
+    index = SearchIndex("a")
+    index.mark_dirty(10, 20, 0)
+    index.mark_dirty(40, 50, 0)
+    # Five characters inserted into 15..20 shift the range below and touch the first one
+    index.mark_dirty(15, 25, 5)
+    assert index.dirty == [(10, 25), (45, 55)]
+    index.mark_dirty(0, 2, -3)
+    assert index.dirty == [(0, 2), (7, 22), (42, 52)]
+
+def test_unfinished_search_is_left_alone():
+    core = EditorCore()
+    core.paste("cat cat")
+    index = core.start_search("cat")
+    index.add([0], [3])
+    core.paste("dog ", 0, 0)
+    # Still searching the old text, which starts over instead of being patched
+    assert list(index.starts) == [0]
+    assert fresh(Rope(core.buffer.get_text()), "cat") == ([4, 8], [7, 11])
+
+def test_shifted_list_matches_shifting_a_list():
+    rng = random.Random(5)
+    values = sorted(rng.sample(range(1000), 100))
+    shifted = ShiftedList(values)
+    for _ in range(500):
+        i = rng.randint(0, len(values))
+        j = min(len(values), i + rng.choice((0, 0, 1, 3)))
+        # Values stay sorted: the new ones fit between their neighbours, the tail never
+        # moves past them
+        low = values[i - 1] + 1 if i else 0
+        delta = rng.randint(min(0, low - values[j]) + 1, 3) if j < len(values) else 0
+        high = values[j] + delta if j < len(values) else low + 10
+        new = sorted(rng.sample(range(low, high), min(high - low, rng.randint(0, 2))))
+        shifted.splice(i, j, new, delta)
+        values[i:] = new + [value + delta for value in values[j:]]
+        assert list(shifted) == values
+        assert shifted[-1:] == values[-1:]
+        probe = rng.randint(-5, 1100)
+        assert shifted.bisect_left(probe) == bisect_left(values, probe)
+        assert shifted.bisect_right(probe) == bisect_right(values, probe)
+    shifted.extend([values[-1] + 1, values[-1] + 2])
+    assert list(shifted) == values + [values[-1] + 1, values[-1] + 2]
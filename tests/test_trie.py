@@ -0,0 +1,82 @@
+# Ranking and removal in both autocomplete backends
+import random
+
+import pytest
+
+from radixtrie import RadixTrie
+from trie import Trie
+
+BACKENDS = [Trie, RadixTrie]
+
+@pytest.fixture(params=BACKENDS, ids=lambda cls: cls.__name__)
+def trie(request):
+    return request.param()
+
+def test_ranked_by_count_then_recency(trie):
+    for word in ("print", "private", "property", "print", "process"):
+        trie.insert(word)
+    # print was used twice, of the words used once process was used last
+    assert trie.autocomplete("pr") == ["print", "process", "property", "private"]
+    assert trie.ranked("pri") == [(2, "print"), (1, "private")]
+    assert trie.autocomplete("pr", 2) == ["print", "process"]
+    assert trie.autocomplete("x") == []
+
+def test_count_zero_words_rank_last_and_stay(trie):
+    trie.insert("return", count=0)
+    trie.insert("result")
+    assert trie.autocomplete("re") == ["result", "return"]
+    trie.remove("return")
+    assert trie.autocomplete("re") == ["result", "return"]
+    trie.insert("return")
+    trie.remove("return")
+    assert trie.ranked("ret") == [(0, "return")]
+
+def test_remove_takes_back_uses(trie):
+    trie.insert("value", count=3)
+    trie.insert("values")
+    trie.remove("value", count=2)
+    assert trie.ranked("val") == [(1, "values"), (1, "value")]
+    trie.remove("value")
+    assert trie.autocomplete("val") == ["values"]
+    trie.remove("values")
+    assert trie.autocomplete("v") == []
+    trie.remove("missing")
+    trie.remove("val")  # a prefix of removed words only
+    assert trie.autocomplete("") == []
+
+def test_removing_a_word_keeps_its_neighbours(trie):
+    words = ["in", "index", "indexes", "inner", "input", "int"]
+    for count, word in enumerate(words, 1):
+        trie.insert(word, count)
+    trie.remove("index", count=2)
+    assert trie.autocomplete("in") == ["int", "input", "inner", "indexes", "in"]
+    trie.remove("indexes", count=4)
+    trie.insert("index")
+    assert trie.autocomplete("ind") == ["index"]
+
+def test_fuzzy_tolerates_typos(trie):
+    for word in ("return", "result", "retry", "elif"):
+        trie.insert(word)
+    # a swap of two neighbouring letters counts as one edit
+    assert trie.fuzzy("retrun") == [(1, 1, "return")]
+    assert trie.fuzzy("rseult") == [(1, 1, "result")]
+    assert trie.fuzzy("re", k=1) == [(0, 1, "retry")]
+    assert trie.fuzzy("zzzz") == []
+
+@pytest.mark.parametrize("seed", range(5))
+def test_backends_agree(seed):
+    rng = random.Random(seed)
+    tries = [cls() for cls in BACKENDS]
+    vocabulary = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 6))) for _ in range(60)]
+    for _ in range(300):
+        word = rng.choice(vocabulary)
+        count = rng.choice((0, 1, 1, 2))
+        remove = rng.random() < 0.3
+        for t in tries:
+            if remove:
+                t.remove(word, count or 1)
+            else:
+                t.insert(word, count)
+    for prefix in ("", "a", "ab", "bca", "cc", "abcab"):
+        assert tries[0].ranked(prefix, 8) == tries[1].ranked(prefix, 8)
+        assert tries[0].fuzzy(prefix, k=8) == tries[1].fuzzy(prefix, k=8)
@@ -0,0 +1,85 @@
+# Undo steps as the editor makes them: typing merges per word, backspacing merges
+# into the run it deletes from, transactions are one step, redo replays them
+from editorcore import EditorCore
+from rope import Change
+from undo import CHANGE_OVERHEAD, UndoStack
+
+def type_text(core, text):
+    for ch in text:
+        core.key({" ": "space", "\n": "Return"}.get(ch, ch), ch)
+
+def text(core):
+    return core.buffer.get_text()
+
+def test_typing_merges_per_word():
+    core = EditorCore()
+    type_text(core, "foo bar")
+    assert [entry[0].inserted for entry in core.undo_stack.stack] == ["foo ", "bar"]
+    core.undo()
+    assert text(core) == "foo "
+    assert core.cursor == 4
+    core.undo()
+    assert text(core) == ""
+    assert core.undo() is None
+    core.redo()
+    core.redo()
+    assert text(core) == "foo bar"
+    assert core.cursor == 7
+    assert core.redo() is None
+
+def test_backspacing_over_typing_shrinks_the_step():
+    core = EditorCore()
+    type_text(core, "hello")
+    core.key("BackSpace", "")
+    core.key("BackSpace", "")
+    assert list(core.undo_stack.stack) == [(Change(0, "", "hel"),)]
+    for _ in range(3):
+        core.key("BackSpace", "")
+    # Everything typed was deleted again, nothing is left to undo
+    assert not core.undo_stack.stack
+    assert core.undo_stack.size == 0
+
+def test_backspacing_further_left_is_one_step():
+    core = EditorCore()
+    core.paste("abc def")
+    for _ in range(3):
+        core.key("BackSpace", "")
+    assert text(core) == "abc "
+    assert len(core.undo_stack.stack) == 2
+    core.undo()
+    assert text(core) == "abc def"
+    core.undo()
+    assert text(core) == ""
+
+def test_replace_all_is_one_step():
+    core = EditorCore()
+    core.paste("one x two x\nthree x")
+    core.search_word("x")
+    core.replace_matches(0, len(core.search), "yy")
+    assert text(core) == "one yy two yy\nthree yy"
+    core.undo()
+    assert text(core) == "one x two x\nthree x"
+    core.redo()
+    assert text(core) == "one yy two yy\nthree yy"
+
+def test_new_edit_drops_redo():
+    core = EditorCore()
+    type_text(core, "a b")
+    core.undo()
+    core.paste("c")
+    assert core.redo() is None
+    assert text(core) == "a c"
+    stack = core.undo_stack
+    assert stack.size == sum(CHANGE_OVERHEAD + len(c.removed) + len(c.inserted) for entry in stack.stack for c in entry)
+
+def test_nested_transactions_and_limit():
+    stack = UndoStack(limit=3 * (CHANGE_OVERHEAD + 4))
+    with stack.transaction():
+        stack.record(Change(0, "", "ab"))
+        with stack.transaction():
+            stack.record(Change(2, "", "cd"))
+    assert list(stack.stack) == [(Change(0, "", "ab"), Change(2, "", "cd"))]
+    for i in range(3):
+        stack.record(Change(4 + i, "", "e"))
+    # The transaction no longer fits and was dropped as a whole
+    assert [entry[0].offset for entry in stack.stack] == [4, 5, 6]
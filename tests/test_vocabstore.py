@@ -0,0 +1,99 @@
+# The memory-mapped vocabulary against a plain dict of word counts
+import random
+from array import array
+from collections import Counter
+
+import pytest
+
+import vocabstore
+from vocabstore import BLOCK, HEADER, MAGIC, VocabularyIndex, write_index
+
+LETTERS = "abcé"
+
+def random_counts(rng, count):
+    # Words sharing long prefixes, with many equal counts and a few much used ones
+    words = Counter()
+    for _ in range(count):
+        word = "".join(rng.choice(LETTERS) for _ in range(rng.randint(1, 7)))
+        words[word] += rng.choice((1, 1, 1, 2, 3, 50))
+    return words
+
+def sorted_items(counts):
+    return sorted(counts.items(), key=lambda item: item[0].encode("utf-8"))
+
+def brute_autocomplete(counts, prefix, k):
+    # The k most used words starting with prefix, the first in sorted order among equal counts
+    items = [(word, count) for word, count in sorted_items(counts) if word.startswith(prefix)]
+    ranked = sorted(enumerate(items), key=lambda item: (-item[1][1], item[0]))
+    return [(count, word) for _, (word, count) in ranked[:k]]
+
+PREFIXES = ["", "a", "b", "é", "ab", "cé", "abc", "zz", "aaaa"]
+
+@pytest.mark.parametrize("seed", range(4))
+def test_autocomplete_matches_brute_force(seed, tmp_path):
+    rng = random.Random(seed)
+    counts = random_counts(rng, 6 * BLOCK)
+    path = str(tmp_path / "vocabulary")
+    write_index(path, sorted_items(counts))
+    index = VocabularyIndex(path)
+    assert len(index) == len(counts)
+    assert list(index.items()) == sorted_items(counts)
+    for prefix in PREFIXES:
+        for k in (1, 5, 40):
+            assert index.autocomplete(prefix, k) == brute_autocomplete(counts, prefix, k), (prefix, k)
+    assert index.autocomplete("a", 0) == []
+    index.close()
+
+def test_version_1_files_are_read(tmp_path):
+    # The layout before the block maxima were stored
+    counts = random_counts(random.Random(9), 3 * BLOCK)
+    items = sorted_items(counts)
+    path = str(tmp_path / "vocabulary")
+    words = [word.encode("utf-8") for word, _ in items]
+    offsets = array("Q", [0])
+    for word in words:
+        offsets.append(offsets[-1] + len(word))
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, len(items)))
+        offsets.tofile(f)
+        array("I", [count for _, count in items]).tofile(f)
+        f.writelines(words)
+    index = VocabularyIndex(path)
+    assert list(index.items()) == items
+    for prefix in PREFIXES:
+        assert index.autocomplete(prefix, 5) == brute_autocomplete(counts, prefix, 5)
+    # Merging writes the current version
+    index.merge(Counter({"new": 1}))
+    with open(path, "rb") as f:
+        assert HEADER.unpack(f.read(HEADER.size))[1] == vocabstore.VERSION
+    counts["new"] += 1
+    assert list(index.items()) == sorted_items(counts)
+    index.close()
+
+def test_merge_then_swap(tmp_path):
+    rng = random.Random(5)
+    path = str(tmp_path / "vocabulary")
+    index = VocabularyIndex(path)
+    assert len(index) == 0 and index.autocomplete("", 5) == []
+    expected = Counter()
+    for _ in range(3):
+        learned = random_counts(rng, BLOCK)
+        temp_path = index.write_merged(learned)
+        # Lookups still see the old words until the new file is swapped in
+        assert list(index.items()) == sorted_items(expected)
+        index.swap(temp_path)
+        expected += learned
+        assert list(index.items()) == sorted_items(expected)
+        for prefix in PREFIXES:
+            assert index.autocomplete(prefix, 5) == brute_autocomplete(expected, prefix, 5)
+    # A cancelled merge leaves neither the new file nor its temporary behind
+    assert index.write_merged(Counter({"gone": 1}), cancelled=lambda: True) is None
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["vocabulary"]
+    index.close()
+
+def test_path_is_read_when_opened(tmp_path, monkeypatch):
+    monkeypatch.setattr(vocabstore, "VOCAB_PATH", str(tmp_path / "elsewhere"))
+    index = VocabularyIndex()
+    index.merge(Counter({"word": 2}))
+    assert (tmp_path / "elsewhere").exists()
+    index.close()
@@ -0,0 +1,86 @@
+# The trie's word counts must always equal the words in the buffer
+import random
+from collections import Counter
+
+import pytest
+
+import editorcore
+from editorcore import EditorCore
+from rope import Rope
+from vocabulary import WORD_RE, word_end, word_start
+
+# Short pieces, so edits often split a word in two or join two words into one
+PIECES = ["ab", "a", "b", "_", "1", " ", "\n", ".", "(", "é"]
+
+def trie_counts(trie):
+    # Every word in the trie with its count, the keywords added with count 0 left out
+    counts = Counter()
+    stack = [(trie.root, "")]
+    while stack:
+        node, prefix = stack.pop()
+        if node.is_end and node.count:
+            counts[prefix] = node.count
+        stack.extend((child, prefix + ch) for ch, child in node.children.items())
+    return counts
+
+def buffer_counts(core):
+    return Counter(WORD_RE.findall(core.buffer.get_text()))
+
+def random_edit(rng, core):
+    kind = rng.random()
+    if kind < 0.4:
+        keysym = rng.choice(["a", "b", "space", "BackSpace", "Return", "period"])
+        core.cursor = rng.randint(0, len(core.buffer))
+        core.key(keysym, {"space": " ", "Return": "\r", "period": ".", "BackSpace": "\b"}.get(keysym, keysym))
+    elif kind < 0.8:
+        start = rng.randint(0, len(core.buffer))
+        end = min(len(core.buffer), start + rng.choice((0, 1, 2, 5, 40)))
+        core.paste("".join(rng.choices(PIECES, k=rng.randint(0, 6))), start, end)
+    elif kind < 0.9:
+        core.undo()
+    else:
+        core.redo()
+
+@pytest.mark.parametrize("seed", range(6))
+def test_counts_follow_edits_undo_and_redo(seed):
+    rng = random.Random(seed)
+    core = EditorCore()
+    for _ in range(400):
+        random_edit(rng, core)
+        assert trie_counts(core.trie) == buffer_counts(core)
+    # Undoing everything leaves no words behind
+    while core.undo():
+        pass
+    assert core.buffer.get_text() == ""
+    assert trie_counts(core.trie) == Counter()
+
+def test_deferred_counting_of_big_edits(monkeypatch):
+    # Edits over BACKGROUND_COUNT characters have their words counted through defer()
+    monkeypatch.setattr(editorcore, "BACKGROUND_COUNT", 10)
+    deferred = []
+    core = EditorCore()
+    core.defer = lambda compute, data, apply: deferred.append((compute, data, apply))
+    rng = random.Random(3)
+    for _ in range(100):
+        random_edit(rng, core)
+        # Deferred work comes back in order, possibly a few edits later
+        while deferred and rng.random() < 0.5:
+            compute, data, apply = deferred.pop(0)
+            apply(compute(data))
+    for compute, data, apply in deferred:
+        apply(compute(data))
+    assert trie_counts(core.trie) == buffer_counts(core)
+
+def test_loaded_text_is_counted():
+    core = EditorCore()
+    text = "def f(a_b):\n    return a_b + 1é\n"
+    core.reset(Rope(text))
+    core.tracker.add_text(text)
+    assert trie_counts(core.trie) == buffer_counts(core) == Counter({"a_b": 2, "def": 1, "f": 1, "return": 1, "1é": 1})
+
+def test_word_edges_cross_chunks():
+    rope = Rope("x " + "w" * 100 + " y")
+    assert word_start(rope, 60) == 2
+    assert word_end(rope, 60) == 102
+    assert word_start(rope, 2) == 2
+    assert word_end(rope, 1) == 1
@@ -0,0 +1,192 @@
+# Number of best completions cached in every trie node
+TOP_K = 10
+
+def max_edits(prefix):
+    # Typos tolerated by fuzzy completion, short prefixes would match almost anything.
+    # Never fewer for a longer prefix, typing on must not lose suggestions shown before.
+    if len(prefix) < 3:
+        return 0
+    return 1 if len(prefix) < 7 else 2
+
+class TrieNode:
+    __slots__ = ("children", "is_end", "count", "last_used", "top", "permanent")
+
+    def __init__(self):
+        self.children = {}
+        self.is_end = False
+        self.count = 0  # how many times the word ending here was used
+        self.last_used = 0  # value of the trie's clock at the last use
+        self.top = []  # best completions below this node as (count, last_used, word), best first
+        self.permanent = False  # added with count=0, stays in the vocabulary at count 0
+
+def _rank(entry):
+    count, last_used, word = entry
+    return -count, -last_used, word
+
+class Trie:
+    # Prefix tree that ranks completions by how often and how recently a word was used.
+    # Each node keeps its k best completions, so a lookup costs O(len(prefix) + k)
+    # no matter how many words share the prefix.
+    def __init__(self, k=TOP_K):
+        self.root = TrieNode()
+        self.k = k
+        self.clock = 0
+
+    def insert(self, word, count=1):
+        # Record count uses of word, count=0 only adds it to the vocabulary
+        if not word:
+            return
+        path = [self.root]
+        node = self.root
+        for ch in word:
+            node = node.children.setdefault(ch, TrieNode())
+            path.append(node)
+        node.is_end = True
+        if not count:
+            node.permanent = True
+        else:
+            self.clock += 1
+            node.count += count
+            node.last_used = self.clock
+        entry = (node.count, node.last_used, word)
+        for node in path:
+            self._offer(node, entry)
+
+    def remove(self, word, count=1):
+        # Take back count uses of word, it leaves the trie when none are left unless it is permanent
+        path = [self.root]
+        node = self.root
+        for ch in word:
+            node = node.children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        if not node.is_end or not node.count:
+            return
+        node.count = max(0, node.count - count)
+        if not node.count and not node.permanent:
+            node.is_end = False
+        # Rebuild the lists that held the word from the bottom up, a node whose list
+        # never had it cannot gain anything, and neither can the nodes above it
+        for depth in range(len(word), -1, -1):
+            node = path[depth]
+            if all(e[2] != word for e in node.top):
+                break
+            self._rebuild(node, word[:depth])
+        # Drop the branch that no longer leads to any word
+        for depth in range(len(word), 0, -1):
+            node = path[depth]
+            if node.is_end or node.children:
+                break
+            del path[depth - 1].children[word[depth - 1]]
+
+    def autocomplete(self, prefix, k=None):
+        # The k best completions of prefix, best first
+        return [word for _, word in self.ranked(prefix, k)]
+
+    def ranked(self, prefix, k=None):
+        # Like autocomplete, but as (count, word) pairs
+        node = self.root
+        for ch in prefix:
+            if ch not in node.children:
+                return []
+            node = node.children[ch]
+        return [(count, word) for count, _, word in node.top[:k or self.k]]
+
+    def fuzzy(self, prefix, max_distance=None, k=None):
+        # The k best completions of any prefix within max_distance edits of prefix, as
+        # (distance, count, word), closest first and then by rank. Edits are insertions,
+        # deletions, substitutions and swaps of two neighbouring characters.
+        if max_distance is None:
+            max_distance = max_edits(prefix)
+        k = k or self.k
+        # Closer matches rank first, so once k of them are found within a smaller budget
+        # the larger ones cannot change the result, and their much wider walk is skipped
+        for distance in range(max_distance + 1):
+            best = self._fuzzy_matches(prefix, distance)
+            if len(best) >= k:
+                break
+        ranked = sorted(best.items(), key=lambda item: (item[1][0], -item[1][1], -item[1][2], item[0]))
+        return [(distance, count, word) for word, (distance, count, _) in ranked[:k]]
+
+    def _fuzzy_matches(self, prefix, max_distance):
+        # word -> (distance, count, last_used) of the completions within max_distance.
+        # Walk the trie like a Levenshtein automaton: every node holds the row of edit
+        # distances between its path and each prefix of the input, and a branch is cut
+        # as soon as no entry in the row is within the budget. Only the entries at most
+        # max_distance away from the diagonal can be within it, the others are left at
+        # max_distance + 1, so a row costs O(max_distance) instead of O(len(prefix)).
+        # Children whose character the prefix does not have near the diagonal share one row.
+        best = {}
+        over = max_distance + 1
+        size = len(prefix) + 1
+        first = [min(j, over) for j in range(size)]
+        stack = [(self.root, first, None, "", 0)]
+        while stack:
+            node, row, above, ch, depth = stack.pop()
+            distance = row[-1]
+            if distance <= max_distance:
+                # Every word below matches, the cached top list holds the best of them
+                for count, last_used, word in node.top:
+                    if word not in best or distance < best[word][0]:
+                        best[word] = (distance, count, last_used)
+                if distance == 0:
+                    continue  # nothing below can come any closer
+            depth += 1
+            low = max(1, depth - max_distance)
+            high = min(size - 1, depth + max_distance)
+            edge = min(depth, over) if low == 1 else over
+            # A swap of two characters can only end in the columns where the prefix has ch
+            swaps = above is not None and ch in prefix[max(1, low - 1):high]
+            # A character the prefix does not have near the diagonal gives the same row in every child
+            window = prefix[max(0, low - 2):high]
+            bands = {}
+            for next_ch, child in node.children.items():
+                key = next_ch if next_ch in window else ""
+                if key not in bands:
+                    left = edge
+                    smallest = edge
+                    band = [edge]
+                    for j in range(low, high + 1):
+                        value = row[j - 1] if prefix[j - 1] == next_ch else row[j - 1] + 1
+                        if row[j] + 1 < value:
+                            value = row[j] + 1
+                        if left + 1 < value:
+                            value = left + 1
+                        if swaps and j > 1 and prefix[j - 1] == ch and prefix[j - 2] == next_ch and above[j - 2] + 1 < value:
+                            value = above[j - 2] + 1
+                        if value > over:
+                            value = over
+                        band.append(value)
+                        left = value
+                        if value < smallest:
+                            smallest = value
+                    next_row = None
+                    if smallest <= max_distance:
+                        next_row = [over] * size
+                        next_row[low - 1:high + 1] = band
+                        if low > 1:
+                            next_row[0] = min(depth, over)
+                    bands[key] = next_row
+                next_row = bands[key]
+                if next_row is not None:
+                    stack.append((child, next_row, row, next_ch, depth))
+        return best
+
+    def _rebuild(self, node, prefix):
+        # A node's best completions are its own word and the best of its children
+        top = [e for child in node.children.values() for e in child.top]
+        if node.is_end:
+            top.append((node.count, node.last_used, prefix))
+        top.sort(key=_rank)
+        del top[self.k:]
+        node.top = top
+
+    def _offer(self, node, entry):
+        # Scores only grow, so a word either keeps its place in the list or climbs into it
+        word = entry[2]
+        top = [e for e in node.top if e[2] != word]
+        top.append(entry)
+        top.sort(key=_rank)
+        del top[self.k:]
+        node.top = top
@@ -0,0 +1,131 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from rope import Change
+
+# Default memory cap of the undo history in bytes, and what one Change costs on top of its text
+UNDO_LIMIT = 16 * 2**20
+CHANGE_OVERHEAD = 64
+# Typing after a pause this long in seconds starts a new undo step
+PAUSE = 1.0
+
+def _cost(changes):
+    return sum(CHANGE_OVERHEAD + len(c.removed) + len(c.inserted) for c in changes)
+
+def _merge(last, change):
+    # One Change equal to last followed by change, or None if they are not one run of typing
+    if not last.removed and not change.removed and change.offset == last.offset + len(last.inserted):
+        # Typing on at the end of the run, a new word starts a new step
+        if change.inserted.isspace() or not last.inserted[-1:].isspace():
+            return Change(last.offset, "", last.inserted + change.inserted)
+    elif not last.inserted and not change.inserted and change.offset + len(change.removed) == last.offset:
+        # Backspacing further left
+        return Change(change.offset, change.removed + last.removed, "")
+    elif not last.removed and not change.inserted and change.offset + len(change.removed) == last.offset + len(last.inserted) \
+            and len(change.removed) <= len(last.inserted):
+        # Backspacing over what was just typed
+        return Change(last.offset, "", last.inserted[:len(last.inserted) - len(change.removed)])
+    return None
+
+class UndoStack:
+    # Undo history of buffer Changes. Every entry is a transaction, a tuple of the
+    # Changes it made in order. Typing and backspacing merge into one entry per word,
+    # edits made inside transaction() become one entry, and the oldest entries are
+    # dropped once the history holds more than limit bytes.
+    def __init__(self, limit=UNDO_LIMIT):
+        self.stack = deque()
+        self.redo_stack = []
+        self.limit = limit
+        self.size = 0  # bytes held by stack and redo_stack, as counted by _cost
+        self.group = None  # changes of the open transaction
+        self.depth = 0
+        self.typing = False  # whether the newest entry may still grow
+        self.last_time = 0
+
+    def record(self, change, typing=False):
+        # Add an edit that was just made, typing=True lets single keystrokes merge into runs
+        if not change.removed and not change.inserted:
+            return
+        if self.group is not None:
+            self.group.append(change)
+            return
+        self.clear_redo()
+        now = time.monotonic()
+        if typing and self.typing and self.stack and now - self.last_time < PAUSE:
+            last = self.stack[-1]
+            merged = _merge(last[0], change) if len(last) == 1 else None
+            if merged is not None:
+                self.size -= _cost(last)
+                if merged.removed or merged.inserted:
+                    self.stack[-1] = (merged,)
+                    self.size += _cost((merged,))
+                else:
+                    self.stack.pop()  # everything typed was backspaced again
+                    self.typing = False
+                self.last_time = now
+                return
+        self.push((change,))
+        self.typing = typing
+        self.last_time = now
+
+    @contextmanager
+    def transaction(self):
+        # Everything recorded inside the block is undone and redone as one step
+        if self.depth == 0:
+            self.group = []
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                group, self.group = self.group, None
+                if group:
+                    self.clear_redo()
+                    self.push(tuple(group))
+                    self.typing = False
+
+    def push(self, entry):
+        self.stack.append(entry)
+        self.size += _cost(entry)
+        self.evict()
+
+    def evict(self):
+        # Forget the oldest steps until the history fits in the memory cap again
+        while self.size > self.limit and self.stack:
+            self.size -= _cost(self.stack.popleft())
+
+    def undo(self):
+        # The newest transaction, its changes have to be reverted last to first
+        if not self.stack:
+            return None
+        entry = self.stack.pop()
+        self.redo_stack.append(entry)
+        self.typing = False
+        return entry
+
+    def redo(self):
+        # The most recently undone transaction, its changes have to be made again in order
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.stack.append(entry)
+        self.typing = False
+        self.evict()
+        return entry
+
+    def break_run(self):
+        # The next keystroke starts a new undo step, e.g. after the cursor was moved
+        self.typing = False
+
+    def clear_redo(self):
+        for entry in self.redo_stack:
+            self.size -= _cost(entry)
+        self.redo_stack.clear()
+
+    def clear(self):
+        self.stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
+        self.typing = False
@@ -0,0 +1,191 @@
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from itertools import chain
+
+# Learned vocabulary kept between sessions
+VOCAB_PATH = os.path.join(os.path.expanduser("~"), ".bestest_editor_vocabulary")
+
+# File layout, all numbers in native byte order:
+#   header   magic, version, word count
+#   offsets  word count + 1 unsigned 64 bit offsets of each word in the blob
+#   counts   word count unsigned 32 bit use counts
+#   maxima   the largest count of every BLOCK words in turn, unsigned 32 bit (since version 2)
+#   blob     the UTF-8 encoded words, sorted, back to back
+HEADER = struct.Struct("=4sII4x")
+MAGIC = b"BVOC"
+VERSION = 2
+# Words per block of the maxima, autocomplete skips the blocks that cannot hold a better word
+BLOCK = 256
+
+class VocabularyIndex:
+    # Read-only view of a vocabulary file through mmap. Opening it costs the same
+    # no matter how many words it holds, lookups binary search the sorted words
+    # without building any Python objects for the words they do not return.
+    def __init__(self, path=None):
+        self.path = path or VOCAB_PATH
+        self.file = None
+        self.map = None
+        self.size = 0
+        self.open()
+
+    def open(self):
+        self.size = 0
+        self.view = self.offsets = self.counts = self.maxima = None
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+            return
+        self.file = open(self.path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            self.close()
+            return
+        self.view = memoryview(self.map)
+        start = HEADER.size
+        self.offsets = self.view[start:start + 8 * (size + 1)].cast("Q")
+        start += 8 * (size + 1)
+        self.counts = self.view[start:start + 4 * size].cast("I")
+        start += 4 * size
+        if version == 1:
+            # Written before the maxima were stored, the next merge rewrites it with them
+            self.maxima = block_maxima(self.counts)
+        else:
+            blocks = (size + BLOCK - 1) // BLOCK
+            self.maxima = self.view[start:start + 4 * blocks].cast("I")
+            start += 4 * blocks
+        self.blob = start
+        self.size = size
+
+    def close(self):
+        if self.map is not None:
+            for view in (self.offsets, self.counts, self.maxima, self.view):
+                if isinstance(view, memoryview):
+                    view.release()
+            self.map.close()
+            self.file.close()
+        self.file = None
+        self.map = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def word_bytes(self, i):
+        return self.map[self.blob + self.offsets[i]:self.blob + self.offsets[i + 1]]
+
+    def lower_bound(self, key):
+        # Index of the first word that is not smaller than key (as UTF-8 bytes)
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def prefix_range(self, prefix):
+        key = prefix.encode("utf-8")
+        lo = self.lower_bound(key)
+        # Every word starting with key sorts before key followed by the largest byte
+        hi = self.lower_bound(key + b"\xff") if key else self.size
+        return lo, hi
+
+    def autocomplete(self, prefix, k=5):
+        # The k most used saved words starting with prefix, as (count, word) best first,
+        # the first in sorted order among equal counts
+        if not self.size or k < 1:
+            return []
+        lo, hi = self.prefix_range(prefix)
+        key = lambda i: (self.counts[i], -i)
+        # Words of the blocks only partly in the range are looked at one by one
+        inner_lo = min(hi, -(-lo // BLOCK) * BLOCK)
+        inner_hi = max(inner_lo, hi // BLOCK * BLOCK)
+        best = heapq.nlargest(k, chain(range(lo, inner_lo), range(inner_hi, hi)), key=key)
+        # The whole blocks are visited largest count first, until none can hold a better word,
+        # so a short prefix does not scan every word that starts with it
+        blocks = sorted(range(inner_lo // BLOCK, inner_hi // BLOCK), key=self.maxima.__getitem__, reverse=True)
+        for block in blocks:
+            if len(best) == k:
+                if self.maxima[block] < self.counts[best[-1]]:
+                    break
+                if (self.maxima[block], -block * BLOCK) < key(best[-1]):
+                    continue
+            best = heapq.nlargest(k, chain(best, range(block * BLOCK, (block + 1) * BLOCK)), key=key)
+        return [(self.counts[i], self.word_bytes(i).decode("utf-8")) for i in best]
+
+    def items(self):
+        # Every (word, count) pair in sorted order
+        for i in range(self.size):
+            yield self.word_bytes(i).decode("utf-8"), self.counts[i]
+
+    def merge(self, learned):
+        # Fold the words learned in this session into the file and map the new version
+        if learned:
+            self.swap(self.write_merged(learned))
+
+    def write_merged(self, learned, cancelled=None):
+        # Write the file merged with learned next to it and return the new file's path, None
+        # when cancelled() became true. It only reads the index, so it may run on a worker
+        # thread while lookups go on, swap() then maps the new file.
+        folder, name = os.path.split(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=folder)
+        os.close(fd)
+        try:
+            write_index(temp_path, merge_counts(self.items(), sorted(learned.items(), key=lambda item: item[0].encode("utf-8"))))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        if cancelled and cancelled():
+            os.remove(temp_path)
+            return None
+        return temp_path
+
+    def swap(self, temp_path):
+        # Replace the file with one written by write_merged() and map it
+        self.close()
+        os.replace(temp_path, self.path)
+        self.open()
+
+def merge_counts(old, new):
+    # Merge two sorted (word, count) streams, adding up the counts of words in both
+    old = iter(old)
+    new = iter(new)
+    a = next(old, None)
+    b = next(new, None)
+    while a or b:
+        if b is None or (a is not None and a[0].encode("utf-8") < b[0].encode("utf-8")):
+            yield a
+            a = next(old, None)
+        elif a is None or b[0].encode("utf-8") < a[0].encode("utf-8"):
+            yield b
+            b = next(new, None)
+        else:
+            yield a[0], a[1] + b[1]
+            a = next(old, None)
+            b = next(new, None)
+
+def block_maxima(counts):
+    return array("I", (max(counts[i:i + BLOCK]) for i in range(0, len(counts), BLOCK)))
+
+def write_index(path, items):
+    # Write sorted (word, count) pairs in the layout described above
+    offsets = array("Q", [0])
+    counts = array("I")
+    words = []
+    for word, count in items:
+        encoded = word.encode("utf-8")
+        words.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+        counts.append(min(count, 0xFFFFFFFF))
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(counts)))
+        offsets.tofile(f)
+        counts.tofile(f)
+        block_maxima(counts).tofile(f)
+        f.writelines(words)
+        f.flush()
+        os.fsync(f.fileno())
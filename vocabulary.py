@@ -0,0 +1,89 @@
+import re
+from collections import Counter
+
+WORD_RE = re.compile(r"\w+")
+LEADING_WORD_RE = re.compile(r"\w*")
+TRAILING_WORD_RE = re.compile(r"\w*\Z")
+
+# How many characters are read at a time when looking for the edge of a word
+STEP = 32
+# Loaded text past this many characters is not harvested, counting the millions of
+# words of a huge file would stall the editor for longer than the file takes to open
+HARVEST_LIMIT = 4 * 2**20
+# Edits spanning more characters than this have their words counted on a worker thread
+BACKGROUND_COUNT = 2**20
+
+def word_start(buffer, offset):
+    # Offset where the run of word characters ending at offset begins
+    start = offset
+    while start > 0:
+        chunk = buffer.get_range(max(0, start - STEP), start)
+        tail = TRAILING_WORD_RE.search(chunk).group()
+        start -= len(tail)
+        if len(tail) < len(chunk):
+            break
+    return start
+
+def word_end(buffer, offset):
+    # Offset where the run of word characters starting at offset ends
+    end = offset
+    while end < len(buffer):
+        chunk = buffer.get_range(end, end + STEP)
+        head = LEADING_WORD_RE.match(chunk).group()
+        end += len(head)
+        if len(head) < len(chunk):
+            break
+    return end
+
+def word_delta(before, after):
+    # How many more times each word occurs in after than in before. Replacing a word all
+    # over a file touches two entries of the trie this way, not every word of the file.
+    counts = Counter(WORD_RE.findall(after))
+    counts.subtract(WORD_RE.findall(before))
+    return counts
+
+class VocabularyTracker:
+    # Keeps the trie's word counts equal to the number of times each word occurs in
+    # the buffer. Only the words touching an edit are looked at: they are counted out
+    # as they were before the change and counted in as they are after it, so typing,
+    # deleting, undo and redo all cost O(word length) per keystroke.
+    def __init__(self, trie):
+        self.trie = trie
+        self.deferred = 0  # word deltas counted elsewhere that have not been applied yet
+
+    def add_text(self, text):
+        # Count the words of text that was loaded into the buffer, it must end between two words
+        for word in WORD_RE.findall(text):
+            self.trie.insert(word)
+
+    def changed(self, buffer, change):
+        # Call after change has been applied to buffer
+        self.apply(word_delta(*self.around(buffer, change)))
+
+    def defer(self, defer, buffer, change):
+        # Count the words of change through defer(), see EditorCore.defer. A count cannot go
+        # below zero in the trie, so deltas must be applied in order: while one is out the
+        # changes after it are deferred too, even small ones.
+        self.deferred += 1
+        defer(lambda texts: word_delta(*texts), self.around(buffer, change), self.apply_deferred)
+
+    def apply_deferred(self, counts):
+        self.deferred -= 1
+        self.apply(counts)
+
+    def around(self, buffer, change):
+        # The text around change cut at word boundaries, as it was before it and as it is now
+        end = change.offset + len(change.inserted)
+        left = word_start(buffer, change.offset)
+        right = word_end(buffer, end)
+        prefix = buffer.get_range(left, change.offset)
+        suffix = buffer.get_range(end, right)
+        return prefix + change.removed + suffix, prefix + change.inserted + suffix
+
+    def apply(self, counts):
+        # Add a word_delta() to the trie
+        for word, count in counts.items():
+            if count > 0:
+                self.trie.insert(word, count)
+            elif count < 0:
+                self.trie.remove(word, -count)